@@ -1,46 +1,45 @@
 import discord
 from discord.ext import commands
-import json
 import os
 from dotenv import load_dotenv
 import asyncio
-import aiohttp
 from typing import Dict, Any
+from dashboard import serialization
+from dashboard.ipc import get_ipc_client
 
 class BotConnection:
     def __init__(self):
         self.settings_file = 'guild_settings.json'
         self.activity_file = 'guild_activity.json'
         self.bot_token = os.getenv('DISCORD_TOKEN')
-        self.dashboard_url = os.getenv('DASHBOARD_URL', 'https://wispbot.site')
         self._settings_cache = {}
         self._activity_cache = {}
 
     def load_settings(self) -> Dict[str, Any]:
         """Load settings from JSON file"""
         try:
-            with open(self.settings_file, 'r') as f:
-                return json.load(f)
+            with open(self.settings_file, 'rb') as f:
+                return serialization.load(f)
         except FileNotFoundError:
             return {}
 
     def save_settings(self, settings: Dict[str, Any]):
         """Save settings to JSON file"""
-        with open(self.settings_file, 'w') as f:
-            json.dump(settings, f, indent=4)
+        with open(self.settings_file, 'wb') as f:
+            serialization.dump(settings, f)
 
     def load_activity(self) -> Dict[str, list]:
         """Load activity from JSON file"""
         try:
-            with open(self.activity_file, 'r') as f:
-                return json.load(f)
+            with open(self.activity_file, 'rb') as f:
+                return serialization.load(f)
         except FileNotFoundError:
             return {}
 
     def save_activity(self, activity: Dict[str, list]):
         """Save activity to JSON file"""
-        with open(self.activity_file, 'w') as f:
-            json.dump(activity, f, indent=4)
+        with open(self.activity_file, 'wb') as f:
+            serialization.dump(activity, f)
 
     def update_guild_settings(self, guild_id: str, settings: Dict[str, Any]):
         """Update settings for a specific guild"""
@@ -71,22 +70,14 @@ class BotConnection:
         self.save_activity(current_activity)
 
     async def notify_bot(self, guild_id: str, action: str, data: Dict[str, Any]):
-        """Notify the bot about dashboard changes"""
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    f"{self.dashboard_url}/api/bot/update",
-                    json={
-                        'guild_id': guild_id,
-                        'action': action,
-                        'data': data
-                    },
-                    headers={'Authorization': f'Bearer {self.bot_token}'}
-                ) as response:
-                    if response.status != 200:
-                        print(f"Failed to notify bot: {await response.text()}")
-            except Exception as e:
-                print(f"Error notifying bot: {e}")
+        """Notify the bot about dashboard changes over the local IPC socket"""
+        try:
+            sent = await asyncio.to_thread(get_ipc_client().notify, 'settings_changed',
+                                           {'guild_ids': [str(guild_id)], 'action': action})
+            if not sent:
+                print("Failed to notify bot: the bot's IPC socket is not reachable")
+        except Exception as e:
+            print(f"Error notifying bot: {e}")
 
     def increment_command_count(self, guild_id: str):
         """Increment command usage count for a guild"""
@@ -6,41 +6,30 @@ Contains the Flask web application and bot connection utilities.
 # This file makes the dashboard directory a Python package 
 
 from flask import Blueprint, render_template, redirect, url_for, session, request, jsonify
-import discord
-from discord.ext import commands
 import os
-from datetime import datetime
-import json
 
+# Importing the package (e.g. for dashboard.serialization) must not touch storage, so the
+# modules the views use are imported when the blueprint is registered
 dashboard = Blueprint('dashboard', __name__)
 
-# Store activity in memory (in production, use a database)
-activity_log = {}
+@dashboard.record_once
+def init_blueprint(state):
+    from .bot_connection import init_bot_connection
+    from .guild_state import get_guild_state
+    from .ipc import get_ipc_client
+    init_bot_connection()
+    # Keep guild snapshots current from the bot's events
+    get_guild_state().follow_bot(get_ipc_client())
 
-def get_discord_client():
-    intents = discord.Intents.default()
-    intents.message_content = True
-    intents.members = True
-    return discord.Client(intents=intents)
+def get_guild_state():
+    from .guild_state import get_guild_state
+    return get_guild_state()
 
-def get_bot():
-    intents = discord.Intents.default()
-    intents.message_content = True
-    intents.members = True
-    return commands.Bot(command_prefix='!', intents=intents)
-
-def log_activity(guild_id, action, data):
-    if guild_id not in activity_log:
-        activity_log[guild_id] = []
-    
-    activity_log[guild_id].append({
-        'timestamp': datetime.utcnow().isoformat(),
-        'action': action,
-        'data': data
-    })
-    
-    # Keep only last 50 activities
-    activity_log[guild_id] = activity_log[guild_id][-50:]
+def update_settings(guild_id, changes, action, data):
+    """Save changed settings, record the activity entry and refresh the guild's state"""
+    from .bot_connection import apply_settings_change
+    apply_settings_change(guild_id, changes, action, data)
+    get_guild_state().invalidate(guild_id)
 
 @dashboard.route('/')
 def index():
@@ -53,67 +42,46 @@ def select_server():
     if 'access_token' not in session:
         return redirect(url_for('auth.login'))
     
-    client = get_discord_client()
-    
-    try:
-        client.run(os.getenv('DISCORD_TOKEN'))
-    except Exception as e:
-        print(f"Error running client: {e}")
-        return "Error connecting to Discord", 500
-    
-    guilds = []
-    for guild in client.guilds:
-        member = guild.get_member(client.user.id)
-        if member and member.guild_permissions.administrator:
-            guilds.append({
-                'id': str(guild.id),
-                'name': guild.name,
-                'icon': guild.icon.key if guild.icon else None,
-                'owner': str(guild.owner_id) == str(client.user.id),
-                'permissions': str(member.guild_permissions.value)
-            })
+    bot_id = os.getenv('DISCORD_CLIENT_ID')
+    guilds = [
+        {
+            'id': guild['id'],
+            'name': guild['name'],
+            'icon': guild['icon'],
+            'owner': guild['owner_id'] == bot_id,
+            'permissions': guild['bot_permissions']
+        }
+        for guild in get_guild_state().administered_guilds()
+    ]
+    guilds.sort(key=lambda g: g['name'].lower())
     
     return render_template('select_server.html', 
                          guilds=guilds,
-                         client_id=os.getenv('DISCORD_CLIENT_ID'))
+                         client_id=bot_id)
 
 @dashboard.route('/dashboard/<guild_id>')
 def guild_dashboard(guild_id):
     if 'access_token' not in session:
         return redirect(url_for('auth.login'))
     
-    client = get_discord_client()
-    
-    try:
-        client.run(os.getenv('DISCORD_TOKEN'))
-    except Exception as e:
-        print(f"Error running client: {e}")
-        return "Error connecting to Discord", 500
-    
-    guild = client.get_guild(int(guild_id))
+    guild = get_guild_state().guild(guild_id)
     if not guild:
         return "Guild not found", 404
     
     # Get channels
-    channels = []
-    for channel in guild.channels:
-        if isinstance(channel, discord.TextChannel):
-            channels.append({
-                'id': str(channel.id),
-                'name': channel.name
-            })
-    
-    # Get settings from environment variables
+    channels = [{'id': channel['id'], 'name': channel['name']} for channel in guild['channels']]
+    
+    # Get settings from the shared settings storage
     settings = {
-        'prefix': os.getenv(f'PREFIX_{guild_id}', '!'),
-        'security_log_channel': os.getenv(f'LOG_CHANNEL_{guild_id}'),
-        'cogs': os.getenv(f'COGS_{guild_id}', '').split(',') if os.getenv(f'COGS_{guild_id}') else []
+        'prefix': guild['settings']['prefix'],
+        'security_log_channel': guild['settings']['log_channel'],
+        'cogs': guild['settings']['cogs']
     }
     
     return render_template('dashboard.html',
                          guild_id=guild_id,
-                         guild_name=guild.name,
-                         guild_icon_url=guild.icon.url if guild.icon else None,
+                         guild_name=guild['name'],
+                         guild_icon_url=f"https://cdn.discordapp.com/icons/{guild_id}/{guild['icon']}.png" if guild['icon'] else None,
                          channels=channels,
                          settings=settings)
 
@@ -128,11 +96,7 @@ def update_prefix(guild_id):
     if len(prefix) > 3:
         return jsonify({'success': False, 'error': 'Prefix must be 3 characters or less'}), 400
     
-    # Update prefix in environment variables
-    os.environ[f'PREFIX_{guild_id}'] = prefix
-    
-    # Log activity
-    log_activity(guild_id, 'prefix_update', {'prefix': prefix})
+    update_settings(guild_id, {'prefix': prefix, 'prefixes': [prefix]}, 'prefix_update', {'prefix': prefix})
     
     return jsonify({'success': True})
 
@@ -144,14 +108,7 @@ def update_log_channel(guild_id):
     data = request.get_json()
     channel_id = data.get('channel_id')
     
-    # Update log channel in environment variables
-    if channel_id:
-        os.environ[f'LOG_CHANNEL_{guild_id}'] = channel_id
-    else:
-        os.environ.pop(f'LOG_CHANNEL_{guild_id}', None)
-    
-    # Log activity
-    log_activity(guild_id, 'log_channel_update', {'channel_id': channel_id})
+    update_settings(guild_id, {'log_channel': channel_id or None}, 'log_channel_update', {'channel_id': channel_id})
     
     return jsonify({'success': True})
 
@@ -163,11 +120,7 @@ def update_cogs(guild_id):
     data = request.get_json()
     cogs = data.get('cogs', [])
     
-    # Update cogs in environment variables
-    os.environ[f'COGS_{guild_id}'] = ','.join(cogs)
-    
-    # Log activity
-    log_activity(guild_id, 'features_update', {'cogs': cogs})
+    update_settings(guild_id, {'cogs': cogs}, 'features_update', {'cogs': cogs})
     
     return jsonify({'success': True})
 
@@ -176,4 +129,10 @@ def get_activity(guild_id):
     if 'access_token' not in session:
         return jsonify({'success': False, 'error': 'Not authenticated'}), 401
     
-    return jsonify(activity_log.get(guild_id, [])) 
\ No newline at end of file
+    from .activity import get_activity_store, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    activity = get_activity_store().page(guild_id, before=request.args.get('before', type=int), limit=limit)
+    return jsonify({
+        'activity': activity,
+        'next_before': activity[-1]['id'] if len(activity) == limit else None
+    })
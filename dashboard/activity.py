@@ -0,0 +1,306 @@
+"""
+Guild activity history, kept out of the settings blobs.
+
+Entries are appended to their own SQLite table (dashboard/activity.db by
+default, or ACTIVITY_DB) and never rewritten, so history isn't capped and
+reading settings no longer deserializes it. Each process keeps the newest
+ACTIVITY_BUFFER_SIZE entries per guild in a fixed-size ring buffer. A
+read only asks the table for entries newer than the buffer's newest one
+(an index lookup that usually finds nothing) and answers the first page of
+/api/guild/<id>/activity from the buffer; older pages are read from the
+table with an id cursor. Writes top the buffer up and insert inside one
+write transaction, so another process's rows can't land in between and
+be skipped.
+
+The bot's per-command entries go through ``queue()``: they are kept in
+memory and a writer thread inserts them in one transaction every
+ACTIVITY_FLUSH_INTERVAL seconds, or sooner once ACTIVITY_FLUSH_THRESHOLD
+are waiting. Queued entries show up in reads after that write.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from .storage import get_storage
+from . import serialization
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class ActivityStore:
+    """Append-only activity log with per-guild ring buffers in front of it"""
+
+    def __init__(self, path: str, buffer_size: Optional[int] = None, timeout: float = 30.0,
+                 flush_interval: Optional[float] = None, flush_threshold: Optional[int] = None):
+        self.path = path
+        self.buffer_size = buffer_size or int(os.getenv('ACTIVITY_BUFFER_SIZE', str(DEFAULT_PAGE_SIZE)))
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '1'))
+        self.flush_threshold = flush_threshold or int(os.getenv('ACTIVITY_FLUSH_THRESHOLD', '100'))
+        self._buffers = {}  # guild_id -> deque of entries, oldest first
+        self._lock = threading.Lock()
+
+        self._queued = []  # (guild_id, entry) waiting for the writer thread
+        self._queue_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS activity ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'guild_id TEXT NOT NULL, '
+            'created_at REAL NOT NULL, '
+            'entry TEXT NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS activity_guild ON activity (guild_id, id)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta ('
+            'key TEXT PRIMARY KEY, '
+            'value TEXT NOT NULL)'
+        )
+
+    @staticmethod
+    def _entry(row_id: int, entry: str) -> Dict[str, Any]:
+        return dict(serialization.loads(entry), id=row_id)
+
+    def _insert(self, guild_id: str, entry: Dict[str, Any]) -> int:
+        cursor = self._conn.execute(
+            'INSERT INTO activity (guild_id, created_at, entry) VALUES (?, ?, ?)',
+            (guild_id, time.time(), serialization.dumps(entry))
+        )
+        return cursor.lastrowid
+
+    def _buffer(self, guild_id: str) -> deque:
+        """Get a guild's ring buffer, topped up with entries other processes wrote"""
+        buffer = self._buffers.get(guild_id)
+        if buffer is None:
+            rows = self._conn.execute(
+                'SELECT id, entry FROM activity WHERE guild_id = ? ORDER BY id DESC LIMIT ?',
+                (guild_id, self.buffer_size)
+            ).fetchall()
+            buffer = deque((self._entry(*row) for row in reversed(rows)), maxlen=self.buffer_size)
+            self._buffers[guild_id] = buffer
+            return buffer
+
+        newest = buffer[-1]['id'] if buffer else 0
+        rows = self._conn.execute(
+            'SELECT id, entry FROM activity WHERE guild_id = ? AND id > ? ORDER BY id DESC LIMIT ?',
+            (guild_id, newest, self.buffer_size)
+        ).fetchall()
+        if len(rows) == self.buffer_size:
+            buffer.clear()  # fell too far behind, the rows are the new window
+        buffer.extend(self._entry(*row) for row in reversed(rows))
+        return buffer
+
+    @staticmethod
+    def _new_entry(action: str, data: Dict[str, Any], timestamp: Optional[str]) -> Dict[str, Any]:
+        return {
+            'timestamp': timestamp or datetime.now(timezone.utc).isoformat(),
+            'action': action,
+            'data': data
+        }
+
+    def record(self, guild_id: str, action: str, data: Dict[str, Any],
+               timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Append an activity entry for a guild and return it"""
+        return self.append(str(guild_id), self._new_entry(action, data, timestamp))
+
+    def queue(self, guild_id: str, action: str, data: Dict[str, Any],
+              timestamp: Optional[str] = None) -> None:
+        """Queue an activity entry for the writer thread's next batch"""
+        entry = self._new_entry(action, data, timestamp)
+        with self._queue_lock:
+            self._queued.append((str(guild_id), entry))
+            if len(self._queued) >= self.flush_threshold:
+                self._wake.set()
+
+    def flush(self) -> int:
+        """Write every queued entry in one transaction and return how many were written"""
+        with self._queue_lock:
+            queued, self._queued = self._queued, []
+        if not queued:
+            return 0
+        with self._lock:
+            touched = set()
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                for guild_id, entry in queued:
+                    buffer = None
+                    if guild_id in self._buffers:
+                        # Catch the buffer up first so its ids stay in order
+                        buffer = self._buffer(guild_id)
+                        touched.add(guild_id)
+                    row_id = self._insert(guild_id, entry)
+                    if buffer is not None:
+                        buffer.append(dict(entry, id=row_id))
+                self._conn.execute('COMMIT')
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                # These may hold rolled back rows; they are reloaded on the next read
+                for guild_id in touched:
+                    self._buffers.pop(guild_id, None)
+                with self._queue_lock:
+                    self._queued[:0] = queued
+                logger.error("Error writing queued activity: %s", e)
+                return 0
+        return len(queued)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self) -> None:
+        """Start the background writer for queued entries"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the writer thread and write anything still queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def append(self, guild_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Append an already built activity entry for a guild"""
+        guild_id = str(guild_id)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Catch the buffer up first so its ids stay in order
+                buffer = self._buffer(guild_id)
+                entry = dict(entry, id=self._insert(guild_id, entry))
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            buffer.append(entry)
+            return entry
+
+    def page(self, guild_id: str, before: Optional[int] = None,
+             limit: int = DEFAULT_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Get up to ``limit`` entries older than the ``before`` id, newest first"""
+        guild_id = str(guild_id)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            buffer = self._buffer(guild_id)
+            entries = [e for e in reversed(buffer) if before is None or e['id'] < before][:limit]
+            # The buffer answers unless the page runs past its oldest entry
+            if len(entries) == limit or len(buffer) < self.buffer_size:
+                return entries
+
+            last_id = entries[-1]['id'] if entries else before
+            query = 'SELECT id, entry FROM activity WHERE guild_id = ?'
+            params = [guild_id]
+            if last_id is not None:
+                query += ' AND id < ?'
+                params.append(last_id)
+            rows = self._conn.execute(query + ' ORDER BY id DESC LIMIT ?',
+                                      params + [limit - len(entries)]).fetchall()
+            return entries + [self._entry(*row) for row in rows]
+
+    def latest_id(self) -> int:
+        """Get the id of the newest entry of any guild"""
+        with self._lock:
+            return self._conn.execute('SELECT MAX(id) FROM activity').fetchone()[0] or 0
+
+    def entries_between(self, after_id: int, up_to_id: int,
+                        guild_ids: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Get (guild ID, entry) for some guilds' entries with ids in (after_id, up_to_id], oldest first"""
+        if not guild_ids:
+            return []
+        placeholders = ', '.join('?' * len(guild_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT id, guild_id, entry FROM activity WHERE id > ? AND id <= ? '
+                f'AND guild_id IN ({placeholders}) ORDER BY id',
+                [after_id, up_to_id] + [str(guild_id) for guild_id in guild_ids]
+            ).fetchall()
+        return [(guild_id, self._entry(row_id, entry)) for row_id, guild_id, entry in rows]
+
+    def migrate_from_settings(self, storage) -> int:
+        """Move the old 'activity' lists out of the guild settings, once.
+
+        Entries are committed to the activity table before they are cleared
+        from the settings, so an interrupted migration can't lose history.
+        Each guild is cleared with a single ``update``, which leaves
+        ``activity`` as null. Returns the number of entries imported.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = 'settings_migrated'").fetchone():
+                    self._conn.execute('COMMIT')
+                    return 0
+
+                migrated = []
+                imported = 0
+                for guild_id, settings in storage.all().items():
+                    if 'activity' not in settings:
+                        continue
+                    # Old lists are newest first
+                    for entry in reversed(settings['activity'] or []):
+                        self._insert(guild_id, entry)
+                        imported += 1
+                    migrated.append(guild_id)
+
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('settings_migrated', ?)",
+                    (str(time.time()),)
+                )
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            self._buffers.clear()
+
+        for guild_id in migrated:
+            storage.update(guild_id, {'activity': None})
+        return imported
+
+    def close(self) -> None:
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_activity_store() -> ActivityStore:
+    """Get the process-wide activity store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = ActivityStore(os.getenv('ACTIVITY_DB', os.path.join(DASHBOARD_DIR, 'activity.db')))
+                imported = store.migrate_from_settings(get_storage())
+                if imported:
+                    logger.info("Moved %s activity entries out of the guild settings", imported)
+                _store = store
+    return _store
@@ -1,13 +1,14 @@
 from flask import Flask, render_template, redirect, url_for, request, session, jsonify
+from flask.json.provider import DefaultJSONProvider
 import os
 from dotenv import load_dotenv
-import requests
 from functools import wraps
 import json
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 import traceback
-import sys
+import hashlib
+import time
 from .bot_connection import (
     get_guild_settings, 
     update_guild_settings, 
@@ -15,42 +16,113 @@ from .bot_connection import (
     store_guild_info, 
     get_file_path,
     sync_with_bot,
-    get_bot_settings,
-    get_bot_channels
+    get_bot_channels,
+    apply_settings_change,
+    init_bot_connection
 )
+from .storage import get_storage
+from .counters import counters
+from .activity import get_activity_store, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from . import serialization
+from .discord_api import discord_api
+from .guild_info import guild_info
+from .concurrency import gather
+from .ratelimit import get_rate_limiter
+from .caching import TTLCache
+from .stats import get_global_stats
+from .responses import finalize_json_response
+from .events import event_bus, format_sse
+from .live import get_live_updates
+from .logs import setup_logging, payload
+from .ipc import get_ipc_client, IPCError
+from .sessions import init_sessions, session_user, store_tokens, cached_guilds, store_guilds
 import asyncio
 import datetime
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger('dashboard')
+# Configure logging (levels and format come from LOG_* variables)
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+# Settings file and cache invalidation for settings changed by the bot
+init_bot_connection()
+
 # Get the full path for a file in the dashboard directory
 def get_file_path(filename):
     base_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_dir, filename)
 
+class FastJSONProvider(DefaultJSONProvider):
+    """Send jsonify responses through the shared compact encoder"""
+
+    def dumps(self, obj, **kwargs):
+        return serialization.dumps(obj, default=self.default)
+
+    def loads(self, s, **kwargs):
+        return serialization.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serialization.dumpb(obj, default=self.default) + b'\n',
+                                         mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key')
 
+# Sessions live server-side; the cookie only holds a signed session ID
+init_sessions(app)
+
 # Configure Flask for proxy
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 app.config['PREFERRED_URL_SCHEME'] = 'https'
 
+@app.after_request
+def finalize_api_response(response):
+    # ETags, 304s and compression for JSON API responses
+    if request.path.startswith('/api/'):
+        return finalize_json_response(response, request)
+    return response
+
 # Discord OAuth2 settings
 DISCORD_CLIENT_ID = os.getenv('DISCORD_CLIENT_ID')
 DISCORD_CLIENT_SECRET = os.getenv('DISCORD_CLIENT_SECRET')
 DISCORD_REDIRECT_URI = os.getenv('DISCORD_REDIRECT_URI', 'https://wispbot.site/callback')
-DISCORD_API_ENDPOINT = 'https://discord.com/api/v10'
+
+def get_access_token():
+    """Get the session's access token, refreshing it once it has expired"""
+    token = session.get('access_token')
+    if token and session.get('expires_at') and session['expires_at'] - 60 < time.time():
+        discord_api.forget_token(token)
+        tokens = refresh_discord_token(session['refresh_token']) if session.get('refresh_token') else None
+        if not tokens:
+            return None
+        store_tokens(session, tokens)
+        token = tokens['access_token']
+    return token
+
+def save_user_guilds(guilds):
+    """Cache a fresh guild list in the session and keep the guilds' info for later"""
+    guilds = store_guilds(session, guilds)
+    for guild in guilds:
+        store_guild_info(guild['id'], guild)
+    return [dict(guild) for guild in guilds]
+
+def get_user_guilds():
+    """Get (status code, guilds) for the guilds the logged in user can manage"""
+    guilds = cached_guilds(session)
+    if guilds is not None:
+        return 200, [dict(guild) for guild in guilds]
+    
+    access_token = get_access_token()
+    if not access_token:
+        return 401, None
+    status, guilds = discord_api.get_user_guilds(access_token)
+    if status != 200:
+        return status, None
+    return 200, save_user_guilds(guilds)
 
 def login_required(f):
     @wraps(f)
@@ -60,6 +132,20 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def guild_access_required(f):
+    """Only let users manage guilds they own or administer (after login_required)"""
+    @wraps(f)
+    def decorated_function(guild_id, *args, **kwargs):
+        status, guilds = get_user_guilds()
+        if status == 401:
+            return jsonify({'error': 'Not authenticated'}), 401
+        if status != 200:
+            return jsonify({'error': 'Could not verify access to this server'}), 503
+        if not any(guild['id'] == str(guild_id) for guild in guilds):
+            return jsonify({'error': 'You do not have permission to manage this server'}), 403
+        return f(guild_id, *args, **kwargs)
+    return decorated_function
+
 @app.route('/')
 def index():
     if 'user' in session:
@@ -87,7 +173,7 @@ def login():
     # Build the full OAuth URL with all required scopes
     oauth_url = f'https://discord.com/api/oauth2/authorize?client_id={DISCORD_CLIENT_ID}&redirect_uri={redirect_uri}&response_type=code&scope={scopes_param}'
     
-    logger.info(f"Redirecting to Discord OAuth: {oauth_url}")
+    logger.debug("Redirecting to Discord OAuth: %s", oauth_url)
     return redirect(oauth_url)
 
 @app.route('/callback')
@@ -111,24 +197,31 @@ def callback():
         'Content-Type': 'application/x-www-form-urlencoded'
     }
     
-    response = requests.post(f'{DISCORD_API_ENDPOINT}/oauth2/token', data=data, headers=headers)
+    response = discord_api.post('oauth2/token', data=data, headers=headers)
     if response.status_code != 200:
         return redirect(url_for('index'))
     
     tokens = response.json()
-    session['access_token'] = tokens['access_token']
-    
-    # Get user data
-    headers = {
-        'Authorization': f'Bearer {tokens["access_token"]}'
-    }
+    access_token = tokens['access_token']
+    session.clear()
+    store_tokens(session, tokens)
     
-    response = requests.get(f'{DISCORD_API_ENDPOINT}/users/@me', headers=headers)
+    # Get user data; we always redirect to the server list, which needs the guild list,
+    # so fetch that at the same time and keep it in the session
+    response, guilds_result = gather(
+        lambda: discord_api.get('users/@me', token=access_token),
+        lambda: discord_api.get_user_guilds(access_token),
+        return_exceptions=True
+    )
+    if isinstance(response, Exception):
+        logger.error("Error fetching user data: %s", response)
+        return redirect(url_for('index'))
     if response.status_code != 200:
         return redirect(url_for('index'))
     
-    user_data = response.json()
-    session['user'] = user_data
+    session['user'] = session_user(response.json())
+    if not isinstance(guilds_result, Exception) and guilds_result[0] == 200:
+        save_user_guilds(guilds_result[1])
     
     return redirect(url_for('select_server'))
 
@@ -141,51 +234,38 @@ def select_server():
     
     discord_guilds = []
     
-    # Try getting guilds from Discord first
+    # Try the session's guild list first, then Discord
     try:
-        headers = {
-            'Authorization': f'Bearer {session["access_token"]}'
-        }
-        
-        response = requests.get(f'{DISCORD_API_ENDPOINT}/users/@me/guilds', headers=headers)
-        if response.status_code == 401:
+        status, user_guilds = get_user_guilds()
+        if status == 401:
             logger.warning("Access token expired, redirecting to login")
             session.clear()
             return redirect(url_for('login'))
             
-        if response.status_code == 200:
-            discord_guilds = response.json()
-            logger.info(f"Got {len(discord_guilds)} guilds from Discord API")
-            
-            # Store discord guild data for future use
-            for guild in discord_guilds:
-                store_guild_info(guild['id'], guild)
+        if status == 200:
+            discord_guilds = user_guilds
+            logger.debug("Got %d guilds for the session", len(discord_guilds))
         else:
-            logger.error(f"Failed to fetch guilds from Discord API: {response.status_code}")
+            logger.error("Failed to fetch guilds from Discord API: %s", status)
     except Exception as e:
-        logger.error(f"Error fetching Discord guilds: {e}")
+        logger.error("Error fetching Discord guilds: %s", e)
     
-    # Get any guilds we have stored locally in settings.json
+    # Get any guilds we have stored locally
     stored_guilds = []
     try:
-        settings_file = get_file_path('settings.json')
-        if os.path.exists(settings_file):
-            with open(settings_file, 'r') as f:
-                all_settings = json.load(f)
-                
-                for guild_id, settings in all_settings.items():
-                    if 'name' in settings:  # Only include guilds with names
-                        stored_guilds.append({
-                            'id': guild_id,
-                            'name': settings.get('name', 'Unknown Server'),
-                            'icon': settings.get('icon'),
-                            'member_count': settings.get('member_count', 0)
-                        })
+        for guild_id, settings in get_storage().summaries().items():
+            if 'name' in settings:  # Only include guilds with names
+                stored_guilds.append({
+                    'id': guild_id,
+                    'name': settings.get('name', 'Unknown Server'),
+                    'icon': settings.get('icon'),
+                    'member_count': settings.get('member_count', 0)
+                })
         
         if stored_guilds:
-            logger.info(f"Got {len(stored_guilds)} guilds from local storage")
+            logger.debug("Got %d guilds from local storage", len(stored_guilds))
     except Exception as e:
-        logger.error(f"Error getting stored guilds: {e}")
+        logger.error("Error getting stored guilds: %s", e)
     
     # Combine guilds from Discord and stored settings
     if discord_guilds:
@@ -199,12 +279,12 @@ def select_server():
         for stored_guild in stored_guilds:
             if stored_guild['id'] not in guild_map:
                 guilds.append(stored_guild)
-                logger.info(f"Added stored guild: {stored_guild['name']}")
+                logger.debug("Added stored guild: %s", stored_guild['name'])
     else:
         # If Discord API failed, just use stored guilds
         guilds = stored_guilds
     
-    logger.info(f"Showing {len(guilds)} guilds total")
+    logger.debug("Showing %d guilds total", len(guilds))
     
     # Sort guilds by name
     guilds.sort(key=lambda g: g.get('name', 'Unknown').lower())
@@ -223,34 +303,46 @@ def dashboard():
         logger.warning("No access token in session, redirecting to login")
         return redirect(url_for('login'))
     
-    # Verify user has access to this guild
-    try:
-        headers = {
-            'Authorization': f'Bearer {session["access_token"]}'
-        }
-        
-        response = requests.get(f'{DISCORD_API_ENDPOINT}/users/@me/guilds', headers=headers)
-        if response.status_code == 401:
-            logger.warning("Access token expired, redirecting to login")
-            # Clear the session and redirect to login
-            session.clear()
-            return redirect(url_for('login'))
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch user guilds: {response.status_code}")
-            guilds = []
-        else:
-            guilds = response.json()
-    except Exception as e:
-        logger.error(f"Error verifying user guild access: {e}")
-        guilds = []
+    access_token = get_access_token()
+    if not access_token:
+        logger.warning("Access token expired, redirecting to login")
+        session.clear()
+        return redirect(url_for('login'))
     
-    # Check if user has access to this guild (if we got guild data from Discord)
-    has_access = any(g['id'] == guild_id for g in guilds) if guilds else True
+    # Verify user has access to this guild (usually answered from the session's guild
+    # list) while looking up the guild's info
+    guilds = cached_guilds(session)
+    if guilds is not None:
+        info = guild_info.get(guild_id, access_token)
+    else:
+        user_guilds_result, info = gather(
+            lambda: discord_api.get_user_guilds(access_token),
+            lambda: guild_info.get(guild_id, access_token),
+            return_exceptions=True
+        )
+        try:
+            if isinstance(user_guilds_result, Exception):
+                raise user_guilds_result
+            status, user_guilds = user_guilds_result
+            if status == 401:
+                logger.warning("Access token expired, redirecting to login")
+                # Clear the session and redirect to login
+                session.clear()
+                return redirect(url_for('login'))
+            
+            if status != 200:
+                logger.error("Failed to fetch user guilds: %s", status)
+            else:
+                guilds = save_user_guilds(user_guilds)
+        except Exception as e:
+            logger.error("Error verifying user guild access: %s", e)
+    
+    # Check if user can manage this guild (if we got the guild list from Discord)
+    has_access = guilds is None or any(g['id'] == guild_id for g in guilds)
     
     # If user doesn't have access, redirect
     if not has_access:
-        logger.warning(f"User doesn't have access to guild {guild_id}, redirecting")
+        logger.warning("User doesn't have access to guild %s, redirecting", guild_id)
         return redirect(url_for('select_server'))
     
     # Get guild data from our local settings
@@ -258,24 +350,13 @@ def dashboard():
     guild_name = guild_data.get('name', 'Unknown Server')
     guild_icon = guild_data.get('icon')
     
-    # If we have an access token, try to update our local data from Discord
-    if 'access_token' in session:
-        try:
-            # Try to get guild data from Discord API
-            guild_response = requests.get(f'{DISCORD_API_ENDPOINT}/guilds/{guild_id}', headers=headers)
-            
-            if guild_response.status_code == 200:
-                discord_guild_data = guild_response.json()
-                # Update our local storage with this fresh data
-                store_guild_info(guild_id, discord_guild_data)
-                
-                # Update our vars for the template
-                guild_name = discord_guild_data.get('name', guild_name)
-                guild_icon = discord_guild_data.get('icon', guild_icon)
-                logger.info(f"Updated guild info from Discord: {guild_name}")
-        except Exception as e:
-            logger.error(f"Error fetching guild data from Discord: {e}")
-            # Continue with local data if Discord API fails
+    # Use cached guild info from Discord; stale data is refreshed in the background
+    if isinstance(info, Exception):
+        logger.error("Error fetching guild data from Discord: %s", info)
+        # Continue with local data if Discord API fails
+    elif info:
+        guild_name = info.get('name') or guild_name
+        guild_icon = info.get('icon') or guild_icon
     
     # Build the icon URL
     if guild_icon:
@@ -295,98 +376,44 @@ def dashboard():
 @app.route('/api/guilds')
 @login_required
 def get_guilds():
-    headers = {
-        'Authorization': f'Bearer {session["access_token"]}'
-    }
-    
-    response = requests.get(f'{DISCORD_API_ENDPOINT}/users/@me/guilds', headers=headers)
-    if response.status_code != 200:
+    status, guilds = get_user_guilds()
+    if status != 200:
         return jsonify({'error': 'Failed to fetch guilds'}), 500
     
-    return jsonify(response.json())
+    return jsonify(guilds)
 
 @app.route('/api/guild/<guild_id>')
 @login_required
 def get_guild(guild_id):
-    logger.info(f"Getting guild {guild_id}")
+    logger.debug("Getting guild %s", guild_id)
     try:
-        # First try to get data from remote bot
-        remote_settings = {}
+        result = get_combined_guild_data(guild_id)
+        
+        # Fill in guild information from Discord, served from the cache when we have it
         try:
-            remote_settings = get_bot_settings(guild_id)
-            if remote_settings:
-                logger.info(f"Got settings from remote bot for guild {guild_id}")
-                
-                # Save to local storage for future reference
-                update_guild_settings(guild_id, remote_settings)
+            info = guild_info.get(guild_id, session.get('access_token'))
+            if info:
+                for key, field in (('name', 'name'), ('icon', 'icon'), ('owner_id', 'owner_id'),
+                                   ('member_count', 'approximate_member_count')):
+                    if info.get(field):
+                        result[key] = info[field]
+                result['presence_count'] = info.get('approximate_presence_count')
         except Exception as e:
-            logger.error(f"Error fetching settings from remote bot: {e}")
-        
-        # Fall back to local storage if needed
-        result = get_combined_guild_data(guild_id)
+            logger.error("Error getting detailed guild data: %s", e)
+            logger.error(traceback.format_exc())
         
-        # Try to get guild information from Discord API to update our local data
-        if 'access_token' in session:
-            headers = {
-                'Authorization': f'Bearer {session["access_token"]}'
-            }
-            
-            # Try different Discord API endpoints to get the most data
-            logger.debug(f"Fetching guild data from Discord API")
-            
-            # Try to get extended guild info with special guilds.members.read scope
-            try:
-                logger.debug(f"Fetching detailed guild data with members.read scope")
-                # First try with special endpoint that returns member count
-                detailed_guild_response = requests.get(
-                    f'{DISCORD_API_ENDPOINT}/guilds/{guild_id}?with_counts=true', 
-                    headers=headers
-                )
-                
-                if detailed_guild_response.status_code == 200:
-                    guild_data = detailed_guild_response.json()
-                    logger.info(f"Got detailed guild data: {guild_data}")
-                    
-                    # Log specific fields we're interested in
-                    member_count = guild_data.get('approximate_member_count', 0)
-                    if member_count:
-                        logger.info(f"Found approximate_member_count: {member_count}")
-                    presence_count = guild_data.get('approximate_presence_count', 0)
-                    if presence_count:
-                        logger.info(f"Found approximate_presence_count: {presence_count}")
-                    
-                    # Store this detailed data
-                    store_guild_info(guild_id, guild_data)
-                    
-                    # Get updated result with the fresh data
-                    result = get_combined_guild_data(guild_id)
-                    logger.info(f"Updated result has member_count: {result.get('member_count', 0)}")
-                else:
-                    logger.warning(f"Could not get detailed guild data: {detailed_guild_response.status_code}")
-                    logger.debug(f"Response body: {detailed_guild_response.text}")
-                    
-                    # Fall back to regular guild info endpoint
-                    guilds_response = requests.get(f'{DISCORD_API_ENDPOINT}/users/@me/guilds', headers=headers)
-                    if guilds_response.status_code == 200:
-                        user_guilds = guilds_response.json()
-                        # Find the specific guild in the user's guilds
-                        matching_guild = next((g for g in user_guilds if g['id'] == guild_id), None)
-                        if matching_guild:
-                            logger.info(f"Found guild in user's guilds: {matching_guild}")
-                            # Try to see if we can get member count here
-                            if 'approximate_member_count' in matching_guild:
-                                logger.info(f"Found member count in guild data: {matching_guild['approximate_member_count']}")
-                            
-                            store_guild_info(guild_id, matching_guild)
-                            result = get_combined_guild_data(guild_id)
-            except Exception as e:
-                logger.error(f"Error getting detailed guild data: {e}")
-                logger.error(traceback.format_exc())
+        # The running bot knows the exact member count
+        try:
+            live = get_ipc_client().request('guild', {'guild_id': guild_id})
+            if live and live.get('member_count'):
+                result['member_count'] = live['member_count']
+        except IPCError as e:
+            logger.debug("Bot state unavailable for guild %s: %s", guild_id, e)
         
-        logger.info(f"Returning guild data: {result['name']} (Member count: {result.get('member_count', 0)})")
+        logger.debug("Returning guild data: %s", payload(result))
         return jsonify(result)
     except Exception as e:
-        logger.error(f"Unhandled error in get_guild: {e}")
+        logger.error("Unhandled error in get_guild: %s", e)
         logger.error(traceback.format_exc())
         # Return a basic fallback response that won't cause errors in the frontend
         return jsonify({
@@ -417,31 +444,22 @@ def save_session(session_data):
 def get_guild_settings_endpoint(guild_id):
     """Get settings for a guild"""
     try:
-        # Get settings from our local storage
-        settings = get_guild_settings(guild_id)
+        # Get settings from our local storage, with this process's pending counts
+        settings = counters.apply_pending(guild_id, get_guild_settings(guild_id))
         
-        # Get detailed guild data from Discord API
+        # Get guild data from Discord, served from the cache when we have it
         try:
-            current_session = get_session()
-            if current_session and 'access_token' in current_session:
-                headers = {
-                    'Authorization': f'Bearer {current_session["access_token"]}'
-                }
-                response = requests.get(f'{DISCORD_API_ENDPOINT}/guilds/{guild_id}', headers=headers)
-                if response.status_code == 200:
-                    guild_data = response.json()
-                    settings['guild_name'] = guild_data.get('name')
-                    settings['guild_icon'] = guild_data.get('icon')
-                    settings['member_count'] = guild_data.get('approximate_member_count', 0)
-                else:
-                    logger.warning(f"Could not get detailed guild data: {response.status_code}")
-                    logger.debug(f"Response body: {response.text}")
+            info = guild_info.get(guild_id, get_session().get('access_token'))
+            if info:
+                settings['guild_name'] = info.get('name')
+                settings['guild_icon'] = info.get('icon')
+                settings['member_count'] = info.get('approximate_member_count') or 0
         except Exception as e:
-            logger.error(f"Error getting guild data: {e}")
+            logger.error("Error getting guild data: %s", e)
         
         # Get channels for security log dropdown
-        channels = get_guild_channels(guild_id)
-        settings['channels'] = channels
+        settings.pop('cached_channels', None)
+        settings['channels'] = get_guild_channels(guild_id)
         
         # Ensure all required settings exist with defaults
         defaults = {
@@ -459,13 +477,103 @@ def get_guild_settings_endpoint(guild_id):
             if key not in settings:
                 settings[key] = default_value
         
-        logger.info(f"Returning guild data: {settings.get('guild_name')} (Member count: {settings.get('member_count', 0)})")
+        logger.debug("Returning guild settings: %s", payload(settings))
         return jsonify(settings)
     except Exception as e:
-        logger.error(f"Error getting guild settings: {e}")
+        logger.error("Error getting guild settings: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/guild/<guild_id>/bundle')
+@login_required
+@guild_access_required
+def get_guild_bundle(guild_id):
+    """Everything the dashboard page needs for a guild, in one response"""
+    try:
+        # One settings read (usually from memory) answers everything but activity
+        settings = counters.apply_pending(guild_id, get_guild_settings(guild_id))
+        
+        try:
+            info = guild_info.get(guild_id, session.get('access_token'), settings=settings) or {}
+        except Exception as e:
+            logger.error("Error getting guild data: %s", e)
+            info = {}
+        
+        activity = get_activity_store().page(guild_id, limit=DEFAULT_PAGE_SIZE)
+        
+        return jsonify({
+            'guild': {
+                'id': guild_id,
+                'name': info.get('name') or settings.get('name', 'Unknown Server'),
+                'icon': info.get('icon') or settings.get('icon'),
+                'owner_id': info.get('owner_id') or settings.get('owner_id'),
+                'member_count': info.get('approximate_member_count') or settings.get('member_count', 0),
+                'presence_count': info.get('approximate_presence_count')
+            },
+            'settings': {
+                'prefix': settings.get('prefix', '?'),
+                'cogs': settings.get('cogs', ['image', 'security']),
+                'log_channel': settings.get('log_channel'),
+                'security_log_channel': settings.get('security_log_channel'),
+                'command_count': settings.get('command_count', 0),
+                'mod_actions': settings.get('mod_actions', 0)
+            },
+            'channels': settings.get('cached_channels', []),
+            'activity': {
+                'activity': activity,
+                'next_before': activity[-1]['id'] if len(activity) == DEFAULT_PAGE_SIZE else None
+            }
+        })
+    except Exception as e:
+        logger.error("Error getting guild bundle: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+# Seconds between keep-alive comments on idle event streams
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+# Seconds before a stream ends and the browser reconnects, so no stream holds a worker thread indefinitely
+SSE_MAX_AGE = float(os.getenv('SSE_MAX_AGE', '300'))
+# Events every stream gets; others (counters) only when asked for with ?events=
+SSE_DEFAULT_EVENTS = ('activity', 'settings', 'resync')
+
+@app.route('/api/guild/<guild_id>/events')
+@login_required
+@guild_access_required
+def guild_events(guild_id):
+    """Stream activity, counter and settings changes for a guild as server-sent events"""
+    live = get_live_updates()
+    extra = [name for name in request.args.get('events', '').split(',') if name]
+    subscription = event_bus.subscribe(guild_id, events=SSE_DEFAULT_EVENTS + tuple(extra))
+    try:
+        live.watch(guild_id)
+    except Exception as e:
+        event_bus.unsubscribe(subscription)
+        logger.error("Error opening event stream: %s", e)
+        return jsonify({'error': str(e)}), 500
+    
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            idle = 0.0
+            deadline = time.monotonic() + SSE_MAX_AGE
+            while time.monotonic() < deadline:
+                # Wake up at least once per poll interval to pick up the bot's changes
+                events = subscription.get(timeout=live.interval)
+                live.poll()
+                for event in events:
+                    yield format_sse(event)
+                idle = 0.0 if events else idle + live.interval
+                if idle >= SSE_HEARTBEAT:
+                    idle = 0.0
+                    yield ': keep-alive\n\n'
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    response = app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let nginx hold events back
+    return response
+
 @app.route('/api/guild/<guild_id>/settings', methods=['POST'])
 @login_required
 def update_settings(guild_id):
@@ -481,7 +589,72 @@ def update_settings(guild_id):
         
         return jsonify({'success': True})
     except Exception as e:
-        print(f"Error updating settings: {e}")
+        logger.error("Error updating settings: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+# Modules the dashboard can switch on and off
+AVAILABLE_COGS = ('image', 'security')
+SETTINGS_FIELDS = ('prefix', 'cogs', 'log_channel')
+
+def validate_settings_patch(data):
+    """Check a settings PATCH body and return the normalized fields, or raise ValueError"""
+    if not isinstance(data, dict) or not data:
+        raise ValueError('No data provided')
+    unknown = set(data) - set(SETTINGS_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    
+    fields = {}
+    if 'prefix' in data:
+        prefix = data['prefix']
+        if not isinstance(prefix, str) or not prefix.strip() or len(prefix) > 3:
+            raise ValueError('Prefix must be 1 to 3 characters')
+        fields['prefix'] = prefix
+    if 'cogs' in data:
+        cogs = data['cogs']
+        if not isinstance(cogs, list) or any(cog not in AVAILABLE_COGS for cog in cogs):
+            raise ValueError(f"Modules must be a list of: {', '.join(AVAILABLE_COGS)}")
+        fields['cogs'] = list(dict.fromkeys(cogs))
+    if 'log_channel' in data:
+        channel_id = data['log_channel'] or None
+        if channel_id is not None and not str(channel_id).isdigit():
+            raise ValueError('Log channel must be a channel ID')
+        fields['log_channel'] = str(channel_id) if channel_id is not None else None
+    return fields
+
+@app.route('/api/guild/<guild_id>/settings', methods=['PATCH'])
+@login_required
+@guild_access_required
+def patch_settings(guild_id):
+    """Change any of prefix, cogs and log_channel with one write and one activity entry"""
+    try:
+        fields = validate_settings_patch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # Only fields that actually change are written and recorded
+        current = get_guild_settings(guild_id)
+        changed = {key: value for key, value in fields.items() if current.get(key) != value}
+        if not changed:
+            return jsonify({'success': True, 'changed': [], 'settings': {key: current.get(key) for key in SETTINGS_FIELDS}})
+        
+        changes = dict(changed)
+        if 'prefix' in changed:
+            changes['prefixes'] = [changed['prefix']]
+        settings = apply_settings_change(guild_id, changes, 'settings_update', changed)
+        if not settings:
+            return jsonify({'error': 'Failed to update settings'}), 500
+        
+        logger.info("Guild %s settings updated: %s", guild_id, ', '.join(changed))
+        return jsonify({
+            'success': True,
+            'changed': list(changed),
+            'settings': {key: settings.get(key) for key in SETTINGS_FIELDS}
+        })
+    except Exception as e:
+        logger.error("Error updating settings: %s", e)
+        logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/guild/<guild_id>/prefix', methods=['POST'])
@@ -494,39 +667,13 @@ def update_guild_prefix(guild_id):
         if len(prefix) > 3:
             return jsonify({'error': 'Prefix must be 3 characters or less'}), 400
         
-        # Get current settings from our local storage
-        settings = get_guild_settings(guild_id)
-        
-        # Update prefix locally
-        settings['prefix'] = prefix
-        update_guild_settings(guild_id, settings)
+        # Update prefix locally and record the change in one write
+        apply_settings_change(guild_id, {'prefix': prefix, 'prefixes': [prefix]}, 'prefix_update', {'prefix': prefix})
         
-        # Update bot's prefix cache
-        try:
-            from main import bot
-            if hasattr(bot, 'settings_cache'):
-                bot.settings_cache[guild_id] = {'prefix': prefix}
-                print(f"Updated bot's prefix cache for guild {guild_id} to: {prefix}")
-        except Exception as e:
-            print(f"Error updating bot's prefix cache: {e}")
-        
-        # Add activity entry to our local record
-        timestamp = datetime.datetime.now().isoformat()
-        if 'activity' not in settings:
-            settings['activity'] = []
-        
-        settings['activity'].insert(0, {
-            'timestamp': timestamp,
-            'action': 'prefix_update',
-            'data': {'prefix': prefix}
-        })
-        settings['activity'] = settings['activity'][:50]  # Keep only last 50
-        update_guild_settings(guild_id, settings)
-            
-        logger.info(f"Guild {guild_id} prefix updated to: {prefix}")
+        logger.info("Guild %s prefix updated to: %s", guild_id, prefix)
         return jsonify({'success': True, 'prefix': prefix})
     except Exception as e:
-        logger.error(f"Error updating prefix: {e}")
+        logger.error("Error updating prefix: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
@@ -537,30 +684,13 @@ def update_guild_cogs(guild_id):
         data = request.get_json()
         cogs = data.get('cogs', [])
         
-        # Get current settings from local storage
-        settings = get_guild_settings(guild_id)
-        
-        # Update cogs locally
-        settings['cogs'] = cogs
-        update_guild_settings(guild_id, settings)
-        
-        # Add activity entry to our local record
-        timestamp = datetime.datetime.now().isoformat()
-        if 'activity' not in settings:
-            settings['activity'] = []
+        # Update cogs locally and record the change in one write
+        apply_settings_change(guild_id, {'cogs': cogs}, 'features_update', {'cogs': cogs})
         
-        settings['activity'].insert(0, {
-            'timestamp': timestamp,
-            'action': 'features_update',
-            'data': {'cogs': cogs}
-        })
-        settings['activity'] = settings['activity'][:50]  # Keep only last 50
-        update_guild_settings(guild_id, settings)
-            
-        logger.info(f"Guild {guild_id} cogs updated to: {cogs}")
+        logger.info("Guild %s cogs updated to: %s", guild_id, cogs)
         return jsonify({'success': True, 'cogs': cogs})
     except Exception as e:
-        logger.error(f"Error updating cogs: {e}")
+        logger.error("Error updating cogs: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
@@ -571,65 +701,31 @@ def update_guild_log_channel(guild_id):
         data = request.get_json()
         channel_id = data.get('channel_id')
         
-        # Get current settings from local storage
-        settings = get_guild_settings(guild_id)
-        
-        # Update log channel locally
-        settings['log_channel'] = channel_id
-        update_guild_settings(guild_id, settings)
+        # Update log channel locally and record the change in one write
+        apply_settings_change(guild_id, {'log_channel': channel_id}, 'log_channel_update', {'channel_id': channel_id})
         
-        # Add activity entry to our local record
-        timestamp = datetime.datetime.now().isoformat()
-        if 'activity' not in settings:
-            settings['activity'] = []
-        
-        settings['activity'].insert(0, {
-            'timestamp': timestamp,
-            'action': 'log_channel_update',
-            'data': {'channel_id': channel_id}
-        })
-        settings['activity'] = settings['activity'][:50]  # Keep only last 50
-        update_guild_settings(guild_id, settings)
-            
-        logger.info(f"Guild {guild_id} log channel updated to: {channel_id}")
+        logger.info("Guild %s log channel updated to: %s", guild_id, channel_id)
         return jsonify({'success': True, 'log_channel': channel_id})
     except Exception as e:
-        logger.error(f"Error updating log channel: {e}")
+        logger.error("Error updating log channel: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+# Stats are the same for every visitor, so browsers and proxies may share them
+STATS_MAX_AGE = int(os.getenv('STATS_MAX_AGE', '30'))
+stats_cache = TTLCache(float(os.getenv('STATS_CACHE_SECONDS', '5')), max_entries=1)
+
+def _load_stats_body():
+    """Encode the current totals and tag them"""
+    body = serialization.dumpb(get_global_stats().totals())
+    return body, hashlib.sha1(body).hexdigest()
+
 @app.route('/api/stats')
 def get_bot_stats():
-    # Get stats from all guilds
     try:
-        total_servers = 0
-        total_commands = 0
-        total_mod_actions = 0
-        total_users = 0
-        
-        # Load all settings
-        try:
-            settings_file = get_file_path('settings.json')
-            with open(settings_file, 'r') as f:
-                all_settings = json.load(f)
-                total_servers = len(all_settings)
-                
-                for guild_id, settings in all_settings.items():
-                    total_commands += settings.get('command_count', 0)
-                    total_mod_actions += settings.get('mod_actions', 0)
-                    total_users += settings.get('member_count', 0)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.error(f"Error loading settings file: {e}")
-            pass
-        
-        return jsonify({
-            'servers': total_servers,
-            'commands': total_commands,
-            'modActions': total_mod_actions,
-            'users': total_users
-        })
+        body, etag = stats_cache.get_or_load('stats', _load_stats_body)
     except Exception as e:
-        logger.error(f"Error getting stats: {e}")
+        logger.error("Error getting stats: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({
             'servers': 0,
@@ -637,77 +733,52 @@ def get_bot_stats():
             'modActions': 0,
             'users': 0
         })
+    
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = STATS_MAX_AGE
+    # Answers If-None-Match with a 304 and no body
+    return response.make_conditional(request)
+
+@app.route('/api/metrics/discord')
+@login_required
+def get_discord_metrics():
+    """Rate limit bucket utilization and throttling counters for Discord API calls"""
+    try:
+        return jsonify(get_rate_limiter().metrics())
+    except Exception as e:
+        logger.error("Error getting Discord metrics: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bot/status')
+@login_required
+def get_bot_status():
+    """Whether the bot is connected, its gateway latency and guild count"""
+    try:
+        return jsonify(get_ipc_client().request('status'))
+    except IPCError as e:
+        return jsonify({'error': str(e)}), 503
 
 @app.route('/logout')
 def logout():
+    discord_api.forget_token(session.get('access_token'))
     session.clear()
     return redirect(url_for('index'))
 
 @app.route('/api/guild/<guild_id>/channels')
 @login_required
 def get_guild_channels(guild_id):
-    """Get channels for a guild"""
+    """Get text channels for a guild from the snapshot the bot keeps up to date"""
     try:
-        # Get the current session
-        current_session = get_session()
-        if not current_session:
-            logger.warning("No active session found")
-            return []
-        
-        # Get the access token from the session
-        token = current_session.get('access_token')
-        if not token:
-            logger.warning("No access token found in session")
-            return []
-        
-        # Make the API request
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get(
-            f'https://discord.com/api/v10/guilds/{guild_id}/channels',
-            headers=headers
-        )
-        
-        if response.status_code == 401:
-            # Token might be expired, try to refresh it
-            try:
-                refresh_token = current_session.get('refresh_token')
-                if refresh_token:
-                    new_token = refresh_discord_token(refresh_token)
-                    if new_token:
-                        # Update session with new token
-                        current_session['access_token'] = new_token
-                        save_session(current_session)
-                        
-                        # Retry the request with new token
-                        headers['Authorization'] = f'Bearer {new_token}'
-                        response = requests.get(
-                            f'https://discord.com/api/v10/guilds/{guild_id}/channels',
-                            headers=headers
-                        )
-            except Exception as e:
-                logger.error(f"Error refreshing token: {e}")
-        
-        if response.status_code == 200:
-            channels = response.json()
-            # Filter for text channels only
-            text_channels = [channel for channel in channels if channel['type'] == 0]
-            return text_channels
-        else:
-            logger.warning(f"Failed to get channels from Discord API: {response.status_code}")
-            logger.warning(f"Response body: {response.text}")
-            return []
-            
+        return get_bot_channels(guild_id)
     except Exception as e:
-        logger.error(f"Error getting channels: {e}")
+        logger.error("Error getting channels: %s", e)
         logger.error(traceback.format_exc())
         return []
 
 def refresh_discord_token(refresh_token):
-    """Refresh the Discord OAuth token"""
+    """Refresh the Discord OAuth token and return Discord's token response"""
     try:
         data = {
             'client_id': os.getenv('DISCORD_CLIENT_ID'),
@@ -717,27 +788,32 @@ def refresh_discord_token(refresh_token):
             'redirect_uri': os.getenv('DISCORD_REDIRECT_URI')
         }
         
-        response = requests.post('https://discord.com/api/oauth2/token', data=data)
+        response = discord_api.post('oauth2/token', data=data)
         if response.status_code == 200:
-            return response.json().get('access_token')
+            return response.json()
         else:
-            logger.error(f"Failed to refresh token: {response.status_code}")
-            logger.error(f"Response body: {response.text}")
+            logger.error("Failed to refresh token: %s", response.status_code)
+            logger.error("Response body: %s", payload(response.text))
             return None
     except Exception as e:
-        logger.error(f"Error refreshing token: {e}")
+        logger.error("Error refreshing token: %s", e)
         return None
 
 @app.route('/api/guild/<guild_id>/activity')
 @login_required
 def get_guild_activity(guild_id):
     try:
-        # Get recent activity from settings
-        settings = get_guild_settings(guild_id)
-        activity = settings.get('activity', [])
-        return jsonify(activity)
+        before = request.args.get('before', type=int)
+        limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        
+        # Newest first; pass next_before back as ?before= for the next page
+        activity = get_activity_store().page(guild_id, before=before, limit=limit)
+        return jsonify({
+            'activity': activity,
+            'next_before': activity[-1]['id'] if len(activity) == limit else None
+        })
     except Exception as e:
-        print(f"Error getting activity: {e}")
+        logger.error("Error getting activity: %s", e)
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
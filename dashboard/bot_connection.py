@@ -1,16 +1,33 @@
 import os
 from dotenv import load_dotenv
-import json
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any
-import traceback
+import logging
+from .storage import get_storage, get_watcher
+import copy
+from .counters import counters
+from .activity import get_activity_store
+from .live import get_live_updates
+from . import serialization
+from .logs import payload
+from .ipc import get_ipc_client
 
 # Load environment variables
 load_dotenv()
 
-# Settings cache
+logger = logging.getLogger(__name__)
+
+# Settings cache, revalidated against the storage version
 settings_cache = {}
 
+def _on_settings_changed(guild_ids):
+    """Drop cached settings that another process changed"""
+    if guild_ids is None:
+        settings_cache.clear()
+    else:
+        for guild_id in guild_ids:
+            settings_cache.pop(guild_id, None)
+
 # Get the full path for a file in the dashboard directory
 def get_file_path(filename):
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -21,72 +38,87 @@ def ensure_settings_file():
     try:
         settings_file = get_file_path('settings.json')
         if not os.path.exists(settings_file):
-            with open(settings_file, 'w') as f:
-                json.dump({}, f)
-            print(f"Created empty settings file: {settings_file}")
+            with open(settings_file, 'wb') as f:
+                serialization.dump({}, f)
+            logger.info("Created empty settings file: %s", settings_file)
         return True
     except Exception as e:
-        print(f"Error creating settings file: {e}")
+        logger.error("Error creating settings file: %s", e)
         return False
 
-# Initialize settings file
-ensure_settings_file()
+_initialized = False
+
+def init_bot_connection():
+    """Create the settings file and start following changes from other processes (once)"""
+    global _initialized
+    if _initialized:
+        return
+    _initialized = True
+    ensure_settings_file()
+    get_watcher().subscribe(_on_settings_changed)
 
 def get_guild_settings(guild_id: str) -> Dict[str, Any]:
     """Get settings for a guild"""
     try:
-        if os.path.exists(get_file_path('settings.json')):
-            with open(get_file_path('settings.json'), 'r') as f:
-                all_settings = json.load(f)
-                return all_settings.get(str(guild_id), {})
+        get_watcher().check()
+        guild_id = str(guild_id)
+        if guild_id not in settings_cache:
+            settings_cache[guild_id] = get_storage().get(guild_id)
+        return copy.deepcopy(settings_cache[guild_id])
     except Exception as e:
-        print(f"Error loading guild settings: {e}")
+        logger.error("Error loading guild settings: %s", e)
     return {}
 
+def notify_bot(guild_id: str) -> None:
+    """Tell a running bot to pick up a guild's new settings now rather than at its next poll"""
+    get_ipc_client().notify('settings_changed', {'guild_ids': [str(guild_id)]})
+
 def update_guild_settings(guild_id: str, settings: Dict[str, Any]) -> bool:
     """Update settings for a guild"""
     try:
-        # Create settings directory if it doesn't exist
-        os.makedirs(os.path.dirname(get_file_path('settings.json')), exist_ok=True)
-        
-        # Load existing settings
-        if os.path.exists(get_file_path('settings.json')):
-            with open(get_file_path('settings.json'), 'r') as f:
-                all_settings = json.load(f)
-        else:
-            all_settings = {}
-        
-        # Update settings for this guild
-        all_settings[str(guild_id)] = settings
-        
-        # Save back to file
-        with open(get_file_path('settings.json'), 'w') as f:
-            json.dump(all_settings, f, indent=4)
-            
-        print(f"Successfully saved settings for guild {guild_id}")
+        get_storage().set(guild_id, settings)
+        settings_cache[str(guild_id)] = copy.deepcopy(settings)
+        get_live_updates().settings_changed(guild_id, settings)
+        notify_bot(guild_id)
+        logger.debug("Saved settings for guild %s", guild_id)
         return True
     except Exception as e:
-        print(f"Error updating guild settings: {e}")
+        logger.error("Error updating guild settings: %s", e)
         return False
 
+def patch_guild_settings(guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge changed fields into a guild's settings and return the result"""
+    try:
+        settings = get_storage().update(guild_id, changes)
+        settings_cache[str(guild_id)] = copy.deepcopy(settings)
+        get_live_updates().settings_changed(guild_id, settings)
+        notify_bot(guild_id)
+        return settings
+    except Exception as e:
+        logger.error("Error updating guild settings: %s", e)
+        return {}
+
+def apply_settings_change(guild_id: str, changes: Dict[str, Any], action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply changed settings and record the matching activity entry"""
+    settings = patch_guild_settings(guild_id, changes)
+    add_activity(guild_id, {'action': action, 'data': data})
+    return settings
+
 # Store guild info received from Discord in our settings
 def store_guild_info(guild_id: str, guild_data: Dict[str, Any]) -> None:
     """Store guild information from Discord API in our settings"""
     try:
-        print(f"Storing guild info for {guild_id}: {guild_data.get('name')}")
-        print(f"Guild data: {json.dumps(guild_data, indent=2)}")
+        logger.debug("Storing guild info for %s: %s", guild_id, payload(guild_data))
         
-        # Get current settings
-        settings = get_guild_settings(guild_id)
+        # Only the fields we got from Discord are written back
+        settings = {}
         
         # Update with guild data
         if 'name' in guild_data:
             settings['name'] = guild_data['name']
-            print(f"Stored name: {guild_data['name']}")
         
         if 'icon' in guild_data and guild_data['icon']:
             settings['icon'] = guild_data['icon']
-            print(f"Stored icon: {guild_data['icon']}")
             
         if 'owner_id' in guild_data:
             settings['owner_id'] = guild_data['owner_id']
@@ -94,27 +126,33 @@ def store_guild_info(guild_id: str, guild_data: Dict[str, Any]) -> None:
         # Try different member count fields that Discord might provide
         if 'approximate_member_count' in guild_data and guild_data['approximate_member_count']:
             settings['member_count'] = guild_data['approximate_member_count']
-            print(f"Stored member count from approximate_member_count: {guild_data['approximate_member_count']}")
         elif 'member_count' in guild_data and guild_data['member_count']:
             settings['member_count'] = guild_data['member_count']
-            print(f"Stored member count from member_count: {guild_data['member_count']}")
         elif 'approximate_presence_count' in guild_data and guild_data['approximate_presence_count']:
             # If we don't have member count but have presence count, use that as an estimate
             settings['member_count'] = guild_data['approximate_presence_count']
-            print(f"Stored member count from approximate_presence_count: {guild_data['approximate_presence_count']}")
         
-        # Save the updated settings
-        update_guild_settings(guild_id, settings)
+        # Only write when Discord told us something new
+        current = get_guild_settings(guild_id)
+        changes = {key: value for key, value in settings.items() if current.get(key) != value}
+        if not changes:
+            return
         
-        print(f"Successfully stored guild info for {guild_id}: {settings.get('name', 'Unknown')}")
-    except Exception as e:
-        print(f"Error storing guild info: {e}")
-        print(traceback.format_exc())
+        # Save the updated settings
+        patch_guild_settings(guild_id, changes)
+        logger.debug("Stored guild info for %s: %s", guild_id, ', '.join(changes))
+    except Exception:
+        logger.exception("Error storing guild info for %s", guild_id)
 
 # Get bot and guild data combined
 def get_combined_guild_data(guild_id: str) -> Dict[str, Any]:
     """Get combined bot settings and guild data"""
-    settings = get_guild_settings(guild_id)
+    try:
+        # Include command/mod action counts the bot hasn't persisted yet
+        settings = counters.get_settings(guild_id)
+    except Exception as e:
+        logger.error("Error loading guild settings: %s", e)
+        settings = {}
     
     # Build a response with settings and any stored guild info
     result = {
@@ -129,51 +167,32 @@ def get_combined_guild_data(guild_id: str) -> Dict[str, Any]:
             'command_count': settings.get('command_count', 0),
             'mod_actions': settings.get('mod_actions', 0),
             'log_channel': settings.get('log_channel'),
-            'activity': settings.get('activity', []),
+            'activity': get_activity_store().page(guild_id),
             'member_count': settings.get('member_count', 0)  # Include in settings too for backward compatibility
         }
     }
     
-    print(f"Combined guild data for {guild_id}: member_count = {result['member_count']}")
     return result
 
 def increment_command_count(guild_id: str):
     """Increment command count for a specific guild"""
-    try:
-        settings = get_guild_settings(guild_id)
-        settings['command_count'] = settings.get('command_count', 0) + 1
-        update_guild_settings(guild_id, settings)
-    except Exception as e:
-        print(f"Error incrementing command count: {e}")
+    counters.increment(guild_id, 'command_count')
 
 def increment_mod_action(guild_id: str):
     """Increment moderation action count for a specific guild"""
-    try:
-        settings = get_guild_settings(guild_id)
-        settings['mod_actions'] = settings.get('mod_actions', 0) + 1
-        update_guild_settings(guild_id, settings)
-    except Exception as e:
-        print(f"Error incrementing mod action: {e}")
+    counters.increment(guild_id, 'mod_actions')
 
 def add_activity(guild_id: str, activity_data: Dict[str, Any]):
-    """Add an activity entry to the guild's settings"""
+    """Add an activity entry to the guild's activity log"""
     try:
-        settings = get_guild_settings(guild_id)
-        
-        if 'activity' not in settings:
-            settings['activity'] = []
-        
         # Add timestamp if not present
         if 'timestamp' not in activity_data:
-            activity_data['timestamp'] = datetime.now().isoformat()
-        
-        settings['activity'].insert(0, activity_data)
-        # Keep only the most recent 50 activities
-        settings['activity'] = settings['activity'][:50]
+            activity_data['timestamp'] = datetime.now(timezone.utc).isoformat()
         
-        update_guild_settings(guild_id, settings)
+        entry = get_activity_store().append(guild_id, activity_data)
+        get_live_updates().activity_added(guild_id, entry)
     except Exception as e:
-        print(f"Error adding activity: {e}")
+        logger.error("Error adding activity: %s", e)
 
 # Since we're running on the same server, we can just use the local settings
 def sync_with_bot(guild_id: str, settings: dict) -> bool:
@@ -181,7 +200,7 @@ def sync_with_bot(guild_id: str, settings: dict) -> bool:
     try:
         return update_guild_settings(guild_id, settings)
     except Exception as e:
-        print(f"Error syncing settings: {e}")
+        logger.error("Error syncing settings: %s", e)
         return False
 
 def get_bot_settings(guild_id: str) -> dict:
@@ -189,6 +208,6 @@ def get_bot_settings(guild_id: str) -> dict:
     return get_guild_settings(guild_id)
 
 def get_bot_channels(guild_id: str) -> list:
-    """Get channels from local storage since we're running on the same server"""
+    """Get the text channel snapshot the bot publishes to the guild's settings"""
     settings = get_guild_settings(guild_id)
     return settings.get('cached_channels', []) 
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""
+In-process caches for data the dashboard fetches from Discord.
+
+TTLCache keeps values for a short time and makes concurrent misses for
+the same key share a single load (single-flight), so a burst of requests
+for one user costs one Discord roundtrip.
+
+StaleWhileRevalidateCache never makes a caller wait for data it already
+has: stale entries are returned as they are and refreshed on a small
+background thread pool.
+"""
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """A load in progress that other callers can wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Thread-safe cache whose entries expire ``ttl`` seconds after they were stored"""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a fresh value, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop one key, or everything"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any],
+                    should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Get a fresh value or load it, sharing one load between concurrent callers.
+
+        Results that ``should_cache`` rejects (like error responses) are
+        handed to the callers already waiting but not kept.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            # Store before the flight ends so no caller can slip in a second load
+            if should_cache(flight.value):
+                self.set(key, flight.value)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+
+class StaleWhileRevalidateCache:
+    """Cache that serves stale values while a background load refreshes them.
+
+    Entries older than ``fresh_for`` seconds are still returned, but the
+    first caller to see one stale schedules a refresh. Callers never wait
+    on the loader: a miss returns a placeholder (or None) and loads in the
+    background. Loaders return the new value, or None to keep the old one
+    (Discord being down shouldn't empty the cache); either way the entry
+    counts as fresh again, so a failing upstream is retried at most once
+    per ``fresh_for``, also for keys that never loaded.
+    """
+
+    def __init__(self, fresh_for: float, max_entries: int = 1024, workers: int = 4,
+                 name: str = 'swr-cache'):
+        self.fresh_for = fresh_for
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (loaded_at, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Get the cached value however old it is, without refreshing it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def set(self, key: Hashable, value: Any, loaded_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, time.monotonic() if loaded_at is None else loaded_at)
+
+    def _store(self, key: Hashable, value: Any, loaded_at: float) -> None:
+        self._entries[key] = (loaded_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop one key, or everything"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get(self, key: Hashable, loader: Callable[[], Any],
+            initial: Optional[Callable[[], Any]] = None) -> Optional[Any]:
+        """Get a value right away, scheduling a refresh when it is stale.
+
+        On a miss, ``initial`` can supply a placeholder (like what was last
+        saved to storage) that is served while the real load runs in the
+        background; without one the miss returns None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            value = initial() if initial is not None else None
+            with self._lock:
+                # Stored as already stale, so the refresh below is scheduled
+                entry = self._entries.setdefault(key, (float('-inf'), value))
+
+        if time.monotonic() - entry[0] >= self.fresh_for:
+            self._schedule(key, loader)
+        return entry[1]
+
+    def _schedule(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        try:
+            self._executor.submit(self._refresh, key, loader)
+        except RuntimeError:  # the executor is shutting down
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        value = None
+        try:
+            value = loader()
+        except Exception:
+            logger.exception("Error refreshing cached %r", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+                if value is None:
+                    value = self._entries.get(key, (None, None))[1]
+                # Failures are remembered too, so they aren't retried before fresh_for
+                self._store(key, value, time.monotonic())
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
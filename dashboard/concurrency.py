@@ -0,0 +1,67 @@
+"""
+Run the independent upstream calls of one dashboard request concurrently.
+
+gather() hands the calls to a bounded thread pool shared by all requests
+(UPSTREAM_WORKERS threads, default 16) and waits for all of them, so a
+request takes as long as its slowest call instead of the sum of them.
+The calls run outside the Flask request context: read anything they need
+from the session before handing them over.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('UPSTREAM_WORKERS', '16')),
+                thread_name_prefix='upstream'
+            )
+        return _executor
+
+
+def _outcome(call: Callable[[], Any]) -> Tuple[bool, Any]:
+    try:
+        return True, call()
+    except Exception as e:
+        return False, e
+
+
+def _run_in_pool(call: Callable[[], Any]) -> Tuple[bool, Any]:
+    _local.in_pool = True
+    try:
+        return _outcome(call)
+    finally:
+        _local.in_pool = False
+
+
+def gather(*calls: Callable[[], Any], return_exceptions: bool = False) -> List[Any]:
+    """Run zero-argument callables concurrently and return their results in order.
+
+    Like asyncio.gather, the first exception is raised once every call has
+    finished, or with return_exceptions=True it takes that call's place in
+    the results. Calls made from a pool thread run one after another, so
+    nested fan-outs can't use up the pool and deadlock.
+    """
+    if len(calls) <= 1 or getattr(_local, 'in_pool', False):
+        outcomes = [_outcome(call) for call in calls]
+    else:
+        futures = [_get_executor().submit(_run_in_pool, call) for call in calls[1:]]
+        # This thread makes the first call itself instead of waiting idle
+        outcomes = [_outcome(calls[0])] + [future.result() for future in futures]
+
+    results = []
+    for ok, value in outcomes:
+        if not ok and not return_exceptions:
+            raise value
+        results.append(value)
+    return results
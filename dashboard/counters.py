@@ -0,0 +1,218 @@
+"""
+In-memory guild counters (command_count, mod_actions, ...) with periodic rollup.
+
+Increments only touch a dict in one of several lock-protected shards, so
+the command path never waits on disk or on other guilds. A background
+thread merges the accumulated deltas into the settings storage, and
+readers add the pending deltas to the persisted values.
+
+Pending deltas live in this process only: increments made by another
+process (the bot, when the dashboard runs separately) show up once that
+process rolls them up, so figures can lag by up to
+COUNTER_ROLLUP_INTERVAL seconds.
+"""
+
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Optional
+
+from .storage import SettingsStorage, get_storage
+from .events import event_bus
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedCounters:
+    """Per-guild counters split across lock-protected shards"""
+
+    def __init__(self, storage: Optional[SettingsStorage] = None, shards: Optional[int] = None,
+                 rollup_interval: Optional[float] = None):
+        self._storage = storage
+        shard_count = shards or int(os.getenv('COUNTER_SHARDS', '16'))
+        self.rollup_interval = rollup_interval if rollup_interval is not None else \
+            float(os.getenv('COUNTER_ROLLUP_INTERVAL', '10'))
+
+        self._shards = [({}, threading.Lock()) for _ in range(shard_count)]
+        # Deltas taken out of the shards but not yet committed to storage.
+        # Lock order: _rollup_lock, then a shard lock, then _inflight_lock.
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._rollup_lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._rollup_callbacks = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def storage(self) -> SettingsStorage:
+        if self._storage is None:
+            self._storage = get_storage()
+        return self._storage
+
+    def _shard(self, guild_id: str):
+        return self._shards[hash(guild_id) % len(self._shards)]
+
+    def increment(self, guild_id: str, field: str, amount: int = 1) -> None:
+        """Add to a guild counter in memory"""
+        guild_id = str(guild_id)
+        counts, lock = self._shard(guild_id)
+        with lock:
+            guild_counts = counts.get(guild_id)
+            if guild_counts is None:
+                guild_counts = counts[guild_id] = {}
+            guild_counts[field] = guild_counts.get(field, 0) + amount
+        if event_bus.has_subscribers(guild_id):
+            event_bus.publish(guild_id, 'counters', {'delta': {field: amount}})
+
+    def on_rollup(self, callback: Callable[[str, Dict[str, int]], None]) -> None:
+        """Call ``callback(guild_id, deltas)`` whenever deltas are committed to storage.
+
+        It runs while rollups are held (see ``holding_rollups``), so it must
+        not block.
+        """
+        self._rollup_callbacks.append(callback)
+
+    @contextmanager
+    def holding_rollups(self):
+        """Keep rollups from committing while the block runs"""
+        with self._rollup_lock:
+            yield
+
+    def pending(self, guild_id: str) -> Dict[str, int]:
+        """Get the deltas for a guild that haven't been persisted yet"""
+        guild_id = str(guild_id)
+        counts, lock = self._shard(guild_id)
+        # Deltas move between the shard and _inflight under the shard lock,
+        # so reading both under it sees them in exactly one place
+        with lock:
+            result = dict(counts.get(guild_id, {}))
+            with self._inflight_lock:
+                inflight = dict(self._inflight.get(guild_id, {}))
+        for field, amount in inflight.items():
+            result[field] = result.get(field, 0) + amount
+        return result
+
+    def pending_totals(self) -> Dict[str, int]:
+        """Get this process's unpersisted deltas summed over every guild"""
+        totals = {}
+        # No rollup can move deltas between the shards while we go through them
+        with self._rollup_lock:
+            pending = []
+            for counts, lock in self._shards:
+                with lock:
+                    pending.extend(dict(c) for c in counts.values())
+            with self._inflight_lock:
+                pending.extend(dict(c) for c in self._inflight.values())
+        for guild_counts in pending:
+            for field, amount in guild_counts.items():
+                totals[field] = totals.get(field, 0) + amount
+        return totals
+
+    def apply_pending(self, guild_id: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a guild's pending deltas to its persisted settings (in place)"""
+        for field, amount in self.pending(guild_id).items():
+            settings[field] = settings.get(field, 0) + amount
+        return settings
+
+    def get_settings(self, guild_id: str) -> Dict[str, Any]:
+        """Read a guild's settings with this process's pending counts added"""
+        # Holding the rollup lock keeps a rollup from landing between the
+        # storage read and the pending read, which would count it twice
+        with self._rollup_lock:
+            return self.apply_pending(guild_id, self.storage.get(guild_id))
+
+    def get_all_settings(self) -> Dict[str, Dict[str, Any]]:
+        """Read every guild's settings with this process's pending counts added"""
+        return self._with_all_pending(self.storage.all)
+
+    def get_all_summaries(self) -> Dict[str, Dict[str, Any]]:
+        """Read every guild's summary fields with this process's pending counts added"""
+        return self._with_all_pending(self.storage.summaries)
+
+    def _with_all_pending(self, read) -> Dict[str, Dict[str, Any]]:
+        with self._rollup_lock:
+            all_settings = read()
+            with self._inflight_lock:
+                pending = [{g: dict(c) for g, c in self._inflight.items()}]
+            for counts, lock in self._shards:
+                with lock:
+                    pending.append({g: dict(c) for g, c in counts.items()})
+            for shard_counts in pending:
+                for guild_id, guild_counts in shard_counts.items():
+                    settings = all_settings.setdefault(guild_id, {})
+                    for field, amount in guild_counts.items():
+                        settings[field] = settings.get(field, 0) + amount
+            return all_settings
+
+    def rollup(self) -> int:
+        """Merge pending deltas into storage and return the number of guilds written"""
+        with self._flush_lock:
+            # Each shard's deltas move to _inflight under its lock, so readers
+            # always find them in one of the two
+            taken = {}
+            with self._rollup_lock:
+                for counts, lock in self._shards:
+                    with lock:
+                        if counts:
+                            with self._inflight_lock:
+                                self._inflight.update(counts)
+                            taken.update(counts)
+                            counts.clear()
+            if not taken:
+                return 0
+
+            written = 0
+            failed = []
+            for guild_id, deltas in taken.items():
+                try:
+                    with self._rollup_lock:
+                        self.storage.increment(guild_id, deltas)
+                        with self._inflight_lock:
+                            del self._inflight[guild_id]
+                        for callback in self._rollup_callbacks:
+                            try:
+                                callback(guild_id, deltas)
+                            except Exception:
+                                logger.exception("Error in counter rollup callback")
+                    written += 1
+                except Exception as e:
+                    logger.error("Error rolling up counters for guild %s: %s", guild_id, e)
+                    failed.append(guild_id)
+
+            # Anything that failed goes back into the shards for the next rollup.
+            # These were published when first counted, so don't publish them again.
+            with self._rollup_lock:
+                for guild_id in failed:
+                    counts, lock = self._shard(guild_id)
+                    with lock:
+                        with self._inflight_lock:
+                            deltas = self._inflight.pop(guild_id)
+                        guild_counts = counts.setdefault(guild_id, {})
+                        for field, amount in deltas.items():
+                            guild_counts[field] = guild_counts.get(field, 0) + amount
+            return written
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.rollup_interval):
+            self.rollup()
+
+    def start(self) -> None:
+        """Start the background rollup thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='counter-rollup', daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """Stop the rollup thread and persist anything still pending"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.rollup()
+
+
+# Shared by the bot and, when they run in the same process, the dashboard
+counters = ShardedCounters()
@@ -0,0 +1,164 @@
+"""
+Shared HTTP client for the Discord REST API.
+
+Every dashboard request to discord.com goes through one requests.Session,
+so TLS connections are kept alive and reused across requests and worker
+threads instead of being opened per call. Calls have a timeout, and
+idempotent requests are retried with backoff on connection errors and 5xx
+responses. Requests also wait their turn in Discord's rate limit buckets
+(see ratelimit.py); a 429 is retried once if its wait is short and
+returned to the caller otherwise, since Discord's Retry-After can be far
+longer than a page load should wait.
+"""
+
+import os
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .caching import TTLCache
+from .ratelimit import get_rate_limiter, route_key
+from . import serialization
+
+logger = logging.getLogger(__name__)
+
+DISCORD_API_ENDPOINT = 'https://discord.com/api/v10'
+
+
+class DiscordClient:
+    """Pooled, keep-alive Discord REST client that is safe to share between threads"""
+
+    def __init__(self, base_url: str = DISCORD_API_ENDPOINT, timeout: Optional[float] = None,
+                 retries: Optional[int] = None, pool_size: Optional[int] = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout if timeout is not None else \
+            float(os.getenv('DISCORD_HTTP_TIMEOUT', '10'))
+        retries = retries if retries is not None else int(os.getenv('DISCORD_HTTP_RETRIES', '3'))
+        pool_size = pool_size or int(os.getenv('DISCORD_HTTP_POOL_SIZE', '20'))
+
+        # Only idempotent methods are retried after the request was sent;
+        # POSTs (like the OAuth code exchange) only retry failed connections
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = 'WISP Dashboard (https://wispbot.site, 1.0)'
+
+        # The user's guild list, shared briefly between page loads for the same token
+        self._user_guilds = TTLCache(float(os.getenv('DISCORD_GUILDS_TTL', '30')))
+
+        # Longest a request waits for its rate limit bucket before we give up with a 429
+        self.max_rate_limit_wait = float(os.getenv('DISCORD_RATELIMIT_MAX_WAIT', '5'))
+
+    def url(self, path: str) -> str:
+        """Build a full URL from an API path (full URLs are left alone)"""
+        if path.startswith(('https://', 'http://')):
+            return path
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def request(self, method: str, path: str, token: Optional[str] = None, **kwargs) -> requests.Response:
+        """Send a request, authenticating with an OAuth2 bearer token if given"""
+        if token:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, Authorization=f'Bearer {token}')
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.url(path)
+
+        authorization = (kwargs.get('headers') or {}).get('Authorization')
+        identity = self._token_key(authorization) if authorization else 'app'
+        route, major = route_key(method, url[len(self.base_url):] if url.startswith(self.base_url) else url)
+
+        for attempt in range(2):
+            wait = self._acquire(route, major, identity)
+            if wait:
+                return self._rate_limited(url, wait)
+            response = self.session.request(method, url, **kwargs)
+            self._record(route, major, identity, response)
+            if response.status_code != 429:
+                break
+        return response
+
+    def _acquire(self, route: str, major: str, identity: str) -> float:
+        try:
+            return get_rate_limiter().acquire(route, major, identity, self.max_rate_limit_wait)
+        except Exception as e:
+            # Never fail a request because the shared rate limit state is unavailable
+            logger.error("Error checking Discord rate limits: %s", e)
+            return 0.0
+
+    def _record(self, route: str, major: str, identity: str, response: requests.Response) -> None:
+        retry_after = None
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json().get('retry_after'))
+            except (ValueError, TypeError, AttributeError):
+                pass
+        try:
+            get_rate_limiter().update(route, major, identity, response.status_code,
+                                      response.headers, retry_after)
+        except Exception as e:
+            logger.error("Error recording Discord rate limits: %s", e)
+
+    @staticmethod
+    def _rate_limited(url: str, retry_after: float) -> requests.Response:
+        """A 429 for a request we didn't send because its bucket is empty"""
+        response = requests.Response()
+        response.status_code = 429
+        response.url = url
+        response.headers['Retry-After'] = str(max(1, round(retry_after)))
+        response.headers['Content-Type'] = 'application/json'
+        response._content = serialization.dumpb({
+            'message': 'You are being rate limited.',
+            'retry_after': round(retry_after, 3),
+            'global': False
+        })
+        return response
+
+    def get(self, path: str, token: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request('GET', path, token=token, **kwargs)
+
+    def post(self, path: str, token: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request('POST', path, token=token, **kwargs)
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        # Keep raw tokens out of the cache keys
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get_user_guilds(self, token: str) -> Tuple[int, Optional[List[dict]]]:
+        """Get (status code, guilds) for /users/@me/guilds.
+
+        Successful responses are cached per token for DISCORD_GUILDS_TTL
+        seconds, and concurrent calls for the same token share one request.
+        A 401 drops the token's cache entry.
+        """
+        def load():
+            response = self.get('users/@me/guilds', token=token)
+            return response.status_code, (response.json() if response.status_code == 200 else None)
+
+        status, guilds = self._user_guilds.get_or_load(self._token_key(token), load,
+                                                       should_cache=lambda result: result[0] == 200)
+        if status == 401:
+            self.forget_token(token)
+        # Callers may sort or extend the list, so they each get their own copy
+        return status, ([dict(guild) for guild in guilds] if guilds is not None else None)
+
+    def forget_token(self, token: Optional[str]) -> None:
+        """Drop everything cached for a token (on logout or when it stops working)"""
+        if token:
+            self._user_guilds.invalidate(self._token_key(token))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+discord_api = DiscordClient()
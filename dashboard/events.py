@@ -0,0 +1,107 @@
+"""
+In-process publish/subscribe for live dashboard updates.
+
+Write paths publish small events (a new activity entry, counter deltas,
+changed settings fields) for a guild and every open event stream for
+that guild receives them. Publishing to a guild nobody is watching costs
+one dict lookup. Each subscriber has a bounded queue; one that falls too
+far behind gets a single ``resync`` event telling it to reload instead
+of an ever-growing backlog.
+"""
+
+import queue
+import itertools
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import serialization
+
+MAX_QUEUED_EVENTS = 256
+
+
+class Subscription:
+    """One listener's queue of events for a guild"""
+
+    def __init__(self, guild_id: str, max_queued: int = MAX_QUEUED_EVENTS, events: Optional[Iterable[str]] = None):
+        self.guild_id = guild_id
+        self.events = frozenset(events) if events is not None else None  # None means every event
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._overflowed = False
+
+    def put(self, event: Dict[str, Any]) -> None:
+        if self.events is not None and event['event'] not in self.events:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._overflowed = True
+
+    def get(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for events and return everything queued"""
+        events = []
+        try:
+            events.append(self._queue.get(timeout=timeout))
+            while True:
+                events.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if self._overflowed:
+            self._overflowed = False
+            events = [{'id': None, 'event': 'resync', 'data': {}}]
+        return events
+
+
+class EventBus:
+    """Fan events for a guild out to its subscribers"""
+
+    def __init__(self):
+        self._subscribers = {}  # guild_id -> set of Subscription
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, guild_id: str, events: Optional[Iterable[str]] = None) -> Subscription:
+        """Listen to a guild's events, or only the named ones"""
+        subscription = Subscription(str(guild_id), events=events)
+        with self._lock:
+            self._subscribers.setdefault(subscription.guild_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.guild_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.guild_id]
+
+    def has_subscribers(self, guild_id: str) -> bool:
+        return str(guild_id) in self._subscribers
+
+    def watched_guilds(self) -> List[str]:
+        """Get the guilds that currently have subscribers"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, guild_id: str, event: str, data: Any) -> None:
+        """Send an event to everyone subscribed to a guild"""
+        guild_id = str(guild_id)
+        if guild_id not in self._subscribers:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(guild_id, ()))
+            message = {'id': next(self._ids), 'event': event, 'data': data}
+        for subscription in subscribers:
+            subscription.put(message)
+
+
+def format_sse(message: Dict[str, Any]) -> str:
+    """Encode an event in the text/event-stream format"""
+    lines = []
+    if message.get('id') is not None:
+        lines.append(f"id: {message['id']}")
+    lines.append(f"event: {message['event']}")
+    lines.append(f"data: {serialization.dumps(message['data'])}")
+    return '\n'.join(lines) + '\n\n'
+
+
+event_bus = EventBus()
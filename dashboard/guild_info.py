@@ -0,0 +1,95 @@
+"""
+Guild metadata (name, icon, owner and approximate counts) for dashboard pages.
+
+Pages render from what we already know about a guild, from memory or
+from the fields last saved to settings, and a background refresh asks
+Discord once the data is older than GUILD_INFO_FRESH_SECONDS. Refreshed
+fields are only written back to settings when they changed.
+"""
+
+import os
+import logging
+from typing import Any, Dict, Optional
+
+from .caching import StaleWhileRevalidateCache
+from .discord_api import discord_api
+from .bot_connection import get_guild_settings, store_guild_info
+
+logger = logging.getLogger(__name__)
+
+GUILD_INFO_FIELDS = ('name', 'icon', 'owner_id', 'approximate_member_count', 'approximate_presence_count')
+
+
+def guild_info_from(guild_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the metadata fields out of a Discord guild object"""
+    info = {key: guild_data.get(key) for key in GUILD_INFO_FIELDS}
+    if not info['approximate_member_count']:
+        info['approximate_member_count'] = guild_data.get('member_count')
+    return info
+
+
+class GuildInfoCache:
+    """Stale-while-revalidate cache of Discord guild metadata"""
+
+    def __init__(self, fresh_for: Optional[float] = None, workers: Optional[int] = None):
+        self._cache = StaleWhileRevalidateCache(
+            fresh_for if fresh_for is not None else float(os.getenv('GUILD_INFO_FRESH_SECONDS', '300')),
+            max_entries=4096,
+            workers=workers or int(os.getenv('GUILD_INFO_REFRESH_WORKERS', '4')),
+            name='guild-info',
+        )
+
+    def _stored(self, guild_id: str, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """What we saved last time (possibly nothing), used until Discord answers"""
+        if settings is None:
+            settings = get_guild_settings(guild_id)
+        return {
+            'name': settings.get('name'),
+            'icon': settings.get('icon'),
+            'owner_id': settings.get('owner_id'),
+            'approximate_member_count': settings.get('member_count'),
+            'approximate_presence_count': None,
+        }
+
+    def _fetch(self, guild_id: str, token: str) -> Optional[Dict[str, Any]]:
+        guild_data = None
+        try:
+            response = discord_api.get(f'guilds/{guild_id}', token=token, params={'with_counts': 'true'})
+            if response.status_code == 200:
+                guild_data = response.json()
+        except Exception as e:
+            logger.warning("Error fetching guild %s from Discord: %s", guild_id, e)
+
+        if guild_data is None:
+            # Fall back to the user's guild list (usually cached), which only has name and icon
+            status, user_guilds = discord_api.get_user_guilds(token)
+            if status != 200:
+                return None
+            guild_data = next((g for g in user_guilds if g['id'] == guild_id), None)
+            if guild_data is None:
+                return None
+
+        store_guild_info(guild_id, guild_data)
+        return guild_info_from(guild_data)
+
+    def get(self, guild_id: str, token: Optional[str],
+            settings: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Get a guild's metadata without waiting on Discord.
+
+        Until Discord has answered, the fields come from the guild's stored
+        settings and may be None. Pass the settings if the caller already
+        read them.
+        """
+        guild_id = str(guild_id)
+        if not token:
+            info = self._cache.peek(guild_id) or self._stored(guild_id, settings)
+        else:
+            info = self._cache.get(guild_id, lambda: self._fetch(guild_id, token),
+                                   initial=lambda: self._stored(guild_id, settings))
+        return dict(info) if info is not None else None
+
+    def invalidate(self, guild_id: Optional[str] = None) -> None:
+        self._cache.invalidate(str(guild_id) if guild_id is not None else None)
+
+
+guild_info = GuildInfoCache()
@@ -0,0 +1,153 @@
+"""
+Guild state for the dashboard blueprint.
+
+Answers "which guilds is the bot in, what are they called, which text
+channels do they have and how are they configured" from memory. The bot
+pushes a snapshot of each guild as it changes, directly when it runs in
+the same process and over the IPC bridge when it doesn't. Until then the
+snapshot the bot persists to the guild's settings (``name``, ``icon``,
+``owner_id``, ``bot_permissions`` and ``cached_channels``) is used.
+Entries are built once per guild and dropped when the settings watcher
+reports the guild changed.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from .storage import get_storage, get_watcher
+
+# Fields a guild snapshot carries, as stored in the guild's settings
+SNAPSHOT_FIELDS = ('name', 'icon', 'owner_id', 'bot_permissions', 'cached_channels')
+
+ADMINISTRATOR = 1 << 3
+
+
+def _can_administrate(permissions: Optional[str]) -> bool:
+    try:
+        return bool(int(permissions or 0) & ADMINISTRATOR)
+    except (TypeError, ValueError):
+        return False
+
+
+class GuildStateService:
+    """In-memory view of every guild the bot is in"""
+
+    def __init__(self, storage=None, watcher=None):
+        self._storage = storage or get_storage()
+        self._watcher = watcher or get_watcher()
+        self._lock = threading.Lock()
+        self._live = {}  # guild_id -> snapshot pushed by the bot
+        self._entries = {}  # guild_id -> built entry
+        self._guild_ids = None  # every known guild, or None until listed
+        self._watcher.subscribe(self._on_settings_changed)
+
+    # -- bot side -------------------------------------------------------------
+
+    def publish(self, guild_id: str, snapshot: Dict[str, Any]) -> None:
+        """Replace a guild's snapshot with the bot's current view of it"""
+        guild_id = str(guild_id)
+        with self._lock:
+            self._live[guild_id] = {key: snapshot.get(key) for key in SNAPSHOT_FIELDS}
+            self._entries.pop(guild_id, None)
+            if self._guild_ids is not None:
+                self._guild_ids.add(guild_id)
+
+    def follow_bot(self, client) -> None:
+        """Take snapshots from a bot in another process through its IPC events"""
+        client.subscribe(['guild'], lambda data: self.publish(data['id'], data))
+        client.subscribe(['guild_remove'], lambda data: self.remove(data['id']))
+
+    def remove(self, guild_id: str) -> None:
+        """Forget a guild the bot has left"""
+        guild_id = str(guild_id)
+        with self._lock:
+            self._live.pop(guild_id, None)
+            self._entries.pop(guild_id, None)
+            if self._guild_ids is not None:
+                self._guild_ids.discard(guild_id)
+
+    # -- dashboard side -------------------------------------------------------
+
+    def invalidate(self, guild_id: str) -> None:
+        """Drop a guild's entry after this process changed its settings"""
+        with self._lock:
+            self._entries.pop(str(guild_id), None)
+
+    def _on_settings_changed(self, guild_ids: Optional[List[str]]) -> None:
+        with self._lock:
+            if guild_ids is None:
+                self._entries.clear()
+                self._guild_ids = None
+                return
+            for guild_id in guild_ids:
+                self._entries.pop(guild_id, None)
+            if self._guild_ids is not None:
+                self._guild_ids.update(guild_ids)
+
+    def _build(self, guild_id: str) -> Optional[Dict[str, Any]]:
+        settings = self._storage.get(guild_id) or {}
+        with self._lock:
+            live = self._live.get(guild_id)
+        snapshot = live or {key: settings.get(key) for key in SNAPSHOT_FIELDS}
+        if live is None and not settings:
+            return None
+        return {
+            'id': guild_id,
+            'name': snapshot.get('name') or 'Unknown Server',
+            'icon': snapshot.get('icon'),
+            'owner_id': snapshot.get('owner_id'),
+            'bot_permissions': snapshot.get('bot_permissions'),
+            'administrator': _can_administrate(snapshot.get('bot_permissions')),
+            'channels': snapshot.get('cached_channels') or [],
+            'settings': {
+                'prefix': settings.get('prefix', '?'),
+                'cogs': settings.get('cogs', ['image', 'security']),
+                'log_channel': settings.get('log_channel')
+            }
+        }
+
+    def guild(self, guild_id: str) -> Optional[Dict[str, Any]]:
+        """Get a guild's entry, or None for a guild we know nothing about.
+
+        Entries are shared between callers and must not be modified.
+        """
+        self._watcher.check()
+        guild_id = str(guild_id)
+        entry = self._entries.get(guild_id)
+        if entry is None:
+            entry = self._build(guild_id)
+            if entry is not None:
+                with self._lock:
+                    self._entries.setdefault(guild_id, entry)
+        return entry
+
+    def guilds(self) -> List[Dict[str, Any]]:
+        """Get the entries of every guild the bot is in"""
+        self._watcher.check()
+        with self._lock:
+            guild_ids = self._guild_ids
+        if guild_ids is None:
+            guild_ids = set(self._storage.summaries())
+            with self._lock:
+                guild_ids.update(self._live)
+                self._guild_ids = guild_ids
+        entries = (self.guild(guild_id) for guild_id in list(guild_ids))
+        return [entry for entry in entries if entry is not None]
+
+    def administered_guilds(self) -> List[Dict[str, Any]]:
+        """Get the entries of the guilds where the bot is an administrator"""
+        return [entry for entry in self.guilds() if entry['administrator']]
+
+
+_guild_state = None
+_guild_state_lock = threading.Lock()
+
+
+def get_guild_state() -> GuildStateService:
+    """Get the process-wide guild state service, creating it on first use"""
+    global _guild_state
+    if _guild_state is None:
+        with _guild_state_lock:
+            if _guild_state is None:
+                _guild_state = GuildStateService()
+    return _guild_state
@@ -0,0 +1,341 @@
+"""
+Local IPC between the bot process and dashboard workers.
+
+The bot listens on a Unix domain socket (BOT_IPC_SOCKET, default
+``dashboard/bot.sock``, readable only by the bot's user). Every frame is
+one line of compact JSON:
+
+- request: ``{"id": 1, "method": "guilds", "params": {...}}``
+- response: ``{"id": 1, "result": ...}`` or ``{"id": 1, "error": "..."}``
+- notification: a request without an ``id``; no response is sent
+- event: ``{"event": "guild", "data": {...}}``, pushed by the bot to
+  connections that sent ``subscribe`` with ``{"topics": [...]}``
+
+``IPCServer`` runs on the bot's event loop and ``IPCClient`` is a
+blocking client for dashboard threads. Set BOT_IPC_SOCKET to an empty
+string to turn the bridge off.
+"""
+
+import os
+import time
+import socket
+import asyncio
+import itertools
+import threading
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from . import serialization
+
+logger = logging.getLogger(__name__)
+
+IPC_SOCKET = os.getenv('BOT_IPC_SOCKET', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.sock'))
+IPC_TIMEOUT = float(os.getenv('BOT_IPC_TIMEOUT', '2'))
+IPC_RECONNECT_DELAY = float(os.getenv('BOT_IPC_RECONNECT_DELAY', '2'))
+
+# Largest frame the server reads, and how much unread event data a slow subscriber may build up
+MAX_FRAME = 16 * 1024 * 1024
+MAX_BUFFERED = 4 * 1024 * 1024
+
+
+class IPCError(Exception):
+    """The bot couldn't be reached or the request failed"""
+
+
+def ipc_available(path: Optional[str] = None) -> bool:
+    """Whether the bridge is configured and Unix sockets are supported here"""
+    return bool(path if path is not None else IPC_SOCKET) and hasattr(socket, 'AF_UNIX')
+
+
+def _frame(message: Dict[str, Any]) -> bytes:
+    return serialization.dumpb(message, default=str) + b'\n'
+
+
+# -- bot side -----------------------------------------------------------------
+
+class _Connection:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.topics = set()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            # The other end stopped reading; drop it rather than buffer forever
+            self.writer.close()
+            return
+        self.writer.write(_frame(message))
+
+
+class IPCServer:
+    """Answer dashboard requests and push events, on the running event loop.
+
+    ``handlers`` maps method names to callables taking the request's
+    params as keyword arguments; they may be coroutines.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[..., Any]], path: Optional[str] = None):
+        self.path = path if path is not None else IPC_SOCKET
+        self.handlers = dict(handlers)
+        self._connections = set()
+        self._server = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a previous run
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=MAX_FRAME)
+        os.chmod(self.path, 0o600)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        # Close open connections first; wait_closed() waits for them on newer Pythons
+        for connection in list(self._connections):
+            connection.writer.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def publish(self, topic: str, data: Any) -> None:
+        """Send an event to every connection subscribed to the topic"""
+        message = None
+        for connection in list(self._connections):
+            if topic in connection.topics:
+                message = message or {'event': topic, 'data': data}
+                connection.send(message)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = _Connection(writer)
+        self._connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = serialization.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    connection.send({'id': None, 'error': 'invalid frame'})
+                    continue
+                response = await self._handle(connection, request)
+                if request.get('id') is not None:
+                    connection.send(response)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def _handle(self, connection: _Connection, request: Dict[str, Any]) -> Dict[str, Any]:
+        method = request.get('method')
+        params = request.get('params') or {}
+        try:
+            if method == 'subscribe':
+                connection.topics.update(params.get('topics', ()))
+                result = sorted(connection.topics)
+            elif method == 'unsubscribe':
+                connection.topics.difference_update(params.get('topics', ()))
+                result = sorted(connection.topics)
+            elif method in self.handlers:
+                result = self.handlers[method](**params)
+                if asyncio.iscoroutine(result):
+                    result = await result
+            else:
+                raise IPCError(f"unknown method: {method}")
+        except Exception as e:
+            return {'id': request.get('id'), 'error': f"{type(e).__name__}: {e}"}
+        return {'id': request.get('id'), 'result': result}
+
+
+# -- dashboard side -----------------------------------------------------------
+
+class IPCClient:
+    """Blocking client for the bot's IPC socket, safe to share between threads.
+
+    Connects on first use. Requests fail fast with IPCError while the bot
+    is down. Once something is subscribed, a background thread keeps
+    reconnecting and subscribes again after the bot restarts.
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: Optional[float] = None):
+        self.path = path if path is not None else IPC_SOCKET
+        self.timeout = timeout if timeout is not None else IPC_TIMEOUT
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()  # guards the connection
+        self._write_lock = threading.Lock()
+        self._sock = None
+        self._pending = {}  # request id -> Future
+        self._subscribers = {}  # topic -> list of callbacks
+        self._closed = False
+        self._reconnecting = False
+
+    # -- connection -----------------------------------------------------------
+
+    def _connect(self) -> socket.socket:
+        with self._lock:
+            if self._sock is not None:
+                return self._sock
+            if self._closed or not ipc_available(self.path):
+                raise IPCError("bot IPC is disabled")
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                sock.settimeout(None)
+            except OSError as e:
+                sock.close()
+                raise IPCError(f"bot is not reachable: {e}") from e
+            self._sock = sock
+            threading.Thread(target=self._read, args=(sock,), name='bot-ipc-reader', daemon=True).start()
+            topics = list(self._subscribers)
+        if topics:
+            self.notify('subscribe', {'topics': topics})
+        return sock
+
+    def _disconnected(self, sock: socket.socket) -> None:
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending, self._pending = self._pending, {}
+            reconnect = bool(self._subscribers) and not self._closed and not self._reconnecting
+            if reconnect:
+                self._reconnecting = True
+        sock.close()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(IPCError("connection to the bot was lost"))
+        if reconnect:
+            threading.Thread(target=self._reconnect, name='bot-ipc-reconnect', daemon=True).start()
+
+    def _reconnect(self) -> None:
+        try:
+            while not self._closed:
+                try:
+                    self._connect()
+                    return
+                except IPCError:
+                    time.sleep(IPC_RECONNECT_DELAY)
+        finally:
+            with self._lock:
+                self._reconnecting = False
+
+    def _read(self, sock: socket.socket) -> None:
+        try:
+            with sock.makefile('rb') as lines:
+                for line in lines:
+                    try:
+                        message = serialization.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(message, dict):
+                        self._dispatch(message)
+        except OSError:
+            pass
+        finally:
+            self._disconnected(sock)
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        if 'event' in message:
+            for callback in list(self._subscribers.get(message['event'], ())):
+                try:
+                    callback(message.get('data'))
+                except Exception:
+                    logger.exception("Error in bot IPC event callback")
+            return
+        with self._lock:
+            future = self._pending.pop(message.get('id'), None)
+        if future is None:
+            return
+        if 'error' in message:
+            future.set_exception(IPCError(message['error']))
+        else:
+            future.set_result(message.get('result'))
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        sock = self._connect()
+        try:
+            with self._write_lock:
+                sock.sendall(_frame(message))
+        except OSError as e:
+            self._disconnected(sock)
+            raise IPCError(f"bot is not reachable: {e}") from e
+
+    # -- API ------------------------------------------------------------------
+
+    def request(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        """Call a method on the bot and wait for its result"""
+        request_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = future
+        try:
+            self._send({'id': request_id, 'method': method, 'params': params or {}})
+            return future.result(timeout if timeout is not None else self.timeout)
+        except FutureTimeout:
+            raise IPCError(f"bot did not answer {method} in time") from None
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        """Call a method on the bot without waiting; returns False if the bot is unreachable"""
+        try:
+            self._send({'method': method, 'params': params or {}})
+            return True
+        except IPCError:
+            return False
+
+    def subscribe(self, topics: Iterable[str], callback: Callable[[Any], None]) -> None:
+        """Call ``callback(data)`` for every event on the topics, across reconnects.
+
+        Callbacks run on the reader thread, so they must not wait on requests.
+        """
+        topics = list(topics)
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, []).append(callback)
+            connected = self._sock is not None
+        if connected:
+            self.notify('subscribe', {'topics': topics})
+            return
+        try:
+            self._connect()
+        except IPCError:
+            with self._lock:
+                if self._reconnecting or self._closed:
+                    return
+                self._reconnecting = True
+            threading.Thread(target=self._reconnect, name='bot-ipc-reconnect', daemon=True).start()
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ipc_client() -> IPCClient:
+    """Get the process-wide bot IPC client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = IPCClient()
+    return _client
@@ -0,0 +1,158 @@
+"""
+Live updates for guilds that have open event streams.
+
+The dashboard's own write paths report changes here as they happen. The
+bot writes from its own process, so its changes are picked up by
+``poll()``, which open streams call while they wait: at most once per
+LIVE_POLL_INTERVAL seconds for the whole process it checks the settings
+watcher and reads the activity entries added since the last poll for the
+watched guilds, with one indexed query. Nothing is read for guilds
+without subscribers.
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from .storage import get_watcher
+from .counters import counters
+from .activity import get_activity_store
+from .events import event_bus
+
+logger = logging.getLogger(__name__)
+
+# Settings fields streamed as 'settings' events when they change
+LIVE_FIELDS = ('prefix', 'prefixes', 'cogs', 'log_channel', 'name', 'icon', 'member_count')
+# Counter fields streamed as 'counters' events
+COUNTER_FIELDS = ('command_count', 'mod_actions')
+
+RECENT_ACTIVITY_IDS = 256
+
+
+class LiveUpdates:
+    """Turns settings and activity changes into events for subscribed guilds"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval if interval is not None else float(os.getenv('LIVE_POLL_INTERVAL', '1'))
+        self._snapshots = {}  # guild_id -> the fields subscribers last saw
+        self._published = {}  # guild_id -> ids of activity entries already sent
+        self._activity_cursor = None
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._last_poll = 0.0
+        get_watcher().subscribe(self._on_settings_changed)
+
+    def watch(self, guild_id: str) -> None:
+        """Remember what a guild looks like now, before its first events"""
+        guild_id = str(guild_id)
+        if self._activity_cursor is None:
+            self._activity_cursor = get_activity_store().latest_id()
+        with self._lock:
+            if guild_id in self._snapshots:
+                return
+        settings = counters.get_settings(guild_id)
+        with self._lock:
+            snapshot = {key: settings.get(key) for key in LIVE_FIELDS}
+            snapshot.update((key, settings.get(key, 0)) for key in COUNTER_FIELDS)
+            self._snapshots.setdefault(guild_id, snapshot)
+
+    # -- write paths ----------------------------------------------------------
+
+    def settings_changed(self, guild_id: str, settings: Dict[str, Any], exact_counters: bool = False) -> None:
+        """Publish the fields that differ from what subscribers last saw.
+
+        Counter totals are only compared when ``settings`` includes the
+        counters' pending increments.
+        """
+        guild_id = str(guild_id)
+        if not event_bus.has_subscribers(guild_id):
+            return
+        with self._lock:
+            snapshot = self._snapshots.setdefault(guild_id, {})
+            changed = {key: settings.get(key) for key in LIVE_FIELDS
+                       if key in settings and snapshot.get(key) != settings.get(key)}
+            totals = {}
+            if exact_counters:
+                totals = {key: settings.get(key, 0) for key in COUNTER_FIELDS}
+                if all(snapshot.get(key) == value for key, value in totals.items()):
+                    totals = {}
+            snapshot.update(changed)
+            snapshot.update(totals)
+        if changed:
+            event_bus.publish(guild_id, 'settings', changed)
+        if totals:
+            event_bus.publish(guild_id, 'counters', {'totals': totals})
+
+    def activity_added(self, guild_id: str, entry: Dict[str, Any]) -> None:
+        """Publish an activity entry written by this process"""
+        guild_id = str(guild_id)
+        if not event_bus.has_subscribers(guild_id):
+            return
+        with self._lock:
+            self._published.setdefault(guild_id, deque(maxlen=RECENT_ACTIVITY_IDS)).append(entry['id'])
+        event_bus.publish(guild_id, 'activity', entry)
+
+    # -- other processes ------------------------------------------------------
+
+    def _on_settings_changed(self, guild_ids: Optional[List[str]]) -> None:
+        watched = event_bus.watched_guilds()
+        if guild_ids is not None:
+            changed = set(guild_ids)
+            watched = [guild_id for guild_id in watched if guild_id in changed]
+        for guild_id in watched:
+            self.settings_changed(guild_id, counters.get_settings(guild_id), exact_counters=True)
+
+    def _poll_activity(self, watched: Iterable[str]) -> None:
+        store = get_activity_store()
+        latest = store.latest_id()
+        if self._activity_cursor is None:
+            self._activity_cursor = latest
+            return
+        entries = store.entries_between(self._activity_cursor, latest, list(watched))
+        self._activity_cursor = latest
+        for guild_id, entry in entries:
+            with self._lock:
+                published = self._published.setdefault(guild_id, deque(maxlen=RECENT_ACTIVITY_IDS))
+                if entry['id'] in published:
+                    continue
+                published.append(entry['id'])
+            event_bus.publish(guild_id, 'activity', entry)
+
+    def poll(self) -> None:
+        """Pick up changes from other processes, at most once per interval"""
+        now = time.monotonic()
+        if now - self._last_poll < self.interval:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return  # another stream is already polling
+        try:
+            self._last_poll = now
+            watched = set(event_bus.watched_guilds())
+            with self._lock:
+                # Forget guilds whose streams have all closed
+                for state in (self._snapshots, self._published):
+                    for guild_id in [g for g in state if g not in watched]:
+                        del state[guild_id]
+            get_watcher().check(force=True)
+            self._poll_activity(watched)
+        except Exception:
+            logger.exception("Error polling for live updates")
+        finally:
+            self._poll_lock.release()
+
+
+_live = None
+_live_lock = threading.Lock()
+
+
+def get_live_updates() -> LiveUpdates:
+    """Get the process-wide live update publisher, creating it on first use"""
+    global _live
+    if _live is None:
+        with _live_lock:
+            if _live is None:
+                _live = LiveUpdates()
+    return _live
@@ -0,0 +1,166 @@
+"""
+Logging setup shared by the bot and the dashboard.
+
+Loggers hand their records to a queue and return; a single listener
+thread formats them and writes them out, so neither request threads nor
+the bot's event loop wait on formatting or stdout. Output is one
+``key=value`` line per record (or plain text with LOG_FORMAT=text).
+
+- ``LOG_LEVEL`` - root level (default ``INFO``)
+- ``LOG_LEVELS`` - per-logger levels, e.g. ``dashboard.app=DEBUG,discord=WARNING``
+- ``LOG_FORMAT`` - ``kv`` (default) or ``text``
+- ``LOG_MAX_FIELD`` - longest value written before it is truncated (default 512)
+- ``LOG_PAYLOAD_SAMPLE`` - fraction of records carrying a ``payload()`` that are kept (default 1)
+
+Wrap large objects in ``payload()`` and pass them as arguments rather than
+formatting them into the message: they are only serialized, and cut to
+LOG_MAX_FIELD, by the listener and only if the record is emitted.
+"""
+
+import os
+import sys
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from typing import Any, Dict, Optional
+
+from . import serialization
+
+MAX_FIELD = int(os.getenv('LOG_MAX_FIELD', '512'))
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def truncate(text: str, limit: int = MAX_FIELD) -> str:
+    if limit and len(text) > limit:
+        return f"{text[:limit]}...({len(text) - limit} more)"
+    return text
+
+
+class payload:
+    """A log argument that is serialized and truncated only when emitted"""
+
+    __slots__ = ('obj', 'limit')
+
+    def __init__(self, obj: Any, limit: int = MAX_FIELD):
+        self.obj = obj
+        self.limit = limit
+
+    def __str__(self) -> str:
+        try:
+            text = serialization.dumps(self.obj, default=str)
+        except Exception:
+            text = repr(self.obj)
+        return truncate(text, self.limit)
+
+    __repr__ = __str__
+
+
+def _has_payload(record: logging.LogRecord) -> bool:
+    args = record.args
+    if isinstance(args, dict):
+        args = args.values()
+    return any(isinstance(arg, payload) for arg in args or ())
+
+
+class PayloadSampler(logging.Filter):
+    """Keep only a fraction of the records that log a payload"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or not _has_payload(record):
+            return True
+        return random.random() < self.rate
+
+
+def _quote(value: str) -> str:
+    if value and not any(c in value for c in ' "=\n\t'):
+        return value
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\t', '\\t') + '"'
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Format records as ``ts=... level=... logger=... msg=... key=value``"""
+
+    def __init__(self, max_field: int = MAX_FIELD):
+        super().__init__()
+        self.max_field = max_field
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                fields[key] = value
+        if record.exc_info:
+            # Tracebacks are kept whole
+            fields['exc'] = self.formatException(record.exc_info)
+        return ' '.join(f"{key}={_quote(value if key == 'exc' else truncate(str(value), self.max_field))}"
+                        for key, value in fields.items())
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records untouched so the listener thread does all the formatting"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse ``name=LEVEL,name=LEVEL`` into logger names and levels"""
+    levels = {}
+    for item in spec.split(','):
+        name, sep, level = item.partition('=')
+        if not sep or not name.strip():
+            continue
+        level = logging.getLevelName(level.strip().upper())
+        if isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging() -> None:
+    """Route all logging through the background listener (safe to call more than once)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        if os.getenv('LOG_FORMAT', 'kv').lower() == 'text':
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        else:
+            formatter = KeyValueFormatter()
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(formatter)
+
+        records = queue.SimpleQueue()
+        handler = DeferredQueueHandler(records)
+        handler.addFilter(PayloadSampler(float(os.getenv('LOG_PAYLOAD_SAMPLE', '1'))))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        for name, level in parse_levels(os.getenv('LOG_LEVELS', '')).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
@@ -0,0 +1,129 @@
+"""
+In-memory command prefix index for the bot.
+
+All guild prefixes are loaded once into a dict of ready-made tuples, so
+resolving the prefixes for a message is a single dict lookup with no file
+I/O and no logging. Guilds can have several prefixes (``prefixes`` list in
+their settings, or the single ``prefix``), and mentioning the bot works as
+a prefix unless a guild turns ``mention_prefix`` off. Prefixes that only
+exist in the legacy prefixes.json are kept alongside the stored settings
+and used for guilds whose settings don't set one.
+"""
+
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+DEFAULT_PREFIX = '?'
+
+
+def prefixes_from_settings(settings: Dict[str, Any], default: str = DEFAULT_PREFIX) -> Tuple[str, ...]:
+    """Get the configured prefixes from a guild's settings"""
+    prefixes = settings.get('prefixes')
+    if not prefixes:
+        prefixes = [settings.get('prefix') or default]
+    # Drop empty and duplicate prefixes but keep the configured order
+    return tuple(dict.fromkeys(p for p in prefixes if p))
+
+
+class PrefixResolver:
+    """Maps guild IDs to the full tuple of prefixes the bot should accept"""
+
+    def __init__(self, default: str = DEFAULT_PREFIX):
+        self.default = default
+        self._configured = {}   # guild_id (int) -> configured prefixes
+        self._mention_off = set()
+        self._legacy = {}       # guild_id (int) -> prefix from prefixes.json
+        self._mentions = ()
+        self._index = {}        # guild_id (int) -> compiled prefixes
+        self._default_compiled = self._compile((default,), True)
+        self._lock = threading.Lock()
+
+    def _compile(self, prefixes: Tuple[str, ...], mention: bool) -> Tuple[str, ...]:
+        compiled = prefixes + self._mentions if mention else prefixes
+        # Longest first so '!!' isn't shadowed by '!'
+        return tuple(sorted(compiled, key=len, reverse=True))
+
+    def _store(self, guild_id: int, settings: Dict[str, Any]) -> None:
+        legacy = self._legacy.get(guild_id)
+        if legacy and 'prefix' not in settings and 'prefixes' not in settings:
+            settings = dict(settings, prefix=legacy)
+        self._configured[guild_id] = prefixes_from_settings(settings, self.default)
+        if settings.get('mention_prefix', True):
+            self._mention_off.discard(guild_id)
+        else:
+            self._mention_off.add(guild_id)
+        self._index[guild_id] = self._compile(self._configured[guild_id],
+                                              guild_id not in self._mention_off)
+
+    def set_user(self, user_id: int) -> None:
+        """Enable mention prefixes for the bot user and recompile every guild"""
+        with self._lock:
+            self._mentions = (f'<@{user_id}> ', f'<@!{user_id}> ')
+            self._default_compiled = self._compile((self.default,), True)
+            self._index = {
+                guild_id: self._compile(prefixes, guild_id not in self._mention_off)
+                for guild_id, prefixes in self._configured.items()
+            }
+
+    def load(self, all_settings: Dict[str, Dict[str, Any]], legacy: Optional[Dict[str, str]] = None) -> None:
+        """Replace the whole index from every guild's settings.
+
+        ``legacy`` replaces the prefixes.json prefixes; when it is None the
+        ones loaded before are kept.
+        """
+        with self._lock:
+            if legacy is not None:
+                self._legacy = {int(guild_id): prefix for guild_id, prefix in legacy.items() if prefix}
+            self._configured = {}
+            self._mention_off = set()
+            self._index = {}
+            for guild_id, settings in all_settings.items():
+                self._store(int(guild_id), settings)
+            for guild_id in self._legacy.keys() - self._configured.keys():
+                self._store(guild_id, {})
+
+    def update(self, guild_id, settings: Dict[str, Any]) -> None:
+        """Recompile one guild from its settings"""
+        with self._lock:
+            self._store(int(guild_id), settings)
+
+    def set(self, guild_id, prefixes: Iterable[str]) -> None:
+        """Set the prefixes for one guild, keeping its mention setting"""
+        with self._lock:
+            guild_id = int(guild_id)
+            self._store(guild_id, {'prefixes': list(prefixes),
+                                   'mention_prefix': guild_id not in self._mention_off})
+
+    def remove(self, guild_id) -> None:
+        """Forget a guild so it falls back to the default prefix"""
+        with self._lock:
+            guild_id = int(guild_id)
+            self._configured.pop(guild_id, None)
+            self._mention_off.discard(guild_id)
+            self._index.pop(guild_id, None)
+
+    def refresh(self, storage, guild_ids: Optional[List[str]] = None) -> None:
+        """Reload changed guilds from storage (everything if guild_ids is None)"""
+        if guild_ids is None:
+            self.load(storage.all())
+            return
+        for guild_id in guild_ids:
+            settings = storage.get(guild_id)
+            if settings or int(guild_id) in self._legacy:
+                self.update(guild_id, settings or {})
+            else:
+                self.remove(guild_id)
+
+    def prefixes_for(self, guild_id) -> Tuple[str, ...]:
+        """Get the configured prefixes for a guild (without mentions)"""
+        return self._configured.get(int(guild_id), (self.default,))
+
+    def resolve(self, message) -> Tuple[str, ...]:
+        """Get every prefix that may start a command in this message"""
+        guild = message.guild
+        if guild is None:
+            return self._default_compiled
+        return self._index.get(guild.id, self._default_compiled)
+
+    def __len__(self) -> int:
+        return len(self._index)
@@ -0,0 +1,266 @@
+"""
+Discord rate limit buckets, shared by every dashboard worker.
+
+Discord answers each request with the bucket its route belongs to and how
+many requests that bucket has left before it resets (the X-RateLimit-*
+headers). RateLimiter keeps that state in a small SQLite database
+(dashboard/ratelimit.db by default, or DISCORD_RATELIMIT_DB) so all worker
+processes see it. Before a request is sent a slot is reserved in its
+bucket; when the bucket is empty the caller waits for the reset, or gets
+a 429 right away when that would take longer than
+DISCORD_RATELIMIT_MAX_WAIT seconds, instead of Discord counting another
+429 against the application.
+
+Buckets are tracked per route, major parameter (the guild, channel or
+webhook ID in the path) and token, since user OAuth tokens each get their
+own limits. Usage counters and bucket utilization are reported by
+``metrics()`` for /api/metrics/discord.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DASHBOARD_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Path segments whose ID gets its own buckets
+MAJOR_PARAMETERS = ('guilds', 'channels', 'webhooks')
+
+# Counters reported in the metrics
+COUNTERS = ('requests', 'throttled', 'throttled_seconds', 'rejected',
+            'responses_429_user', 'responses_429_shared', 'responses_429_global')
+
+
+def route_key(method: str, path: str) -> Tuple[str, str]:
+    """Get (route, major parameter) for an API path, like ('GET guilds/{id}', '1234')"""
+    parts = path.split('?', 1)[0].strip('/').split('/')
+    route = []
+    major = ''
+    for i, part in enumerate(parts):
+        if part.isdigit():
+            if not major and i and parts[i - 1] in MAJOR_PARAMETERS:
+                major = part
+            part = '{id}'
+        route.append(part)
+    return f'{method.upper()} {"/".join(route)}', major
+
+
+class RateLimiter:
+    """Reserve request slots in Discord's rate limit buckets and learn them from responses"""
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._updates = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                     check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=OFF')  # losing this state only costs a few 429s
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS routes ('
+            'route TEXT PRIMARY KEY, '
+            'bucket TEXT NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'key TEXT PRIMARY KEY, '
+            'bucket TEXT NOT NULL, '
+            'route TEXT NOT NULL, '
+            'max_requests INTEGER NOT NULL, '
+            'remaining INTEGER NOT NULL, '
+            'reset_at REAL NOT NULL, '
+            'window REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'name TEXT PRIMARY KEY, '
+            'value REAL NOT NULL)'
+        )
+
+    # -- helpers (callers hold _lock and a transaction) -----------------------
+
+    def _bucket_key(self, route: str, major: str, identity: str) -> Tuple[str, str]:
+        row = self._conn.execute('SELECT bucket FROM routes WHERE route = ?', (route,)).fetchone()
+        # Until Discord names the route's bucket, the route is its own bucket
+        bucket = row[0] if row else route
+        return f'{bucket}:{major}:{identity}', bucket
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        self._conn.execute(
+            'INSERT INTO state (name, value) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+            (name, amount)
+        )
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(*args)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    # -- reserving ---------------------------------------------------------------
+
+    def _reserve(self, route: str, major: str, identity: str) -> float:
+        """Take a slot and return 0, or return the seconds until one frees up"""
+        now = time.time()
+        row = self._conn.execute("SELECT value FROM state WHERE name = 'global_until'").fetchone()
+        if row and row[0] > now:
+            return row[0] - now
+
+        key, _ = self._bucket_key(route, major, identity)
+        row = self._conn.execute(
+            'SELECT max_requests, remaining, reset_at, window FROM buckets WHERE key = ?', (key,)
+        ).fetchone()
+        if row is not None:
+            max_requests, remaining, reset_at, window = row
+            if reset_at <= now:
+                # A new window; assume it is as long as the last one until Discord says
+                self._conn.execute('UPDATE buckets SET remaining = ?, reset_at = ? WHERE key = ?',
+                                   (max_requests - 1, now + window, key))
+            elif remaining > 0:
+                self._conn.execute('UPDATE buckets SET remaining = remaining - 1 WHERE key = ?', (key,))
+            else:
+                return reset_at - now
+        self._count('requests')
+        return 0.0
+
+    def acquire(self, route: str, major: str, identity: str, max_wait: float) -> float:
+        """Reserve a slot for a request, sleeping while its bucket is empty.
+
+        Returns 0 once a slot is reserved, or the seconds the caller would
+        still have to wait when that is more than ``max_wait`` in total.
+        """
+        waited = 0.0
+        while True:
+            wait = self._transaction(self._reserve, route, major, identity)
+            if wait <= 0:
+                if waited:
+                    self._transaction(self._count_throttled, waited)
+                return 0.0
+            if waited + wait > max_wait:
+                self._transaction(self._count, 'rejected')
+                return wait
+            time.sleep(wait)
+            waited += wait
+
+    def _count_throttled(self, waited: float) -> None:
+        self._count('throttled')
+        self._count('throttled_seconds', waited)
+
+    # -- learning from responses -------------------------------------------------
+
+    def _update(self, route: str, major: str, identity: str, status: int,
+                headers: Dict[str, str], retry_after: Optional[float]) -> None:
+        now = time.time()
+        bucket = headers.get('X-RateLimit-Bucket')
+        if bucket:
+            old_key, old_bucket = self._bucket_key(route, major, identity)
+            if old_bucket != bucket:
+                self._conn.execute('INSERT OR REPLACE INTO routes (route, bucket) VALUES (?, ?)',
+                                   (route, bucket))
+                self._conn.execute('DELETE FROM buckets WHERE key = ?', (old_key,))
+        key, bucket = self._bucket_key(route, major, identity)
+
+        limit = headers.get('X-RateLimit-Limit')
+        if limit is not None:
+            remaining = int(headers.get('X-RateLimit-Remaining', 0))
+            reset_after = float(headers.get('X-RateLimit-Reset-After', 1))
+            reset_at = now + reset_after
+            row = self._conn.execute('SELECT remaining, reset_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            if row is not None and abs(row[1] - reset_at) < 1:
+                # Same window: slots reserved by requests still in flight stay taken
+                remaining = min(remaining, row[0])
+            self._conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, bucket, route, max_requests, remaining, reset_at, window) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, bucket, route, int(limit), remaining, reset_at, max(reset_after, 1.0))
+            )
+
+        if status == 429:
+            retry_after = retry_after if retry_after is not None else float(headers.get('Retry-After', 1))
+            scope = headers.get('X-RateLimit-Scope', 'user')
+            if headers.get('X-RateLimit-Global', '').lower() == 'true':
+                scope = 'global'
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO state (name, value) VALUES ('global_until', ?)",
+                    (now + retry_after,)
+                )
+            else:
+                self._conn.execute(
+                    'INSERT INTO buckets (key, bucket, route, max_requests, remaining, reset_at, window) '
+                    'VALUES (?, ?, ?, 1, 0, ?, ?) '
+                    'ON CONFLICT (key) DO UPDATE SET remaining = 0, reset_at = MAX(reset_at, excluded.reset_at)',
+                    (key, bucket, route, now + retry_after, max(retry_after, 1.0))
+                )
+            self._count(f'responses_429_{scope if scope in ("user", "shared", "global") else "user"}')
+
+        self._updates += 1
+        if self._updates % 500 == 0:
+            # Forget buckets nobody has used for a while (mostly expired user tokens)
+            self._conn.execute('DELETE FROM buckets WHERE reset_at < ?', (now - 600,))
+
+    def update(self, route: str, major: str, identity: str, status: int,
+               headers: Dict[str, str], retry_after: Optional[float] = None) -> None:
+        """Record the rate limit headers of a response"""
+        self._transaction(self._update, route, major, identity, status, headers, retry_after)
+
+    # -- metrics -----------------------------------------------------------------
+
+    def metrics(self) -> Dict[str, Any]:
+        """Get usage counters and the utilization of every active bucket"""
+        now = time.time()
+        with self._lock:
+            counters = dict(self._conn.execute('SELECT name, value FROM state').fetchall())
+            rows = self._conn.execute(
+                'SELECT bucket, route, max_requests, remaining FROM buckets WHERE reset_at > ?', (now,)
+            ).fetchall()
+
+        buckets = {}
+        for bucket, route, max_requests, remaining in rows:
+            stats = buckets.setdefault(bucket, {
+                'bucket': bucket, 'routes': set(), 'limit': max_requests,
+                'windows': 0, 'exhausted': 0, 'max_utilization': 0.0
+            })
+            stats['routes'].add(route)
+            stats['windows'] += 1
+            stats['exhausted'] += remaining <= 0
+            used = (max_requests - max(remaining, 0)) / max_requests if max_requests else 1.0
+            stats['max_utilization'] = max(stats['max_utilization'], round(used, 3))
+        for stats in buckets.values():
+            stats['routes'] = sorted(stats['routes'])
+
+        global_until = counters.pop('global_until', 0)
+        return {
+            'counters': {name: counters.get(name, 0) for name in COUNTERS},
+            'global_blocked_for': max(0.0, global_until - now),
+            'buckets': sorted(buckets.values(), key=lambda b: b['max_utilization'], reverse=True),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter, creating it on first use"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(os.getenv('DISCORD_RATELIMIT_DB', os.path.join(DASHBOARD_DIR, 'ratelimit.db')))
+    return _limiter
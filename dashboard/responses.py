@@ -0,0 +1,61 @@
+"""
+Conditional GET and compression for the dashboard's JSON API.
+
+Every successful JSON response from /api/ gets an ETag hashed from its
+body, so a poll that finds nothing new is answered with an empty 304.
+Bodies of at least COMPRESS_MIN_SIZE bytes are compressed with brotli
+(when the brotli package is installed) or gzip, whichever the client
+prefers. The ETags are weak, since the same data is sent in several
+encodings.
+"""
+
+import os
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(COMPRESS_LEVEL, 11))
+    return gzip.compress(body, compresslevel=min(max(COMPRESS_LEVEL, 1), 9), mtime=0)
+
+
+def choose_encoding(accept_encodings) -> str:
+    """Pick the best encoding the client accepts, or '' for none"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(offered) or ''
+
+
+def finalize_json_response(response, request):
+    """Tag, revalidate and compress a JSON API response"""
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+            or response.mimetype != 'application/json' or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    if response.get_etag()[0] is None:
+        response.set_etag(hashlib.sha1(body).hexdigest(), weak=True)
+    if not response.cache_control.public:
+        # Per-user data: browsers may keep it but must revalidate every time
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+    response = response.make_conditional(request)
+    if response.status_code != 200:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings) if len(body) >= COMPRESS_MIN_SIZE else ''
+    if encoding:
+        response.set_data(_compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,88 @@
+"""
+One JSON encoder for settings, activity, prefixes and API responses.
+
+Output is always compact (no indentation or spaces after separators) and
+UTF-8. orjson is used when it is installed and the standard library json
+module otherwise; set JSON_SERIALIZER=json to force the standard library.
+Both produce JSON that either one can read back.
+"""
+
+import os
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibSerializer:
+    """Compact encoding through the standard library json module"""
+
+    name = 'json'
+
+    def dumps(self, obj: Any, default: Optional[Callable] = None) -> str:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=default)
+
+    def dumpb(self, obj: Any, default: Optional[Callable] = None) -> bytes:
+        return self.dumps(obj, default).encode('utf-8')
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    """orjson encoding, several times faster than the standard library"""
+
+    name = 'orjson'
+
+    def dumps(self, obj: Any, default: Optional[Callable] = None) -> str:
+        return self.dumpb(obj, default).decode('utf-8')
+
+    def dumpb(self, obj: Any, default: Optional[Callable] = None) -> bytes:
+        # Integer dict keys are written as strings, like the json module does
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+def get_serializer(name: Optional[str] = None):
+    """Get a serializer by name, defaulting to the fastest one available"""
+    name = (name or os.getenv('JSON_SERIALIZER', 'orjson' if orjson else 'json')).lower()
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError("JSON_SERIALIZER is orjson but orjson isn't installed")
+        return OrjsonSerializer()
+    if name == 'json':
+        return StdlibSerializer()
+    raise ValueError(f"Unknown JSON serializer: {name}")
+
+
+serializer = get_serializer()
+
+
+def dumps(obj: Any, default: Optional[Callable] = None) -> str:
+    """Encode obj as a compact JSON string"""
+    return serializer.dumps(obj, default)
+
+
+def dumpb(obj: Any, default: Optional[Callable] = None) -> bytes:
+    """Encode obj as compact UTF-8 JSON bytes"""
+    return serializer.dumpb(obj, default)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode a JSON string or bytes"""
+    return serializer.loads(data)
+
+
+def load(f) -> Any:
+    """Decode a whole file opened in text or binary mode"""
+    return serializer.loads(f.read())
+
+
+def dump(obj: Any, f) -> None:
+    """Encode obj into a file opened in binary mode"""
+    f.write(serializer.dumpb(obj))
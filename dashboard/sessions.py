@@ -0,0 +1,87 @@
+"""
+Server-side sessions for the dashboard.
+
+Sessions are kept by Flask-Session (on disk by default), so the cookie
+only carries a signed session ID. Each session holds the user's OAuth
+tokens, when the access token expires, a few user fields for the page
+header and the user's manageable guilds, which are refetched from
+Discord at most once every SESSION_GUILDS_TTL seconds.
+
+- ``SESSION_TYPE`` - Flask-Session backend (default ``filesystem``)
+- ``SESSION_FILE_DIR`` - directory for the filesystem backend (default ``dashboard/flask_session``)
+- ``SESSION_FILE_THRESHOLD`` - sessions kept on disk before expired ones are pruned (default 10000)
+- ``SESSION_LIFETIME`` - seconds an unused session lives (default 7 days)
+- ``SESSION_GUILDS_TTL`` - seconds the session's guild list is reused (default 300)
+"""
+
+import os
+import time
+import datetime
+from typing import Any, Dict, List, Optional
+
+from flask_session import Session
+
+SESSION_GUILDS_TTL = float(os.getenv('SESSION_GUILDS_TTL', '300'))
+
+ADMINISTRATOR = 1 << 3
+
+# What the templates need from the Discord user and guild objects
+USER_FIELDS = ('id', 'username', 'global_name', 'avatar')
+GUILD_FIELDS = ('id', 'name', 'icon', 'owner', 'permissions')
+
+
+def init_sessions(app) -> None:
+    """Store the app's sessions server-side"""
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session')
+    app.config.update(
+        SESSION_TYPE=os.getenv('SESSION_TYPE', 'filesystem'),
+        SESSION_FILE_DIR=os.getenv('SESSION_FILE_DIR', default_dir),
+        SESSION_FILE_THRESHOLD=int(os.getenv('SESSION_FILE_THRESHOLD', '10000')),
+        SESSION_PERMANENT=True,
+        PERMANENT_SESSION_LIFETIME=datetime.timedelta(seconds=int(os.getenv('SESSION_LIFETIME', str(7 * 24 * 3600)))),
+        SESSION_USE_SIGNER=True,
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE='Lax',
+    )
+    Session(app)
+
+
+def session_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the user fields the dashboard shows"""
+    return {key: user.get(key) for key in USER_FIELDS}
+
+
+def store_tokens(session, tokens: Dict[str, Any]) -> None:
+    """Save an OAuth token response in the session"""
+    session['access_token'] = tokens['access_token']
+    if tokens.get('refresh_token'):
+        session['refresh_token'] = tokens['refresh_token']
+    session['expires_at'] = time.time() + float(tokens.get('expires_in', 0) or 0)
+
+
+def can_manage(guild: Dict[str, Any]) -> bool:
+    """Whether the user owns the guild or is an administrator in it"""
+    try:
+        permissions = int(guild.get('permissions') or 0)
+    except (TypeError, ValueError):
+        permissions = 0
+    return bool(guild.get('owner')) or bool(permissions & ADMINISTRATOR)
+
+
+def manageable_guilds(guilds: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filter a /users/@me/guilds list down to the guilds the user can manage"""
+    return [{key: guild.get(key) for key in GUILD_FIELDS} for guild in guilds if can_manage(guild)]
+
+
+def cached_guilds(session) -> Optional[List[Dict[str, Any]]]:
+    """Get the session's guild list, or None once it is older than SESSION_GUILDS_TTL"""
+    if time.time() - session.get('guilds_at', 0) > SESSION_GUILDS_TTL:
+        return None
+    return session.get('guilds')
+
+
+def store_guilds(session, guilds: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Cache the user's manageable guilds in the session and return them"""
+    session['guilds'] = manageable_guilds(guilds)
+    session['guilds_at'] = time.time()
+    return session['guilds']
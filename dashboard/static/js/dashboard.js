@@ -36,40 +36,41 @@ const api = {
         return response.json();
     },
 
-    async getGuildActivity(guildId) {
-        const response = await fetch(`${API_BASE}/guild/${guildId}/activity`);
+    async getGuildBundle(guildId) {
+        const response = await fetch(`${API_BASE}/guild/${guildId}/bundle`);
+        if (!response.ok) throw new Error('Failed to fetch guild data');
+        return response.json();
+    },
+
+    async getGuildActivity(guildId, before = null) {
+        const query = before ? `?before=${before}` : '';
+        const response = await fetch(`${API_BASE}/guild/${guildId}/activity${query}`);
         if (!response.ok) throw new Error('Failed to fetch activity');
         return response.json();
     },
 
-    async updateGuildPrefix(guildId, prefix) {
-        const response = await fetch(`${API_BASE}/guild/${guildId}/prefix`, {
-            method: 'POST',
+    // Any subset of prefix, cogs and log_channel, saved in one write
+    async updateGuildSettings(guildId, fields) {
+        const response = await fetch(`${API_BASE}/guild/${guildId}/settings`, {
+            method: 'PATCH',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ prefix })
+            body: JSON.stringify(fields)
         });
-        if (!response.ok) throw new Error('Failed to update prefix');
-        return response.json();
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error || 'Failed to update settings');
+        return result;
+    },
+
+    async updateGuildPrefix(guildId, prefix) {
+        return this.updateGuildSettings(guildId, { prefix });
     },
 
     async updateGuildCogs(guildId, cogs) {
-        const response = await fetch(`${API_BASE}/guild/${guildId}/cogs`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ cogs })
-        });
-        if (!response.ok) throw new Error('Failed to update cogs');
-        return response.json();
+        return this.updateGuildSettings(guildId, { cogs });
     },
 
     async updateLogChannel(guildId, channelId) {
-        const response = await fetch(`${API_BASE}/guild/${guildId}/log-channel`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ channel_id: channelId })
-        });
-        if (!response.ok) throw new Error('Failed to update log channel');
-        return response.json();
+        return this.updateGuildSettings(guildId, { log_channel: channelId || null });
     }
 };
 
@@ -91,10 +92,26 @@ const ui = {
         }, 100);
     },
 
+    stats: {},
+
     updateStats(stats) {
-        document.getElementById('member-count').textContent = formatNumber(stats.member_count || 0);
-        document.getElementById('command-count').textContent = formatNumber(stats.command_count || 0);
-        document.getElementById('mod-actions').textContent = formatNumber(stats.mod_actions || 0);
+        this.stats = {
+            member_count: stats.member_count || 0,
+            command_count: stats.command_count || 0,
+            mod_actions: stats.mod_actions || 0
+        };
+        document.getElementById('member-count').textContent = formatNumber(this.stats.member_count);
+        document.getElementById('command-count').textContent = formatNumber(this.stats.command_count);
+        document.getElementById('mod-actions').textContent = formatNumber(this.stats.mod_actions);
+    },
+
+    // Counter events carry either new totals or increments
+    applyCounters(counters) {
+        const stats = { ...this.stats, ...(counters.totals || {}) };
+        Object.entries(counters.delta || {}).forEach(([field, amount]) => {
+            stats[field] = (stats[field] || 0) + amount;
+        });
+        this.updateStats(stats);
     },
 
     updateActivityList(activities) {
@@ -106,20 +123,28 @@ const ui = {
             return;
         }
 
-        activities.forEach(activity => {
-            const activityItem = document.createElement('div');
-            activityItem.className = 'activity-item';
-            activityItem.innerHTML = `
-                <div class="activity-icon">
-                    <i class="fas ${this.getActivityIcon(activity.type)}"></i>
-                </div>
-                <div class="activity-details">
-                    <span class="activity-text">${activity.description}</span>
-                    <span class="activity-time">${formatDate(activity.timestamp)}</span>
-                </div>
-            `;
-            activityList.appendChild(activityItem);
-        });
+        activities.forEach(activity => activityList.appendChild(this.activityElement(activity)));
+    },
+
+    addActivity(activity) {
+        const activityList = document.getElementById('activity-list');
+        activityList.querySelector('.no-activity')?.remove();
+        activityList.prepend(this.activityElement(activity));
+    },
+
+    activityElement(activity) {
+        const activityItem = document.createElement('div');
+        activityItem.className = 'activity-item';
+        activityItem.innerHTML = `
+            <div class="activity-icon">
+                <i class="fas ${this.getActivityIcon(activity.type)}"></i>
+            </div>
+            <div class="activity-details">
+                <span class="activity-text">${activity.description}</span>
+                <span class="activity-time">${formatDate(activity.timestamp)}</span>
+            </div>
+        `;
+        return activityItem;
     },
 
     getActivityIcon(type) {
@@ -138,6 +163,29 @@ const ui = {
     }
 };
 
+// Live updates for the selected server
+const live = {
+    source: null,
+
+    connect(guildId) {
+        if (this.source) this.source.close();
+        if (!window.EventSource) return;
+
+        this.source = new EventSource(`${API_BASE}/guild/${guildId}/events?events=counters`);
+        this.source.addEventListener('activity', e => ui.addActivity(JSON.parse(e.data)));
+        this.source.addEventListener('counters', e => ui.applyCounters(JSON.parse(e.data)));
+        this.source.addEventListener('settings', e => {
+            const changed = JSON.parse(e.data);
+            if ('member_count' in changed) ui.applyCounters({ totals: { member_count: changed.member_count } });
+            handlers.updateSettings(changed);
+        });
+        // We missed events: load everything again
+        this.source.addEventListener('resync', () => {
+            handlers.handleServerSelect({ target: { value: guildId } });
+        });
+    }
+};
+
 // Event Handlers
 const handlers = {
     async handleServerSelect(event) {
@@ -145,35 +193,39 @@ const handlers = {
         if (!guildId) return;
 
         try {
-            const [settings, channels, activity] = await Promise.all([
-                api.getGuildSettings(guildId),
-                api.getGuildChannels(guildId),
-                api.getGuildActivity(guildId)
-            ]);
-
-            this.updateSettings(settings);
-            this.updateChannels(channels);
-            ui.updateStats(settings);
-            ui.updateActivityList(activity);
+            // Settings, channels, activity and guild info in one request
+            const bundle = await api.getGuildBundle(guildId);
+
+            this.updateChannels(bundle.channels);
+            this.updateSettings(bundle.settings);
+            ui.updateStats({ ...bundle.settings, member_count: bundle.guild.member_count });
+            ui.updateActivityList(bundle.activity.activity);
+            live.connect(guildId);
         } catch (error) {
             console.error('Error loading server data:', error);
             ui.showNotification('Failed to load server data', 'error');
         }
     },
 
+    // Takes full settings or just the fields that changed
     updateSettings(settings) {
         // Update prefix
-        document.getElementById('prefix-input').value = settings.prefix || '?';
+        if ('prefix' in settings) {
+            document.getElementById('prefix-input').value = settings.prefix || '?';
+        }
 
         // Update enabled cogs
-        settings.cogs.forEach(cog => {
-            const checkbox = document.querySelector(`input[name="cog"][value="${cog}"]`);
-            if (checkbox) checkbox.checked = true;
-        });
+        if ('cogs' in settings) {
+            document.querySelectorAll('input[name="cog"]').forEach(checkbox => {
+                checkbox.checked = settings.cogs.includes(checkbox.value);
+            });
+        }
 
         // Update log channel
-        const channelSelect = document.getElementById('channel-select');
-        channelSelect.value = settings.log_channel || '';
+        if ('log_channel' in settings) {
+            const channelSelect = document.getElementById('channel-select');
+            channelSelect.value = settings.log_channel || '';
+        }
     },
 
     updateChannels(channels) {
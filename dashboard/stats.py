@@ -0,0 +1,118 @@
+"""
+Bot-wide totals for /api/stats, kept up to date incrementally.
+
+The totals are built from the guild summaries once per process. After
+that the settings watcher reports which guilds changed and only their
+contributions are re-read, so serving the totals doesn't depend on the
+number of guilds. Counter increments this process hasn't rolled up into
+storage yet are added on top; another process's pending increments are
+only counted after its next rollup. This process's rollups are applied
+to the totals as they commit, rather than on the next watcher poll, so
+the totals never dip between a rollup and the watcher noticing it.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .storage import get_storage, get_watcher
+from .counters import counters
+
+# (commands, mod actions, users) for one guild
+Contribution = Tuple[int, int, int]
+
+
+def _contribution(settings: Dict[str, Any]) -> Contribution:
+    return (
+        settings.get('command_count', 0) or 0,
+        settings.get('mod_actions', 0) or 0,
+        settings.get('member_count', 0) or 0,
+    )
+
+
+class GlobalStats:
+    """Server, command, moderation action and user totals across every guild"""
+
+    def __init__(self, storage=None, watcher=None):
+        self._storage = storage or get_storage()
+        self._watcher = watcher or get_watcher()
+        self._lock = threading.Lock()
+        self._guilds = {}  # guild_id -> Contribution
+        self._totals = [0, 0, 0]
+        self._stale = True
+        self._watcher.subscribe(self._on_settings_changed)
+        counters.on_rollup(self._on_rollup)
+
+    def _rebuild(self) -> None:
+        """Sum every guild's summary (caller holds _lock)"""
+        self._guilds = {guild_id: _contribution(summary)
+                        for guild_id, summary in self._storage.summaries().items()}
+        self._totals = [sum(column) for column in zip(*self._guilds.values())] or [0, 0, 0]
+        self._stale = False
+
+    def _replace(self, guild_id: str, contribution: Optional[Contribution]) -> None:
+        old = self._guilds.pop(guild_id, (0, 0, 0))
+        if contribution is not None:
+            self._guilds[guild_id] = contribution
+        new = contribution or (0, 0, 0)
+        for i in range(3):
+            self._totals[i] += new[i] - old[i]
+
+    def _on_settings_changed(self, guild_ids: Optional[List[str]]) -> None:
+        if guild_ids is None:
+            with self._lock:
+                self._stale = True
+            return
+
+        # Read outside our lock, then swap the guilds' contributions in. A
+        # rollup landing in between would be overwritten by the older read.
+        with counters.holding_rollups():
+            updates = {}
+            for guild_id in guild_ids:
+                settings = self._storage.get(guild_id)
+                updates[guild_id] = _contribution(settings) if settings else None
+            with self._lock:
+                if not self._stale:
+                    for guild_id, contribution in updates.items():
+                        self._replace(guild_id, contribution)
+
+    def _on_rollup(self, guild_id: str, deltas: Dict[str, int]) -> None:
+        """Move deltas that just left the pending counters into the totals"""
+        with self._lock:
+            if self._stale:
+                return  # the rebuild reads them from storage
+            commands, mod_actions, users = self._guilds.get(guild_id, (0, 0, 0))
+            self._replace(guild_id, (commands + deltas.get('command_count', 0),
+                                     mod_actions + deltas.get('mod_actions', 0),
+                                     users))
+
+    def totals(self) -> Dict[str, int]:
+        """Get the current totals in the shape /api/stats returns"""
+        self._watcher.check()
+        # Read the totals and the pending counts without a rollup in between
+        with counters.holding_rollups():
+            with self._lock:
+                if self._stale:
+                    self._rebuild()
+                servers = len(self._guilds)
+                commands, mod_actions, users = self._totals
+            pending = counters.pending_totals()
+        return {
+            'servers': servers,
+            'commands': commands + pending.get('command_count', 0),
+            'modActions': mod_actions + pending.get('mod_actions', 0),
+            'users': users
+        }
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_global_stats() -> GlobalStats:
+    """Get the process-wide stats aggregate, creating it on first use"""
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = GlobalStats()
+    return _stats
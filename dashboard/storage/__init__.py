@@ -0,0 +1,118 @@
+"""
+Guild settings storage shared by the bot and the dashboard.
+
+The backend is picked with the SETTINGS_BACKEND environment variable:
+``sqlite`` (default) keeps one row per guild in dashboard/settings.db,
+``journal`` keeps a snapshot plus an append-only change journal,
+``sharded`` keeps one JSON file per guild under dashboard/settings.d and
+``json`` keeps the original single dashboard/settings.json file. The
+SQLite, journal and sharded backends import settings.json and
+prefixes.json the first time they are opened.
+"""
+
+import os
+import threading
+import logging
+from typing import Optional
+
+from .base import SettingsStorage, SUMMARY_FIELDS
+from .json_file import JSONFileStorage
+from .mapped import MappedJSONFileStorage
+from .sqlite import SQLiteStorage
+from .journal import JournalStorage
+from .sharded import ShardedFileStorage
+from .cache import WriteBehindCache
+from .watch import SettingsWatcher
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(DASHBOARD_DIR)
+
+SETTINGS_JSON = os.path.join(DASHBOARD_DIR, 'settings.json')
+PREFIXES_JSON = os.path.join(ROOT_DIR, 'prefixes.json')
+
+BACKENDS = {
+    'json': JSONFileStorage,
+    'sqlite': SQLiteStorage,
+    'journal': JournalStorage,
+    'sharded': ShardedFileStorage,
+}
+
+_storage = None
+_watcher = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend: Optional[str] = None) -> SettingsStorage:
+    """Create a storage backend from the environment configuration"""
+    backend = (backend or os.getenv('SETTINGS_BACKEND', 'sqlite')).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown settings backend: {backend}")
+
+    if backend == 'json':
+        # SETTINGS_MMAP=1 reads single guilds through a memory map and byte index
+        json_class = MappedJSONFileStorage if os.getenv('SETTINGS_MMAP', '0') == '1' else JSONFileStorage
+        return json_class(os.getenv('SETTINGS_FILE', SETTINGS_JSON))
+
+    if backend == 'journal':
+        storage = JournalStorage(os.getenv('SETTINGS_SNAPSHOT', os.path.join(DASHBOARD_DIR, 'settings.snapshot.json')))
+    elif backend == 'sharded':
+        storage = ShardedFileStorage(os.getenv('SETTINGS_DIR', os.path.join(DASHBOARD_DIR, 'settings.d')))
+    else:
+        storage = SQLiteStorage(os.getenv('SETTINGS_DB', os.path.join(DASHBOARD_DIR, 'settings.db')))
+    imported = storage.migrate_from_json(os.getenv('SETTINGS_FILE', SETTINGS_JSON), PREFIXES_JSON)
+    if imported:
+        logger.info("Imported %s guilds from settings.json into the %s backend", imported, storage.name)
+    return storage
+
+
+def get_storage() -> SettingsStorage:
+    """Get the process-wide storage backend, creating it on first use"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+
+def get_watcher() -> SettingsWatcher:
+    """Get the process-wide change watcher for the shared storage backend"""
+    global _watcher
+    if _watcher is None:
+        storage = get_storage()
+        with _storage_lock:
+            if _watcher is None:
+                _watcher = SettingsWatcher(storage)
+    return _watcher
+
+
+def close_storage() -> None:
+    """Close the process-wide storage backend"""
+    global _storage, _watcher
+    with _storage_lock:
+        if _watcher is not None:
+            _watcher.close()
+            _watcher = None
+        if _storage is not None:
+            _storage.close()
+            _storage = None
+
+
+__all__ = [
+    'SettingsStorage',
+    'SUMMARY_FIELDS',
+    'JSONFileStorage',
+    'MappedJSONFileStorage',
+    'SQLiteStorage',
+    'JournalStorage',
+    'ShardedFileStorage',
+    'WriteBehindCache',
+    'SettingsWatcher',
+    'BACKENDS',
+    'create_storage',
+    'get_storage',
+    'get_watcher',
+    'close_storage',
+]
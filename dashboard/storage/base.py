@@ -0,0 +1,78 @@
+from typing import Dict, Any, List, Optional
+
+# Fields that stats and server listings need, see SettingsStorage.summaries()
+SUMMARY_FIELDS = ('name', 'icon', 'member_count', 'command_count', 'mod_actions', 'prefix')
+
+
+class SettingsStorage:
+    """Base class for guild settings backends.
+
+    Every backend stores one settings dict per guild, keyed by the guild ID
+    as a string. Subclasses must implement get, set, delete and all; the
+    other methods have generic implementations that backends can override
+    with something cheaper or atomic.
+    """
+
+    name = 'base'
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        """Get settings for a guild (empty dict if unknown)"""
+        raise NotImplementedError
+
+    def set(self, guild_id: str, settings: Dict[str, Any]) -> None:
+        """Replace all settings for a guild"""
+        raise NotImplementedError
+
+    def delete(self, guild_id: str) -> None:
+        """Remove a guild's settings"""
+        raise NotImplementedError
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        """Get settings for every guild"""
+        raise NotImplementedError
+
+    def update(self, guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge top-level keys into a guild's settings and return the result"""
+        settings = self.get(guild_id)
+        settings.update(changes)
+        self.set(guild_id, settings)
+        return settings
+
+    def increment(self, guild_id: str, deltas: Dict[str, int]) -> Dict[str, Any]:
+        """Add integer deltas to counter fields and return the result"""
+        settings = self.get(guild_id)
+        for key, delta in deltas.items():
+            settings[key] = settings.get(key, 0) + delta
+        self.set(guild_id, settings)
+        return settings
+
+    def guild_ids(self) -> List[str]:
+        """Get the IDs of every stored guild"""
+        return list(self.all().keys())
+
+    def count(self) -> int:
+        """Get the number of stored guilds"""
+        return len(self.guild_ids())
+
+    def summaries(self) -> Dict[str, Dict[str, Any]]:
+        """Get just the SUMMARY_FIELDS of every guild's settings"""
+        return {
+            guild_id: {key: settings[key] for key in SUMMARY_FIELDS if key in settings}
+            for guild_id, settings in self.all().items()
+        }
+
+    def version(self) -> Any:
+        """Get a cheap token that changes whenever any guild's settings change.
+
+        Tokens are only comparable with other tokens from the same backend
+        instance.
+        """
+        raise NotImplementedError
+
+    def changed_since(self, version: Any) -> Optional[List[str]]:
+        """Get the guilds changed after ``version``, or None if that isn't known"""
+        return None
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+        pass
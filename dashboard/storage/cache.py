@@ -0,0 +1,129 @@
+import os
+import copy
+import threading
+import logging
+from typing import Dict, Any, Optional
+
+from .base import SettingsStorage
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindCache:
+    """In-memory guild settings with background flushing.
+
+    Mutations are applied to the cached copy straight away and remembered as
+    pending field changes. A background thread writes
+    the pending changes for every dirty guild to the storage backend every
+    ``flush_interval`` seconds, or sooner once ``max_dirty`` guilds are
+    waiting. Only the changed fields are written, merged into whatever the
+    backend currently holds, so the dashboard's own writes to other fields
+    aren't overwritten by stale cached values. Counters such as
+    ``command_count`` don't go through here; see ``dashboard.counters``.
+    """
+
+    def __init__(self, storage: SettingsStorage, flush_interval: Optional[float] = None,
+                 max_dirty: Optional[int] = None):
+        self.storage = storage
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.getenv('SETTINGS_FLUSH_INTERVAL', '5'))
+        self.max_dirty = max_dirty if max_dirty is not None else \
+            int(os.getenv('SETTINGS_FLUSH_THRESHOLD', '100'))
+
+        self._entries = {}     # guild_id -> cached settings
+        self._changes = {}     # guild_id -> {field: new value}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _entry(self, guild_id: str) -> Dict[str, Any]:
+        entry = self._entries.get(guild_id)
+        if entry is None:
+            entry = self.storage.get(guild_id)
+            self._entries[guild_id] = entry
+        return entry
+
+    def _mark_dirty(self) -> None:
+        if len(self._changes) >= self.max_dirty:
+            self._wake.set()
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        """Get a copy of a guild's settings, loading it on first access"""
+        guild_id = str(guild_id)
+        with self._lock:
+            return copy.deepcopy(self._entry(guild_id))
+
+    def update(self, guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply field changes in memory and queue them for the next flush"""
+        guild_id = str(guild_id)
+        with self._lock:
+            entry = self._entry(guild_id)
+            entry.update(copy.deepcopy(changes))
+            self._changes.setdefault(guild_id, {}).update(copy.deepcopy(changes))
+            self._mark_dirty()
+            return copy.deepcopy(entry)
+
+    def invalidate(self, guild_id: Optional[str] = None) -> None:
+        """Drop cached settings so the next read comes from storage.
+
+        Guilds with unflushed changes keep their cached copy until the
+        changes have been written.
+        """
+        with self._lock:
+            if guild_id is None:
+                self._entries = {g: e for g, e in self._entries.items() if g in self._changes}
+            elif str(guild_id) not in self._changes:
+                self._entries.pop(str(guild_id), None)
+
+    @property
+    def dirty_count(self) -> int:
+        """Number of guilds with changes that haven't been written yet"""
+        with self._lock:
+            return len(self._changes)
+
+    def flush(self) -> int:
+        """Write every pending change to storage and return the number of guilds written"""
+        with self._flush_lock:
+            with self._lock:
+                changes, self._changes = self._changes, {}
+
+            written = 0
+            for guild_id, guild_changes in changes.items():
+                try:
+                    self.storage.update(guild_id, guild_changes)
+                    written += 1
+                except Exception as e:
+                    logger.error("Error flushing settings for guild %s: %s", guild_id, e)
+                    self._requeue(guild_id, guild_changes)
+            return written
+
+    def _requeue(self, guild_id: str, changes: Dict[str, Any]) -> None:
+        # Newer changes made while we were flushing win over the failed ones
+        with self._lock:
+            pending = self._changes.setdefault(guild_id, {})
+            for key, value in changes.items():
+                pending.setdefault(key, value)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self) -> None:
+        """Start the background flush thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='settings-flush', daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """Stop the flush thread and write anything still pending"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
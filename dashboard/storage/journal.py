@@ -0,0 +1,297 @@
+import os
+import copy
+import uuid
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are serialized
+    fcntl = None
+
+from .base import SettingsStorage
+from .json_file import load_json_settings
+from .. import serialization
+
+
+class JournalStorage(SettingsStorage):
+    """Guild settings kept as a snapshot plus an append-only change journal.
+
+    Every write appends one small JSON line describing the change (the
+    changed fields, counter deltas, a full replacement or a delete), so the
+    cost of a write depends on the size of the change rather than on the
+    number of guilds. Readers keep the replayed state in memory and only
+    read the journal tail that other processes appended since their last
+    look, which costs a single ``stat`` when nothing changed.
+
+    Once the journal grows past ``compact_bytes`` a background thread folds
+    it into a new snapshot and starts a fresh journal. The snapshot records
+    which journal it already covers, so a crash at any point during
+    compaction never loses or double-applies a change. Appends and
+    compaction are serialized across processes with an ``flock`` on a
+    sidecar lock file.
+    """
+
+    name = 'journal'
+
+    def __init__(self, snapshot_path: str, journal_path: Optional[str] = None,
+                 compact_bytes: Optional[int] = None, fsync: Optional[bool] = None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or f'{os.path.splitext(snapshot_path)[0]}.journal'
+        self.lock_path = f'{self.journal_path}.lock'
+        self.compact_bytes = compact_bytes if compact_bytes is not None else \
+            int(os.getenv('JOURNAL_COMPACT_BYTES', str(1024 * 1024)))
+        self.fsync = fsync if fsync is not None else os.getenv('JOURNAL_FSYNC', '0') == '1'
+
+        self._state = {}
+        self._journal_id = None
+        self._journal_inode = None
+        self._offset = 0
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        # Process-local change sequence used for version()/changed_since()
+        self._seq = 0
+        self._reset_seq = 0
+        self._changed = {}
+        self._compact_wanted = threading.Event()
+        self._compactor = None
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+        with self._file_lock():
+            if not os.path.exists(self.journal_path):
+                self._create_journal(self.journal_path)
+            self._reload()
+
+    # -- files --------------------------------------------------------------
+
+    @contextmanager
+    def _file_lock(self):
+        # Re-entrant: the flock is only taken by the outermost holder
+        with self._lock:
+            if fcntl is None or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, 'a')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _create_journal(self, path: str) -> str:
+        journal_id = uuid.uuid4().hex
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(serialization.dumpb({'op': 'journal', 'id': journal_id}) + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return journal_id
+
+    def _read_snapshot(self) -> Dict[str, Any]:
+        if not os.path.exists(self.snapshot_path):
+            return {'journal': None, 'guilds': {}}
+        with open(self.snapshot_path, 'rb') as f:
+            return serialization.load(f)
+
+    def _reload(self) -> None:
+        """Rebuild the in-memory state from the snapshot and the whole journal"""
+        snapshot = self._read_snapshot()
+        self._state = snapshot.get('guilds', {})
+        # Everything may have changed, so watchers have to reload from scratch
+        self._seq += 1
+        self._reset_seq = self._seq
+        self._changed = {}
+        covered = snapshot.get('journal') or {}
+
+        with open(self.journal_path, 'rb') as f:
+            self._journal_inode = os.fstat(f.fileno()).st_ino
+            header = f.readline()
+            self._journal_id = serialization.loads(header)['id']
+            self._offset = len(header)
+
+            # The snapshot may already include part (or all) of this journal
+            if covered.get('id') == self._journal_id:
+                self._offset = covered['offset']
+                f.seek(self._offset)
+            self._replay(f)
+
+    def _replay(self, f) -> None:
+        data = f.read()
+        end = data.rfind(b'\n') + 1  # ignore a record that is still being written
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(serialization.loads(line))
+        self._offset += end
+
+    def _catch_up(self) -> None:
+        """Apply records appended by other processes since our last read"""
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._journal_inode or stat.st_size < self._offset:
+            # Another process compacted the journal into a new snapshot. Hold
+            # the lock so we don't pair an old snapshot with the new journal.
+            with self._file_lock():
+                self._reload()
+        elif stat.st_size > self._offset:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._offset)
+                self._replay(f)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record['op']
+        guild_id = record.get('guild')
+        self._seq += 1
+        self._changed[guild_id] = self._seq
+        if op == 'set':
+            self._state[guild_id] = record['settings']
+        elif op == 'update':
+            self._state.setdefault(guild_id, {}).update(record['fields'])
+        elif op == 'incr':
+            settings = self._state.setdefault(guild_id, {})
+            for key, delta in record['deltas'].items():
+                settings[key] = settings.get(key, 0) + delta
+        elif op == 'delete':
+            self._state.pop(guild_id, None)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = serialization.dumpb(record) + b'\n'
+        with self._file_lock():
+            self._catch_up()
+            with open(self.journal_path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._offset += len(line)
+            self._apply(record)
+
+        if self._offset > self.compact_bytes:
+            self._request_compaction()
+
+    # -- compaction ---------------------------------------------------------
+
+    def _request_compaction(self) -> None:
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self._compact_loop, name='journal-compactor',
+                                               daemon=True)
+            self._compactor.start()
+        self._compact_wanted.set()
+
+    def _compact_loop(self) -> None:
+        while not self._closed:
+            self._compact_wanted.wait()
+            self._compact_wanted.clear()
+            if self._closed:
+                break
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Error compacting settings journal")
+
+    def compact(self) -> None:
+        """Fold the journal into a new snapshot and start an empty journal"""
+        with self._file_lock():
+            self._catch_up()
+
+            # 1. The snapshot says it covers the current journal up to its end
+            snapshot = {
+                'journal': {'id': self._journal_id, 'offset': self._offset},
+                'guilds': self._state,
+            }
+            tmp_path = f'{self.snapshot_path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                serialization.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            # 2. Swap in a fresh journal; its new ID tells readers to replay all of it
+            self._create_journal(self.journal_path)
+            self._reload()
+
+    # -- SettingsStorage ----------------------------------------------------
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._catch_up()
+            return copy.deepcopy(self._state.get(str(guild_id), {}))
+
+    def set(self, guild_id: str, settings: Dict[str, Any]) -> None:
+        self._append({'op': 'set', 'guild': str(guild_id), 'settings': settings})
+
+    def update(self, guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        self._append({'op': 'update', 'guild': str(guild_id), 'fields': changes})
+        return self.get(guild_id)
+
+    def increment(self, guild_id: str, deltas: Dict[str, int]) -> Dict[str, Any]:
+        self._append({'op': 'incr', 'guild': str(guild_id), 'deltas': deltas})
+        return self.get(guild_id)
+
+    def delete(self, guild_id: str) -> None:
+        self._append({'op': 'delete', 'guild': str(guild_id)})
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._catch_up()
+            return copy.deepcopy(self._state)
+
+    def guild_ids(self):
+        with self._lock:
+            self._catch_up()
+            return list(self._state.keys())
+
+    def version(self) -> int:
+        with self._lock:
+            self._catch_up()
+            return self._seq
+
+    def changed_since(self, version: Any) -> Optional[List[str]]:
+        with self._lock:
+            self._catch_up()
+            if not isinstance(version, int) or version < self._reset_seq:
+                return None
+            return [g for g, seq in self._changed.items() if seq > version]
+
+    def migrate_from_json(self, settings_path: str, prefixes_path: Optional[str] = None) -> int:
+        """Seed the first snapshot from the legacy settings.json (and prefixes.json)"""
+        with self._file_lock():
+            if os.path.exists(self.snapshot_path):
+                return 0
+
+            all_settings = load_json_settings(settings_path)
+            if prefixes_path:
+                for guild_id, prefix in load_json_settings(prefixes_path).items():
+                    all_settings.setdefault(guild_id, {}).setdefault('prefix', prefix)
+
+            # Covering no journal means anything already journaled replays on top
+            snapshot = {'journal': None, 'guilds': all_settings}
+            tmp_path = f'{self.snapshot_path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                serialization.dump(snapshot, f)
+            os.replace(tmp_path, self.snapshot_path)
+            self._reload()
+            return len(all_settings)
+
+    def close(self) -> None:
+        self._closed = True
+        self._compact_wanted.set()
+        with self._lock:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
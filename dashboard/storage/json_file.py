@@ -0,0 +1,119 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are serialized
+    fcntl = None
+
+from .base import SettingsStorage
+from .. import serialization
+
+
+def load_json_settings(path: str) -> Dict[str, Dict[str, Any]]:
+    """Load a whole settings.json file, treating a missing or empty file as no settings"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {}
+    with open(path, 'rb') as f:
+        return serialization.load(f)
+
+
+class JSONFileStorage(SettingsStorage):
+    """The original single settings.json layout.
+
+    Every read parses the whole file and every write rewrites it, so this is
+    only kept for small installs and as the migration source for the other
+    backends. Writes go through a temporary file of their own so a crash
+    can't leave a half-written settings.json behind, and each
+    read-modify-write holds an ``flock`` on ``settings.json.lock`` so the
+    bot and dashboard processes can't lose each other's updates.
+    """
+
+    name = 'json'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self._lock = threading.Lock()
+        self._lock_file = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        return load_json_settings(self.path)
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize a read-modify-write across threads and processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._lock_file = open(self.lock_path, 'a')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _replace_file(self, write) -> None:
+        """Write the whole file through a temporary file (caller holds _write_lock)"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Per process, so another process's write can't replace or remove ours
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, self.path)
+
+    def _save(self, all_settings: Dict[str, Dict[str, Any]]) -> None:
+        self._replace_file(lambda f: serialization.dump(all_settings, f))
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        return self._load().get(str(guild_id), {})
+
+    def set(self, guild_id: str, settings: Dict[str, Any]) -> None:
+        with self._write_lock():
+            all_settings = self._load()
+            all_settings[str(guild_id)] = settings
+            self._save(all_settings)
+
+    def update(self, guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        with self._write_lock():
+            all_settings = self._load()
+            settings = all_settings.setdefault(str(guild_id), {})
+            settings.update(changes)
+            self._save(all_settings)
+            return settings
+
+    def increment(self, guild_id: str, deltas: Dict[str, int]) -> Dict[str, Any]:
+        with self._write_lock():
+            all_settings = self._load()
+            settings = all_settings.setdefault(str(guild_id), {})
+            for key, delta in deltas.items():
+                settings[key] = settings.get(key, 0) + delta
+            self._save(all_settings)
+            return settings
+
+    def delete(self, guild_id: str) -> None:
+        with self._write_lock():
+            all_settings = self._load()
+            if all_settings.pop(str(guild_id), None) is not None:
+                self._save(all_settings)
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return self._load()
+
+    def version(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
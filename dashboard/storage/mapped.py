@@ -0,0 +1,200 @@
+import os
+import re
+import mmap
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from .json_file import JSONFileStorage
+from .. import serialization
+
+logger = logging.getLogger(__name__)
+
+# Strings (with escapes) and the structural characters of a JSON document
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\],:]', re.DOTALL)
+
+ByteRange = Tuple[int, int]
+
+
+def scan_index(data) -> Dict[str, ByteRange]:
+    """Find the byte range of every top-level value in a JSON object.
+
+    Only strings and structural characters are looked at, nothing is
+    decoded except the top-level keys.
+    """
+    index = {}
+    depth = 0
+    key = None
+    expect_key = False
+    start = 0
+    for match in _TOKEN.finditer(data):
+        token = match.group()
+        first = token[:1]
+        if first == b'"':
+            if depth == 1 and expect_key:
+                key = serialization.loads(token)
+                expect_key = False
+        elif first in b'{[':
+            depth += 1
+            if depth == 1:
+                expect_key = True
+        elif first in b'}]':
+            if depth == 1 and key is not None:
+                index[key] = (start, match.start())
+                key = None
+            depth -= 1
+        elif depth == 1:
+            if first == b':':
+                start = match.end()
+            else:  # ','
+                if key is not None:
+                    index[key] = (start, match.start())
+                key = None
+                expect_key = True
+    return index
+
+
+class MappedJSONFileStorage(JSONFileStorage):
+    """settings.json read through a memory map and a per-guild byte index.
+
+    The file format is unchanged, but reading one guild only decodes that
+    guild's bytes, found through an index of guild ID to byte range. The
+    index is saved next to the file (``settings.json.idx``) together with
+    the identity of the file it describes, so other processes can reuse
+    it; when it doesn't match (the file was edited by hand or by an older
+    version) the file is rescanned once without decoding it.
+
+    Writes reuse the raw bytes of every other guild, so changing one guild
+    only encodes that guild and the new index is the old one with the
+    following offsets shifted. Like the plain JSON backend, writes use a
+    per-process temporary file and hold the ``settings.json.lock`` flock.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.index_path = f'{path}.idx'
+        self._map = None
+        self._identity = None
+        self._index = {}
+        self._read_lock = threading.RLock()
+
+    @staticmethod
+    def _file_identity(stat: os.stat_result) -> List[int]:
+        return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+    def _load_sidecar(self, identity: List[int]) -> Optional[Dict[str, ByteRange]]:
+        try:
+            with open(self.index_path, 'rb') as f:
+                sidecar = serialization.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if sidecar.get('file') != identity:
+            return None
+        return {guild_id: tuple(span) for guild_id, span in sidecar['guilds'].items()}
+
+    def _refresh(self) -> None:
+        """Map the current file and its index if it changed (caller holds _read_lock)"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None and self._file_identity(stat) == self._identity:
+            return
+
+        if self._map is not None:
+            self._map.close()
+        self._map, self._identity, self._index = None, None, {}
+        if stat is None or stat.st_size == 0:
+            return
+
+        with open(self.path, 'rb') as f:
+            # Identify the file we actually mapped, not the one we stat'ed
+            identity = self._file_identity(os.fstat(f.fileno()))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = self._load_sidecar(identity)
+        if index is None:
+            index = scan_index(self._map)
+            self._write_sidecar(identity, index)
+        self._identity, self._index = identity, index
+
+    def _write_sidecar(self, identity: List[int], index: Dict[str, ByteRange]) -> None:
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                serialization.dump({'file': identity, 'guilds': index}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.error("Error writing settings index: %s", e)
+
+    def _raw(self, guild_id: str) -> Optional[bytes]:
+        span = self._index.get(guild_id)
+        if span is None:
+            return None
+        return self._map[span[0]:span[1]].strip()
+
+    def _write_guilds(self, changed: Dict[str, Optional[bytes]]) -> None:
+        """Rewrite the file with new encoded values for some guilds (None deletes)"""
+        with self._read_lock:
+            self._refresh()
+            chunks = [(guild_id, self._raw(guild_id)) for guild_id in self._index if guild_id not in changed]
+            chunks.extend((guild_id, value) for guild_id, value in changed.items() if value is not None)
+
+            index = {}
+            parts = [b'{']
+            offset = 1
+            for i, (guild_id, value) in enumerate(chunks):
+                key = (b',' if i else b'') + serialization.dumpb(guild_id) + b':'
+                offset += len(key)
+                index[guild_id] = (offset, offset + len(value))
+                offset += len(value)
+                parts.append(key)
+                parts.append(value)
+            parts.append(b'}')
+
+            self._replace_file(lambda f: f.write(b''.join(parts)))
+            self._write_sidecar(self._file_identity(os.stat(self.path)), index)
+
+    def _get(self, guild_id: str) -> Optional[Dict[str, Any]]:
+        with self._read_lock:
+            self._refresh()
+            raw = self._raw(guild_id)
+            return serialization.loads(raw) if raw is not None else None
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        return self._get(str(guild_id)) or {}
+
+    def set(self, guild_id: str, settings: Dict[str, Any]) -> None:
+        with self._write_lock():
+            self._write_guilds({str(guild_id): serialization.dumpb(settings)})
+
+    def update(self, guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        with self._write_lock():
+            settings = self.get(guild_id)
+            settings.update(changes)
+            self._write_guilds({str(guild_id): serialization.dumpb(settings)})
+            return settings
+
+    def increment(self, guild_id: str, deltas: Dict[str, int]) -> Dict[str, Any]:
+        with self._write_lock():
+            settings = self.get(guild_id)
+            for key, delta in deltas.items():
+                settings[key] = settings.get(key, 0) + delta
+            self._write_guilds({str(guild_id): serialization.dumpb(settings)})
+            return settings
+
+    def delete(self, guild_id: str) -> None:
+        with self._write_lock():
+            if self._get(str(guild_id)) is not None:
+                self._write_guilds({str(guild_id): None})
+
+    def guild_ids(self) -> List[str]:
+        with self._read_lock:
+            self._refresh()
+            return list(self._index.keys())
+
+    def close(self) -> None:
+        super().close()
+        with self._read_lock:
+            if self._map is not None:
+                self._map.close()
+            self._map, self._identity, self._index = None, None, {}
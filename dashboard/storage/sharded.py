@@ -0,0 +1,300 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are serialized
+    fcntl = None
+
+from .base import SettingsStorage, SUMMARY_FIELDS
+from .json_file import load_json_settings
+from .. import serialization
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedFileStorage(SettingsStorage):
+    """Guild settings stored as one JSON file per guild.
+
+    A write replaces only that guild's file (through a temporary file and
+    ``os.replace``), so its cost doesn't grow with the number of guilds.
+    Read-modify-write operations hold an ``flock`` on one of a fixed set of
+    lock stripes, so concurrent processes can't lose each other's updates.
+
+    Every write also appends the guild's summary fields (name, counters,
+    prefix, ...) to ``manifest.jsonl``. Stats and server listings read the
+    summaries from the manifest instead of opening every guild file, and
+    the manifest doubles as the change feed for ``version()`` and
+    ``changed_since()``. Once the manifest holds several lines per guild it
+    is rewritten with one line each.
+    """
+
+    name = 'sharded'
+
+    def __init__(self, directory: str, lock_stripes: int = 16):
+        self.directory = directory
+        self.guild_dir = os.path.join(directory, 'guilds')
+        self.lock_dir = os.path.join(directory, 'locks')
+        self.manifest_path = os.path.join(directory, 'manifest.jsonl')
+        self.lock_stripes = lock_stripes
+
+        self._stripe_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._stripe_files = [None] * lock_stripes
+        self._manifest_lock = threading.Lock()
+        self._manifest_lock_file = None
+        self._summaries = {}
+        self._manifest_inode = None
+        self._manifest_offset = 0
+        self._manifest_lines = 0
+
+        os.makedirs(self.guild_dir, exist_ok=True)
+        os.makedirs(self.lock_dir, exist_ok=True)
+        if not os.path.exists(self.manifest_path) and self.guild_ids():
+            self.rebuild_manifest()
+
+    # -- files --------------------------------------------------------------
+
+    def _path(self, guild_id: str) -> str:
+        guild_id = str(guild_id)
+        # Guild IDs come from URLs, so never let one escape the directory
+        if not guild_id.isdigit():
+            raise ValueError(f"Invalid guild ID: {guild_id!r}")
+        return os.path.join(self.guild_dir, f'{guild_id}.json')
+
+    @contextmanager
+    def _guild_lock(self, guild_id: str):
+        stripe = int(guild_id) % self.lock_stripes
+        with self._stripe_locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            if self._stripe_files[stripe] is None:
+                self._stripe_files[stripe] = open(os.path.join(self.lock_dir, f'{stripe}.lock'), 'a')
+            fcntl.flock(self._stripe_files[stripe], fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._stripe_files[stripe], fcntl.LOCK_UN)
+
+    @contextmanager
+    def _manifest_file_lock(self, exclusive: bool = False):
+        # Appends share the lock, rewriting the manifest needs it alone
+        with self._manifest_lock:
+            if fcntl is None:
+                yield
+                return
+            if self._manifest_lock_file is None:
+                self._manifest_lock_file = open(os.path.join(self.lock_dir, 'manifest.lock'), 'a')
+            fcntl.flock(self._manifest_lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._manifest_lock_file, fcntl.LOCK_UN)
+
+    def _read(self, guild_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(guild_id), 'rb') as f:
+                return serialization.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, guild_id: str, settings: Dict[str, Any]) -> None:
+        path = self._path(guild_id)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            serialization.dump(settings, f)
+        os.replace(tmp_path, path)
+        self._append_manifest({'guild': guild_id, 'summary': self.summarize(settings)})
+
+    # -- manifest -----------------------------------------------------------
+
+    @staticmethod
+    def summarize(settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Pick the fields kept in the manifest out of a guild's settings"""
+        return {key: settings[key] for key in SUMMARY_FIELDS if key in settings}
+
+    def _apply_manifest(self, data: bytes) -> int:
+        """Apply the complete lines in data and return the bytes consumed"""
+        end = data.rfind(b'\n') + 1  # ignore a line that is still being written
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            record = serialization.loads(line)
+            if record.get('deleted'):
+                self._summaries.pop(record['guild'], None)
+            else:
+                self._summaries[record['guild']] = record['summary']
+            self._manifest_lines += 1
+        return end
+
+    def _catch_up(self) -> None:
+        """Read manifest lines appended since our last look (caller holds _manifest_lock)"""
+        try:
+            f = open(self.manifest_path, 'rb')
+        except FileNotFoundError:
+            self._summaries, self._manifest_inode = {}, None
+            self._manifest_offset = self._manifest_lines = 0
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._manifest_inode or stat.st_size < self._manifest_offset:
+                # Rewritten by another process, start over
+                self._summaries, self._manifest_inode = {}, stat.st_ino
+                self._manifest_offset = self._manifest_lines = 0
+            elif stat.st_size == self._manifest_offset:
+                return
+            f.seek(self._manifest_offset)
+            self._manifest_offset += self._apply_manifest(f.read())
+
+    def _append_manifest(self, record: Dict[str, Any]) -> None:
+        line = serialization.dumpb(record) + b'\n'
+        with self._manifest_file_lock():
+            # O_APPEND keeps lines from different processes whole
+            with open(self.manifest_path, 'ab') as f:
+                f.write(line)
+            self._catch_up()
+            compact = self._manifest_lines > max(1000, 4 * len(self._summaries))
+        if compact:
+            self.compact_manifest()
+
+    def compact_manifest(self) -> None:
+        """Rewrite the manifest with one line per guild"""
+        with self._manifest_file_lock(exclusive=True):
+            self._catch_up()
+            self._write_manifest(self._summaries)
+
+    def rebuild_manifest(self) -> None:
+        """Recreate the manifest by reading every guild file"""
+        with self._manifest_file_lock(exclusive=True):
+            self._write_manifest(self._scan_summaries())
+
+    def _scan_summaries(self) -> Dict[str, Dict[str, Any]]:
+        summaries = {}
+        for guild_id in self.guild_ids():
+            settings = self._read(guild_id)
+            if settings is not None:
+                summaries[guild_id] = self.summarize(settings)
+        return summaries
+
+    def _write_manifest(self, summaries: Dict[str, Dict[str, Any]]) -> None:
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            for guild_id, summary in summaries.items():
+                f.write(serialization.dumpb({'guild': guild_id, 'summary': summary}) + b'\n')
+        os.replace(tmp_path, self.manifest_path)
+        self._catch_up()
+
+    # -- SettingsStorage ----------------------------------------------------
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        return self._read(str(guild_id)) or {}
+
+    def set(self, guild_id: str, settings: Dict[str, Any]) -> None:
+        guild_id = str(guild_id)
+        with self._guild_lock(guild_id):
+            self._write(guild_id, settings)
+
+    def update(self, guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        guild_id = str(guild_id)
+        with self._guild_lock(guild_id):
+            settings = self._read(guild_id) or {}
+            settings.update(changes)
+            self._write(guild_id, settings)
+            return settings
+
+    def increment(self, guild_id: str, deltas: Dict[str, int]) -> Dict[str, Any]:
+        guild_id = str(guild_id)
+        with self._guild_lock(guild_id):
+            settings = self._read(guild_id) or {}
+            for key, delta in deltas.items():
+                settings[key] = settings.get(key, 0) + delta
+            self._write(guild_id, settings)
+            return settings
+
+    def delete(self, guild_id: str) -> None:
+        guild_id = str(guild_id)
+        with self._guild_lock(guild_id):
+            try:
+                os.remove(self._path(guild_id))
+            except FileNotFoundError:
+                return
+            self._append_manifest({'guild': guild_id, 'deleted': True})
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        all_settings = {}
+        for guild_id in self.guild_ids():
+            settings = self._read(guild_id)
+            if settings is not None:
+                all_settings[guild_id] = settings
+        return all_settings
+
+    def guild_ids(self) -> List[str]:
+        return [name[:-5] for name in os.listdir(self.guild_dir) if name.endswith('.json')]
+
+    def summaries(self) -> Dict[str, Dict[str, Any]]:
+        with self._manifest_lock:
+            self._catch_up()
+            return {guild_id: dict(summary) for guild_id, summary in self._summaries.items()}
+
+    def count(self) -> int:
+        with self._manifest_lock:
+            self._catch_up()
+            return len(self._summaries)
+
+    def version(self):
+        with self._manifest_lock:
+            self._catch_up()
+            return (self._manifest_inode, self._manifest_offset)
+
+    def changed_since(self, version: Any) -> Optional[List[str]]:
+        if not isinstance(version, tuple) or version[0] is None:
+            return None
+        inode, offset = version
+        try:
+            with open(self.manifest_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != inode:
+                    return None  # the manifest was rewritten
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        data = data[:data.rfind(b'\n') + 1]
+        return list(dict.fromkeys(serialization.loads(line)['guild'] for line in data.splitlines() if line.strip()))
+
+    def migrate_from_json(self, settings_path: str, prefixes_path: Optional[str] = None) -> int:
+        """Split the legacy settings.json (and prefixes.json) into guild files, once"""
+        with self._manifest_file_lock(exclusive=True):
+            if os.path.exists(self.manifest_path):
+                return 0
+
+            all_settings = load_json_settings(settings_path)
+            if prefixes_path:
+                for guild_id, prefix in load_json_settings(prefixes_path).items():
+                    all_settings.setdefault(guild_id, {}).setdefault('prefix', prefix)
+
+            imported = 0
+            for guild_id, settings in all_settings.items():
+                if not str(guild_id).isdigit():
+                    logger.warning("Skipping settings with invalid guild ID %r", guild_id)
+                    continue
+                path = self._path(guild_id)
+                if not os.path.exists(path):
+                    with open(f'{path}.tmp', 'wb') as f:
+                        serialization.dump(settings, f)
+                    os.replace(f'{path}.tmp', path)
+                imported += 1
+
+            self._write_manifest(self._scan_summaries())
+            return imported
+
+    def close(self) -> None:
+        for i, f in enumerate(self._stripe_files):
+            if f is not None:
+                f.close()
+                self._stripe_files[i] = None
+        if self._manifest_lock_file is not None:
+            self._manifest_lock_file.close()
+            self._manifest_lock_file = None
@@ -0,0 +1,196 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from .base import SettingsStorage
+from .json_file import load_json_settings
+from .. import serialization
+
+
+class SQLiteStorage(SettingsStorage):
+    """Guild settings stored as one row per guild in an SQLite database.
+
+    The database runs in WAL mode so the bot and any number of dashboard
+    workers can read while one of them writes. Each thread gets its own
+    connection, and read-modify-write operations run inside a single
+    ``BEGIN IMMEDIATE`` transaction so concurrent updates can't lose data.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS guild_settings ('
+            'guild_id TEXT PRIMARY KEY, '
+            'data TEXT NOT NULL, '
+            'updated_at REAL NOT NULL, '
+            'rev INTEGER NOT NULL DEFAULT 0)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta ('
+            'key TEXT PRIMARY KEY, '
+            'value TEXT NOT NULL)'
+        )
+
+        # Databases created before change tracking have no rev column
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(guild_settings)')]
+        if 'rev' not in columns:
+            try:
+                conn.execute('ALTER TABLE guild_settings ADD COLUMN rev INTEGER NOT NULL DEFAULT 0')
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+        conn.execute('CREATE INDEX IF NOT EXISTS guild_settings_rev ON guild_settings (rev)')
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None leaves transaction control to us
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, guild_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            'SELECT data FROM guild_settings WHERE guild_id = ?', (guild_id,)
+        ).fetchone()
+        return serialization.loads(row[0]) if row else None
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection) -> int:
+        """Increment the database-wide change counter inside the current transaction"""
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    @classmethod
+    def _write(cls, conn: sqlite3.Connection, guild_id: str, settings: Dict[str, Any]) -> None:
+        conn.execute(
+            'INSERT INTO guild_settings (guild_id, data, updated_at, rev) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(guild_id) DO UPDATE SET data = excluded.data, '
+            'updated_at = excluded.updated_at, rev = excluded.rev',
+            (guild_id, serialization.dumps(settings), time.time(), cls._bump_version(conn))
+        )
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        return self._read(self._connection(), str(guild_id)) or {}
+
+    def set(self, guild_id: str, settings: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            self._write(conn, str(guild_id), settings)
+
+    def update(self, guild_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        with self._transaction() as conn:
+            settings = self._read(conn, str(guild_id)) or {}
+            settings.update(changes)
+            self._write(conn, str(guild_id), settings)
+            return settings
+
+    def increment(self, guild_id: str, deltas: Dict[str, int]) -> Dict[str, Any]:
+        with self._transaction() as conn:
+            settings = self._read(conn, str(guild_id)) or {}
+            for key, delta in deltas.items():
+                settings[key] = settings.get(key, 0) + delta
+            self._write(conn, str(guild_id), settings)
+            return settings
+
+    def delete(self, guild_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM guild_settings WHERE guild_id = ?', (str(guild_id),))
+            # Deleted rows can't be found by rev, so readers fall back to a full reload
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('deleted_rev', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (str(self._bump_version(conn)),)
+            )
+
+    def version(self) -> int:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def changed_since(self, version: Any) -> Optional[List[str]]:
+        conn = self._connection()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'deleted_rev'").fetchone()
+        if not isinstance(version, int) or (row and int(row[0]) > version):
+            return None
+        rows = conn.execute('SELECT guild_id FROM guild_settings WHERE rev > ?', (version,))
+        return [r[0] for r in rows]
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._connection().execute('SELECT guild_id, data FROM guild_settings')
+        return {guild_id: serialization.loads(data) for guild_id, data in rows}
+
+    def guild_ids(self) -> List[str]:
+        rows = self._connection().execute('SELECT guild_id FROM guild_settings')
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM guild_settings').fetchone()[0]
+
+    def migrate_from_json(self, settings_path: str, prefixes_path: Optional[str] = None) -> int:
+        """Import the legacy settings.json (and prefixes.json) once.
+
+        The import is recorded in the meta table, so it only ever runs on the
+        first start against a fresh database, even if several processes open
+        the database at the same time. Returns the number of guilds imported.
+        """
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+
+            all_settings = load_json_settings(settings_path)
+
+            # Guilds that only ever had a prefix set through the old ?setprefix
+            if prefixes_path:
+                for guild_id, prefix in load_json_settings(prefixes_path).items():
+                    all_settings.setdefault(guild_id, {}).setdefault('prefix', prefix)
+
+            for guild_id, settings in all_settings.items():
+                if self._read(conn, guild_id) is None:
+                    self._write(conn, guild_id, settings)
+
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (str(time.time()),)
+            )
+            return len(all_settings)
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
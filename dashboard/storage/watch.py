@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+import logging
+from typing import Callable, List, Optional, Any
+
+from .base import SettingsStorage
+
+logger = logging.getLogger(__name__)
+
+# Called with the changed guild IDs, or None when every guild may have changed
+ChangeCallback = Callable[[Optional[List[str]]], None]
+
+
+class SettingsWatcher:
+    """Notices settings changes made by other processes.
+
+    Each check costs one ``storage.version()`` call (a stat for the file
+    backends, one indexed row for SQLite), and checks are rate limited to
+    one per ``interval`` seconds, so caches can revalidate on every access
+    or from a background thread without ever re-reading settings that
+    haven't changed. When the version moves, subscribers are told which
+    guilds changed so they can drop just those cache entries.
+    """
+
+    def __init__(self, storage: SettingsStorage, interval: Optional[float] = None):
+        self.storage = storage
+        self.interval = interval if interval is not None else \
+            float(os.getenv('SETTINGS_POLL_INTERVAL', '1'))
+        self._callbacks = []
+        self._version = self._current_version()
+        self._last_check = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _current_version(self) -> Any:
+        try:
+            return self.storage.version()
+        except Exception as e:
+            logger.error("Error reading settings version: %s", e)
+            return None
+
+    def subscribe(self, callback: ChangeCallback) -> None:
+        """Register a callback for settings changes"""
+        self._callbacks.append(callback)
+
+    def check(self, force: bool = False) -> bool:
+        """Look for changes (at most once per interval) and notify subscribers.
+
+        Returns True if a change was seen.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < self.interval:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False  # another thread is already checking
+        try:
+            self._last_check = now
+            version = self._current_version()
+            if version is None or version == self._version:
+                return False
+
+            try:
+                changed = self.storage.changed_since(self._version)
+            except Exception as e:
+                logger.error("Error reading changed guilds: %s", e)
+                changed = None
+            self._version = version
+        finally:
+            self._lock.release()
+
+        for callback in self._callbacks:
+            try:
+                callback(changed)
+            except Exception:
+                logger.exception("Error in settings change callback")
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check(force=True)
+
+    def start(self) -> None:
+        """Poll for changes from a background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='settings-watcher', daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -2,58 +2,58 @@ import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
-import json
 from PIL import Image
 import io
 import aiohttp
 import asyncio
 import typing
 from datetime import datetime
-import traceback
+import logging
+from dashboard.storage import get_storage, get_watcher, WriteBehindCache
+from dashboard.counters import counters
+from dashboard.prefixes import PrefixResolver
+from dashboard.activity import get_activity_store
+from dashboard import serialization
+from dashboard.logs import setup_logging
+from dashboard.guild_state import get_guild_state, SNAPSHOT_FIELDS
+from dashboard.ipc import IPCServer, ipc_available
+import atexit
+import math
 
 # Load environment variables
 load_dotenv()
 
-# Settings file path
-SETTINGS_FILE = os.path.join('dashboard', 'settings.json')
+# discord.py logs through the same background listener as the dashboard
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Bot-side settings changes are applied in memory and flushed in the background
+settings_cache = WriteBehindCache(get_storage())
+atexit.register(settings_cache.close)
+atexit.register(counters.close)
 
 def get_guild_settings(guild_id):
     """Get settings for a guild"""
     try:
-        if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, 'r') as f:
-                all_settings = json.load(f)
-                return all_settings.get(str(guild_id), {})
+        return settings_cache.get(guild_id)
     except Exception as e:
-        print(f"Error loading guild settings: {e}")
+        logger.error("Error loading guild settings: %s", e)
     return {}
 
 def update_guild_settings(guild_id, settings):
     """Update settings for a guild"""
     try:
-        if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, 'r') as f:
-                all_settings = json.load(f)
-        else:
-            all_settings = {}
-        
-        all_settings[str(guild_id)] = settings
-        
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(all_settings, f, indent=4)
+        return settings_cache.update(guild_id, settings)
     except Exception as e:
-        print(f"Error updating guild settings: {e}")
+        logger.error("Error updating guild settings: %s", e)
 
 def increment_command_count(guild_id):
     """Increment the command count for a guild"""
-    try:
-        settings = get_guild_settings(guild_id)
-        if 'command_count' not in settings:
-            settings['command_count'] = 0
-        settings['command_count'] += 1
-        update_guild_settings(guild_id, settings)
-    except Exception as e:
-        print(f"Error incrementing command count: {e}")
+    counters.increment(guild_id, 'command_count')
+
+def increment_mod_action(guild_id):
+    """Increment the moderation action count for a guild"""
+    counters.increment(guild_id, 'mod_actions')
 
 # Bot configuration
 intents = discord.Intents.default()
@@ -63,24 +63,37 @@ intents.members = True
 # Define embed color
 EMBED_COLOR = discord.Color.from_rgb(187, 144, 252)  # Soft purple color
 
-# Settings management
-settings_cache = {}
-
-# Activity tracking
-activity_log = {}
+# Activity tracking, shared with the dashboard
+async def log_activity(guild_id, action, data):
+    try:
+        # Queued in memory; the store's writer thread inserts entries in batches
+        get_activity_store().queue(guild_id, action, data)
+    except Exception as e:
+        logger.error("Error logging activity: %s", e)
+
+# Text channels as the dashboard's channel dropdowns use them
+def channel_snapshot(guild):
+    return [
+        {
+            'id': str(channel.id),
+            'name': channel.name,
+            'type': channel.type.value,
+            'position': channel.position,
+            'parent_id': str(channel.category_id) if channel.category_id else None
+        }
+        for channel in guild.text_channels
+        if channel.type == discord.ChannelType.text
+    ]
 
-def log_activity(guild_id, action, data):
-    if guild_id not in activity_log:
-        activity_log[guild_id] = []
-    
-    activity_log[guild_id].append({
-        'timestamp': datetime.utcnow().isoformat(),
-        'action': action,
-        'data': data
-    })
-    
-    # Keep only last 50 activities
-    activity_log[guild_id] = activity_log[guild_id][-50:]
+# What the dashboard shows about a guild, in the settings fields it is persisted to
+def guild_snapshot(guild):
+    return {
+        'name': guild.name,
+        'icon': guild.icon.key if guild.icon else None,
+        'owner_id': str(guild.owner_id),
+        'bot_permissions': str(guild.me.guild_permissions.value),
+        'cached_channels': channel_snapshot(guild)
+    }
 
 # Initialize bot with both prefix and slash commands
 class Bot(commands.Bot):
@@ -94,57 +107,96 @@ class Bot(commands.Bot):
             'image',
             'security'
         ]
-        self.settings_cache = {}
+        self.prefix_resolver = PrefixResolver()
         self.disabled_cogs = {}  # Store disabled cogs per guild
-
-    async def get_prefix(self, message):
-        """Get prefix for a guild"""
-        if not message.guild:
-            return '?'
+        self.guild_snapshots = {}  # Last snapshot persisted per guild
         
-        guild_id = str(message.guild.id)
-        
-        # Try to get prefix from cache first
-        if guild_id in self.settings_cache:
-            prefix = self.settings_cache[guild_id].get('prefix', '?')
-            print(f"Using cached prefix for guild {guild_id}: {prefix}")
-            return prefix
-        
-        # Try to load from dashboard settings
-        try:
-            dashboard_settings_path = os.path.join('dashboard', 'settings.json')
-            if os.path.exists(dashboard_settings_path):
-                with open(dashboard_settings_path, 'r') as f:
-                    all_settings = json.load(f)
-                    if guild_id in all_settings and 'prefix' in all_settings[guild_id]:
-                        prefix = all_settings[guild_id]['prefix']
-                        self.settings_cache[guild_id] = {'prefix': prefix}
-                        print(f"Loaded prefix from dashboard for guild {guild_id}: {prefix}")
-                        return prefix
-        except Exception as e:
-            print(f"Error loading prefix from dashboard: {e}")
-        
-        # Fall back to prefixes.json
+        # Pick up changes the dashboard makes to the shared settings
+        self.settings_watcher = get_watcher()
+        self.settings_watcher.subscribe(self.on_settings_changed)
+
+        # Live state for dashboard workers over a local socket
+        self.ipc = IPCServer({
+            'status': self.ipc_status,
+            'guilds': self.ipc_guilds,
+            'guild': self.ipc_guild,
+            'channels': self.ipc_channels,
+            'settings_changed': self.ipc_settings_changed
+        }) if ipc_available() else None
+
+    def on_settings_changed(self, guild_ids):
+        """Drop cached settings changed by another process (runs on the watcher thread)"""
+        if guild_ids is None:
+            settings_cache.invalidate()
+        else:
+            for guild_id in guild_ids:
+                settings_cache.invalidate(guild_id)
         try:
-            if guild_id not in self.settings_cache:
-                settings = get_guild_settings(guild_id)
-                self.settings_cache[guild_id] = settings
-            
-            prefix = self.settings_cache[guild_id].get('prefix', '?')
-            print(f"Using prefix for guild {guild_id}: {prefix}")
-            return prefix
+            self.prefix_resolver.refresh(get_storage(), guild_ids)
         except Exception as e:
-            print(f"Error loading prefix: {e}")
-            return '?'
+            logger.error("Error refreshing prefixes: %s", e)
+
+    # -- dashboard IPC handlers ---------------------------------------------
+
+    def ipc_status(self):
+        return {
+            'ready': self.is_ready(),
+            'latency_ms': round(self.latency * 1000) if math.isfinite(self.latency) else None,
+            'guilds': len(self.guilds)
+        }
+
+    def ipc_guilds(self):
+        return [
+            {
+                'id': str(guild.id),
+                'name': guild.name,
+                'icon': guild.icon.key if guild.icon else None,
+                'member_count': guild.member_count
+            }
+            for guild in self.guilds
+        ]
+
+    def ipc_guild(self, guild_id):
+        guild = self.get_guild(int(guild_id))
+        if guild is None:
+            return None
+        return {'id': str(guild.id), 'member_count': guild.member_count, **guild_snapshot(guild)}
+
+    def ipc_channels(self, guild_id):
+        guild = self.get_guild(int(guild_id))
+        return channel_snapshot(guild) if guild is not None else None
+
+    async def ipc_settings_changed(self, guild_ids=None, action=None):
+        # Re-read the dashboard's change now rather than at the next poll
+        await asyncio.to_thread(self.settings_watcher.check, True)
+        return True
+
+    async def get_prefix(self, message):
+        """Get prefixes for a message (memory only, runs for every message)"""
+        return self.prefix_resolver.resolve(message)
 
     async def setup_hook(self):
         """Load extensions and set up the bot"""
+        settings_cache.start()
+        counters.start()
+        (await asyncio.to_thread(get_activity_store)).start()
+        self.settings_watcher.start()
+        if self.ipc is not None:
+            try:
+                await self.ipc.start()
+            except Exception as e:
+                logger.error("Error starting dashboard IPC: %s", e)
+                self.ipc = None
+
+        await asyncio.to_thread(load_prefixes, self.prefix_resolver)
+        self.prefix_resolver.set_user(self.user.id)
+
         for ext in self.initial_extensions:
             try:
                 await self.load_extension(ext)
-                print(f"Loaded extension: {ext}")
+                logger.info("Loaded extension: %s", ext)
             except Exception as e:
-                print(f"Failed to load extension {ext}: {e}")
+                logger.error("Failed to load extension %s: %s", ext, e)
 
         # Load all cogs initially
         for filename in os.listdir('.'):
@@ -152,13 +204,25 @@ class Bot(commands.Bot):
                 try:
                     cog_name = filename[:-3]  # Remove .py extension
                     await self.load_extension(cog_name)
-                    print(f'Loaded cog: {cog_name}')
+                    logger.info("Loaded cog: %s", cog_name)
                 except Exception as e:
-                    print(f'Failed to load cog {filename}: {e}')
+                    logger.error("Failed to load cog %s: %s", filename, e)
+
+    async def close(self):
+        """Flush pending settings changes before shutting down"""
+        try:
+            await super().close()
+        finally:
+            if self.ipc is not None:
+                await self.ipc.close()
+            await asyncio.to_thread(self.settings_watcher.close)
+            await asyncio.to_thread(counters.close)
+            await asyncio.to_thread(get_activity_store().stop)
+            await asyncio.to_thread(settings_cache.close)
 
     async def on_ready(self):
         """Called when the bot is ready"""
-        print(f"Logged in as {self.user.name} ({self.user.id})")
+        logger.info("Logged in as %s (%s)", self.user.name, self.user.id)
         await self.change_presence(activity=discord.Game(name="?help or /help"))
 
         # Update disabled cogs for each guild
@@ -174,6 +238,52 @@ class Bot(commands.Bot):
                     if cog_name not in enabled_cogs and cog_name:
                         self.disabled_cogs[guild_id].append(cog_name)
 
+        # Share guild names, permissions and channel lists with the dashboard
+        for guild in self.guilds:
+            await self.publish_guild(guild)
+
+    async def publish_guild(self, guild):
+        """Hand a guild's snapshot to the dashboard and save the fields that changed"""
+        guild_id = str(guild.id)
+        snapshot = guild_snapshot(guild)
+        get_guild_state().publish(guild_id, snapshot)
+        if self.ipc is not None:
+            self.ipc.publish('guild', {'id': guild_id, 'member_count': guild.member_count, **snapshot})
+        if guild_id not in self.guild_snapshots:
+            settings = await asyncio.to_thread(get_guild_settings, guild_id)
+            self.guild_snapshots[guild_id] = {key: settings.get(key) for key in SNAPSHOT_FIELDS}
+        changes = {key: value for key, value in snapshot.items() if self.guild_snapshots[guild_id].get(key) != value}
+        if not changes:
+            return
+        self.guild_snapshots[guild_id] = snapshot
+        await asyncio.to_thread(update_guild_settings, guild_id, changes)
+
+    async def on_guild_join(self, guild):
+        await self.publish_guild(guild)
+
+    async def on_guild_update(self, before, after):
+        await self.publish_guild(after)
+
+    async def on_guild_remove(self, guild):
+        self.guild_snapshots.pop(str(guild.id), None)
+        get_guild_state().remove(guild.id)
+        if self.ipc is not None:
+            self.ipc.publish('guild_remove', {'id': str(guild.id)})
+
+    async def on_guild_channel_create(self, channel):
+        await self.publish_guild(channel.guild)
+
+    async def on_guild_channel_update(self, before, after):
+        await self.publish_guild(after.guild)
+
+    async def on_guild_channel_delete(self, channel):
+        await self.publish_guild(channel.guild)
+
+    async def on_member_update(self, before, after):
+        # The bot's own roles decide whether it shows up as an administrator
+        if after.id == self.user.id and before.roles != after.roles:
+            await self.publish_guild(after.guild)
+
     async def on_command(self, ctx):
         """Called when a command is invoked"""
         try:
@@ -189,13 +299,13 @@ class Bot(commands.Bot):
             increment_command_count(str(ctx.guild.id))
             # Log command usage
             guild_id = str(ctx.guild.id)
-            log_activity(guild_id, 'command_used', {
+            await log_activity(guild_id, 'command_used', {
                 'command': ctx.command.name,
                 'user': str(ctx.author),
                 'channel': str(ctx.channel)
             })
         except Exception as e:
-            print(f"Error in on_command: {e}")
+            logger.error("Error in on_command: %s", e)
 
     async def on_command_error(self, ctx, error):
         """Handle command errors"""
@@ -210,7 +320,7 @@ class Bot(commands.Bot):
                     await ctx.send("⚠️ This module has been disabled by your server owner.")
                     return
         else:
-            print(f"Command error: {error}")
+            logger.error("Command error: %s", error)
             await ctx.send(f"An error occurred: {str(error)}")
 
 # Initialize bot
@@ -220,42 +330,52 @@ bot.remove_command('help')  # Remove default help command
 # Store last deleted message for snipe command
 last_deleted_message = {}
 
+MAX_PREFIXES = 5
+PREFIX_USAGE = f"Prefixes must be 3 characters or less, up to {MAX_PREFIXES} separated by spaces!"
+
 # Load custom prefixes
-def load_prefixes():
-    prefixes = {}
+def load_prefixes(resolver):
+    """Build the prefix index once at startup"""
+    all_settings = {}
     
-    # Try to read from dashboard/settings.json which is the main source now
-    dashboard_settings_path = os.path.join('dashboard', 'settings.json')
+    # Read from the shared settings store which is the main source now
     try:
-        if os.path.exists(dashboard_settings_path):
-            with open(dashboard_settings_path, 'r') as f:
-                all_settings = json.load(f)
-                
-                # Convert dashboard settings to prefix format
-                for guild_id, settings in all_settings.items():
-                    if 'prefix' in settings:
-                        prefixes[guild_id] = settings['prefix']
-                
-                print(f"Loaded {len(prefixes)} prefixes from dashboard settings.json")
-                if prefixes:
-                    return prefixes
+        all_settings = get_storage().all()
     except Exception as e:
-        print(f"Error loading dashboard settings: {e}")
+        logger.error("Error loading dashboard settings: %s", e)
     
-    # Fall back to prefixes.json for backward compatibility
+    # Guilds that only have a prefix in prefixes.json (JSON backend installs);
+    # the resolver keeps these so later reloads from storage don't drop them
+    legacy = {}
     try:
         if os.path.exists('prefixes.json'):
-            with open('prefixes.json', 'r') as f:
-                legacy_prefixes = json.load(f)
-                print(f"Loaded {len(legacy_prefixes)} prefixes from prefixes.json")
-                return legacy_prefixes
+            with open('prefixes.json', 'rb') as f:
+                legacy = serialization.load(f)
     except Exception as e:
-        print(f"Error loading prefixes.json: {e}")
+        logger.error("Error loading prefixes.json: %s", e)
     
-    print("Using default prefixes")
-    return prefixes
+    resolver.load(all_settings, legacy)
+    logger.info("Loaded prefixes for %s guilds", len(resolver))
 
-prefixes = load_prefixes()
+def parse_prefixes(text):
+    """Split a space separated list of prefixes, returning None if any is invalid"""
+    new_prefixes = list(dict.fromkeys(text.split()))
+    if not new_prefixes or len(new_prefixes) > MAX_PREFIXES or any(len(p) > 3 for p in new_prefixes):
+        return None
+    return new_prefixes
+
+async def save_prefixes(guild_id, new_prefixes):
+    """Store a guild's prefixes and switch the bot over to them"""
+    bot.prefix_resolver.set(guild_id, new_prefixes)
+    try:
+        update_guild_settings(guild_id, {'prefix': new_prefixes[0], 'prefixes': new_prefixes})
+        # Write through now so a watcher refresh can't bring back the old prefix
+        await asyncio.to_thread(settings_cache.flush)
+    except Exception as e:
+        logger.error("Error updating dashboard settings: %s", e)
+
+def format_prefixes(prefixes):
+    return ' '.join(f'`{p}`' for p in prefixes)
 
 @bot.event
 async def on_message_delete(message):
@@ -498,52 +618,18 @@ async def snipe(ctx):
 
 @bot.command()
 async def prefix(ctx):
-    prefix = prefixes.get(str(ctx.guild.id), '?')
-    await ctx.send(f'The current prefix is: `{prefix}`')
+    await ctx.send(f'The current prefix is: {format_prefixes(bot.prefix_resolver.prefixes_for(ctx.guild.id))}')
 
 @bot.command()
 @commands.has_permissions(administrator=True)
-async def setprefix(ctx, new_prefix):
-    if len(new_prefix) > 3:
-        await ctx.send("Prefix must be 3 characters or less!")
+async def setprefix(ctx, *, new_prefix):
+    new_prefixes = parse_prefixes(new_prefix)
+    if new_prefixes is None:
+        await ctx.send(PREFIX_USAGE)
         return
     
-    guild_id = str(ctx.guild.id)
-    
-    # Update in prefixes dictionary for immediate use
-    prefixes[guild_id] = new_prefix
-    
-    # Update prefixes.json
-    with open('prefixes.json', 'w') as f:
-        json.dump(prefixes, f, indent=4)
-    
-    # Update dashboard settings.json
-    dashboard_settings_path = os.path.join('dashboard', 'settings.json')
-    try:
-        # Load existing settings
-        if os.path.exists(dashboard_settings_path):
-            with open(dashboard_settings_path, 'r') as f:
-                all_settings = json.load(f)
-        else:
-            all_settings = {}
-        
-        # Update or create settings for this guild
-        if guild_id not in all_settings:
-            all_settings[guild_id] = {}
-        
-        all_settings[guild_id]['prefix'] = new_prefix
-        
-        # Save updated settings
-        with open(dashboard_settings_path, 'w') as f:
-            json.dump(all_settings, f, indent=4)
-        
-        print(f"Updated prefix in dashboard settings for guild {guild_id}")
-    except Exception as e:
-        print(f"Error updating dashboard settings: {e}")
-    
-    # Refresh command prefix
-    bot.command_prefix = new_prefix
-    await ctx.send(f'Prefix changed to: `{new_prefix}`')
+    await save_prefixes(str(ctx.guild.id), new_prefixes)
+    await ctx.send(f'Prefix changed to: {format_prefixes(new_prefixes)}')
 
 @bot.command()
 async def ping(ctx):
@@ -779,52 +865,18 @@ async def slash_snipe(interaction: discord.Interaction):
 
 @bot.tree.command(name="prefix", description="Show the current command prefix")
 async def slash_prefix(interaction: discord.Interaction):
-    prefix = prefixes.get(str(interaction.guild.id), '?')
-    await interaction.response.send_message(f'The current prefix is: `{prefix}`')
+    await interaction.response.send_message(f'The current prefix is: {format_prefixes(bot.prefix_resolver.prefixes_for(interaction.guild.id))}')
 
 @bot.tree.command(name="setprefix", description="Change the command prefix")
 @commands.has_permissions(administrator=True)
 async def slash_setprefix(interaction: discord.Interaction, new_prefix: str):
-    if len(new_prefix) > 3:
-        await interaction.response.send_message("Prefix must be 3 characters or less!", ephemeral=True)
+    new_prefixes = parse_prefixes(new_prefix)
+    if new_prefixes is None:
+        await interaction.response.send_message(PREFIX_USAGE, ephemeral=True)
         return
     
-    guild_id = str(interaction.guild.id)
-    
-    # Update in prefixes dictionary for immediate use
-    prefixes[guild_id] = new_prefix
-    
-    # Update prefixes.json
-    with open('prefixes.json', 'w') as f:
-        json.dump(prefixes, f, indent=4)
-    
-    # Update dashboard settings.json
-    dashboard_settings_path = os.path.join('dashboard', 'settings.json')
-    try:
-        # Load existing settings
-        if os.path.exists(dashboard_settings_path):
-            with open(dashboard_settings_path, 'r') as f:
-                all_settings = json.load(f)
-        else:
-            all_settings = {}
-        
-        # Update or create settings for this guild
-        if guild_id not in all_settings:
-            all_settings[guild_id] = {}
-        
-        all_settings[guild_id]['prefix'] = new_prefix
-        
-        # Save updated settings
-        with open(dashboard_settings_path, 'w') as f:
-            json.dump(all_settings, f, indent=4)
-        
-        print(f"Updated prefix in dashboard settings for guild {guild_id}")
-    except Exception as e:
-        print(f"Error updating dashboard settings: {e}")
-    
-    # Refresh command prefix
-    bot.command_prefix = new_prefix
-    await interaction.response.send_message(f'Prefix changed to: `{new_prefix}`')
+    await save_prefixes(str(interaction.guild.id), new_prefixes)
+    await interaction.response.send_message(f'Prefix changed to: {format_prefixes(new_prefixes)}')
 
 @bot.tree.command(name="ping", description="Check the bot's latency")
 async def slash_ping(interaction: discord.Interaction):
@@ -910,7 +962,6 @@ async def slash_repo(interaction: discord.Interaction):
 # Run the bot
 if __name__ == "__main__":
     try:
-        bot.run(os.getenv('DISCORD_TOKEN'))
-    except Exception as e:
-        print(f"Error starting bot: {e}")
-        print(traceback.format_exc()) 
\ No newline at end of file
+        bot.run(os.getenv('DISCORD_TOKEN'), log_handler=None)
+    except Exception:
+        logger.exception("Error starting bot")
@@ -30,7 +30,7 @@ def run_bot():
             print("Error: DISCORD_TOKEN not found in environment variables")
             return
         print("Starting bot with token...")
-        bot.run(token)
+        bot.run(token, log_handler=None)
     except Exception as e:
         print(f"Error starting bot: {e}")
         print("Bot thread will exit")
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for the bot's prefix resolution.
+
+Builds a PrefixResolver for a large number of guilds and pushes fake
+messages through the same steps discord.py takes for every message:
+look up the prefixes, then check whether the content starts with one.
+
+    python scripts/bench_prefix.py --guilds 10000 --messages 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from types import SimpleNamespace
+
+# Add the repository root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.prefixes import PrefixResolver
+
+BOT_USER_ID = 1234567890
+
+
+def build_resolver(guild_count):
+    settings = {}
+    for i in range(guild_count):
+        guild_id = str(100000000000000000 + i)
+        if i % 10 == 0:
+            settings[guild_id] = {'prefixes': ['!', '!!', 'w.'], 'mention_prefix': i % 20 == 0}
+        elif i % 3 == 0:
+            settings[guild_id] = {'prefix': '$'}
+        else:
+            settings[guild_id] = {}
+    resolver = PrefixResolver()
+    resolver.load(settings)
+    resolver.set_user(BOT_USER_ID)
+    return resolver
+
+
+def build_messages(guild_count, count):
+    contents = ['?ping', '!!help', 'hello there', f'<@{BOT_USER_ID}> snipe', '$ban someone', 'w.repo']
+    guilds = [SimpleNamespace(id=100000000000000000 + i) for i in range(guild_count)]
+    guilds.append(None)  # DMs
+    rng = random.Random(0)
+    return [SimpleNamespace(guild=rng.choice(guilds), content=rng.choice(contents))
+            for _ in range(count)]
+
+
+def run(resolver, messages):
+    matched = 0
+    start = time.perf_counter()
+    for message in messages:
+        if message.content.startswith(resolver.resolve(message)):
+            matched += 1
+    return time.perf_counter() - start, matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    resolver = build_resolver(args.guilds)
+    load_time = time.perf_counter() - start
+    messages = build_messages(args.guilds, args.messages)
+
+    run(resolver, messages[:10000])  # warm up
+    elapsed, matched = run(resolver, messages)
+
+    print(f"Indexed {len(resolver)} guilds in {load_time * 1000:.1f} ms")
+    print(f"Resolved {len(messages)} messages in {elapsed:.3f} s "
+          f"({len(messages) / elapsed:,.0f} messages/sec, {matched} matched a prefix)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark for settings serialization.
+
+Encodes and decodes a settings file for 5,000 guilds with the old
+``json.dump(..., indent=4)`` path and with every encoder in
+dashboard.serialization that is available here.
+
+    python scripts/bench_serialization.py --guilds 5000 --rounds 20
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# Add the repository root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import serialization
+
+
+def build_settings(guild_count):
+    rng = random.Random(0)
+    settings = {}
+    for i in range(guild_count):
+        guild_id = str(100000000000000000 + i)
+        settings[guild_id] = {
+            'name': f'Server {i} ✨',
+            'icon': f'{rng.getrandbits(128):032x}',
+            'owner_id': str(rng.getrandbits(60)),
+            'member_count': rng.randint(2, 50000),
+            'prefix': rng.choice(['?', '!', '$', 'w.']),
+            'cogs': ['image', 'security'],
+            'command_count': rng.randint(0, 100000),
+            'mod_actions': rng.randint(0, 1000),
+            'log_channel': str(rng.getrandbits(60)),
+        }
+    return settings
+
+
+class LegacySerializer:
+    """What the bot and dashboard did before: pretty-printed stdlib json"""
+
+    name = 'json (indent=4)'
+
+    def dumpb(self, obj):
+        return json.dumps(obj, indent=4).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+def best_of(rounds, func):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    settings = build_settings(args.guilds)
+    serializers = [LegacySerializer(), serialization.StdlibSerializer()]
+    if serialization.orjson is not None:
+        serializers.append(serialization.OrjsonSerializer())
+    else:
+        print("orjson is not installed, skipping it")
+
+    print(f"{args.guilds} guilds, best of {args.rounds} rounds "
+          f"(default encoder here: {serialization.serializer.name})")
+    print(f"{'encoder':<18}{'size':>12}{'encode':>12}{'decode':>12}")
+    for serializer in serializers:
+        data = serializer.dumpb(settings)
+        assert serializer.loads(data) == settings
+        encode = best_of(args.rounds, lambda: serializer.dumpb(settings))
+        decode = best_of(args.rounds, lambda: serializer.loads(data))
+        print(f"{serializer.name:<18}{len(data) / 1024:>9.0f} KiB"
+              f"{encode * 1000:>9.2f} ms{decode * 1000:>9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+In-process harness for the bot/dashboard IPC bridge.
+
+Runs an IPCServer with fake bot handlers on an event loop thread and
+drives it with an IPCClient from the main thread: requests, errors,
+notifications, subscribed events, a server restart with automatic
+resubscription, and the round-trip time of a small request.
+
+    python scripts/ipc_harness.py --guilds 1000 --requests 5000
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+# Add the repository root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import ipc
+from dashboard.ipc import IPCServer, IPCClient, IPCError
+
+
+class FakeBot:
+    """The handlers main.Bot registers, answering from made-up guilds"""
+
+    def __init__(self, guild_count):
+        self.guilds = {
+            str(100000000000000000 + i): {
+                'id': str(100000000000000000 + i),
+                'name': f"Guild {i}",
+                'icon': None,
+                'member_count': 10 + i,
+                'cached_channels': [{'id': str(200000000000000000 + i), 'name': 'general'}]
+            }
+            for i in range(guild_count)
+        }
+        self.invalidated = []
+
+    def handlers(self):
+        return {
+            'status': lambda: {'ready': True, 'latency_ms': 42, 'guilds': len(self.guilds)},
+            'guilds': lambda: [{key: guild[key] for key in ('id', 'name', 'icon', 'member_count')}
+                               for guild in self.guilds.values()],
+            'guild': lambda guild_id: self.guilds.get(guild_id),
+            'channels': lambda guild_id: (self.guilds.get(guild_id) or {}).get('cached_channels'),
+            'settings_changed': self.settings_changed
+        }
+
+    async def settings_changed(self, guild_ids=None, action=None):
+        await asyncio.sleep(0)
+        self.invalidated.extend(guild_ids or [])
+        return True
+
+
+class LoopThread:
+    """An event loop on a background thread, standing in for the bot's"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(10)
+
+    def call(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def check(label, ok):
+    print(f"{'ok  ' if ok else 'FAIL'} {label}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    if not ipc.ipc_available('bot.sock'):
+        print("Unix domain sockets are not supported on this platform")
+        return 1
+
+    ipc.IPC_RECONNECT_DELAY = 0.05
+    bot = FakeBot(args.guilds)
+    loop = LoopThread()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bot.sock')
+        server = IPCServer(bot.handlers(), path=path)
+        loop.run(server.start())
+        client = IPCClient(path=path, timeout=5)
+
+        guild_id = next(iter(bot.guilds))
+        results.append(check("status", client.request('status')['guilds'] == args.guilds))
+        results.append(check("guild list", len(client.request('guilds')) == args.guilds))
+        results.append(check("channels", client.request('channels', {'guild_id': guild_id})[0]['name'] == 'general'))
+        results.append(check("unknown guild", client.request('guild', {'guild_id': '1'}) is None))
+        try:
+            client.request('nope')
+            results.append(check("unknown method raises", False))
+        except IPCError:
+            results.append(check("unknown method raises", True))
+
+        client.notify('settings_changed', {'guild_ids': [guild_id]})
+        results.append(check("settings invalidation", wait_for(lambda: bot.invalidated == [guild_id])))
+
+        events = []
+        client.subscribe(['guild'], events.append)
+        client.request('status')  # the subscription is in place once this is answered
+        loop.call(server.publish, 'guild', {'id': guild_id, 'member_count': 11})
+        loop.call(server.publish, 'guild_remove', {'id': guild_id})
+        results.append(check("subscribed events", wait_for(lambda: events == [{'id': guild_id, 'member_count': 11}])))
+
+        # Restart the server: the client reconnects and subscribes again by itself
+        loop.run(server.close())
+        try:
+            client.request('status')
+            results.append(check("requests fail while the bot is down", False))
+        except IPCError:
+            results.append(check("requests fail while the bot is down", True))
+        server = IPCServer(bot.handlers(), path=path)
+        loop.run(server.start())
+
+        def republish():
+            loop.call(server.publish, 'guild', {'id': guild_id, 'member_count': 12})
+            return len(events) == 2
+        results.append(check("resubscribed after restart", wait_for(republish)))
+
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            client.request('guild', {'guild_id': guild_id})
+        elapsed = time.perf_counter() - start
+        print(f"{args.requests} guild requests in {elapsed:.3f} s "
+              f"({elapsed / args.requests * 1e6:.0f} us per round trip)")
+
+        client.close()
+        loop.run(server.close())
+    loop.stop()
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,8 @@
 import discord
 from discord.ext import commands
-import json
 from datetime import datetime, timedelta
 import os
+from dashboard import serialization
 
 class SecurityCog(commands.Cog):
     def __init__(self, bot):
@@ -12,14 +12,14 @@ class SecurityCog(commands.Cog):
         
     def load_log_channels(self):
         try:
-            with open('security_logs.json', 'r') as f:
-                return json.load(f)
+            with open('security_logs.json', 'rb') as f:
+                return serialization.load(f)
         except FileNotFoundError:
             return {}
 
     def save_log_channels(self):
-        with open('security_logs.json', 'w') as f:
-            json.dump(self.log_channels, f)
+        with open('security_logs.json', 'wb') as f:
+            serialization.dump(self.log_channels, f)
 
     @commands.hybrid_command(name="setsecuritylog", description="Set the channel for security alerts")
     @commands.has_permissions(administrator=True)
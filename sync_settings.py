@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 import os
-import json
 import sys
 import time
 import shutil
+from dashboard.storage import get_storage
+from dashboard import serialization
 
 def log(message):
     """Log a message with timestamp"""
@@ -11,16 +12,9 @@ def log(message):
 
 def sync_dashboard_to_bot():
     """Copy settings from dashboard to bot's prefixes.json"""
-    dashboard_settings_path = os.path.join('dashboard', 'settings.json')
-    
-    if not os.path.exists(dashboard_settings_path):
-        log("🔴 Dashboard settings file not found!")
-        return False
-    
     try:
-        # Read dashboard settings
-        with open(dashboard_settings_path, 'r', encoding='utf-8') as f:
-            dashboard_settings = json.load(f)
+        # Only the summary fields (which include the prefix) are needed
+        dashboard_settings = get_storage().summaries()
         
         # Convert to prefix format
         prefixes = {}
@@ -29,8 +23,8 @@ def sync_dashboard_to_bot():
                 prefixes[guild_id] = settings['prefix']
         
         # Write to prefixes.json
-        with open('prefixes.json', 'w', encoding='utf-8') as f:
-            json.dump(prefixes, f, indent=4)
+        with open('prefixes.json', 'wb') as f:
+            serialization.dump(prefixes, f)
         
         log(f"🟢 Successfully synced {len(prefixes)} prefixes from dashboard to bot")
         for guild_id, prefix in prefixes.items():